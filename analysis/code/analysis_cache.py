@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+import chrony_analysis_v3 as chrony_v3
+import ntpsec_analysis_v3 as ntpsec_v3
+import ptp_analysis_v3 as ptp_v3
+
+
+# ----------------------------
+# Campaign layout
+# ----------------------------
+
+SCENARIOS = ["low", "medium", "high"]
+
+# campagna -> tipo di parser
+CAMPAIGN_KIND = {
+    "ptp": "ptp",
+    "ntpsec": "ntpsec",
+    "chrony_servergm": "chrony",
+    "chrony_clientchrony": "chrony",
+}
+
+# tipo -> ruolo -> (log grezzo, csv parsed per-run)
+KIND_LAYOUT: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "ptp": {
+        "boundary": ("ptp_boundary.log", "parsed_boundary_samples.csv"),
+        "client": ("ptp_client.log", "parsed_client_samples.csv"),
+    },
+    "ntpsec": {
+        "client": ("ntp_client_live.log", "parsed_client_samples.csv"),
+        "boundary": ("ntp_boundary_live.log", "parsed_boundary_samples.csv"),
+    },
+    "chrony": {
+        "tracking": ("chrony_tracking_series.txt", "parsed_tracking.csv"),
+        "sourcestats": ("chrony_sourcestats_series.txt", "parsed_sourcestats.csv"),
+    },
+}
+
+ALIGN_MODES = ("index", "lock")
+
+
+def campaign_kind(campaign: str) -> str:
+    kind = CAMPAIGN_KIND.get(campaign)
+    if kind is None:
+        if campaign.startswith("chrony"):
+            return "chrony"
+        raise ValueError(f"Unknown campaign: {campaign}")
+    return kind
+
+
+def list_run_dirs(campaign_root: Path, scenario: str) -> List[Path]:
+    scenario_dir = campaign_root / scenario
+    if not scenario_dir.exists():
+        return []
+    return sorted([p for p in scenario_dir.iterdir() if p.is_dir() and p.name.startswith("run")])
+
+
+# ----------------------------
+# Invalidation
+# ----------------------------
+
+def file_signature(path: Path, use_hash: bool = False) -> Tuple:
+    st = path.stat()
+    if not use_hash:
+        return (st.st_mtime_ns, st.st_size)
+    h = hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+    return (st.st_size, h)
+
+
+def frame_nbytes(*frames: Optional[pd.DataFrame]) -> int:
+    total = 0
+    for df in frames:
+        if df is not None and not df.empty:
+            total += int(df.memory_usage(index=True, deep=True).sum())
+    return total
+
+
+# ----------------------------
+# LRU cache bounded by memory
+# ----------------------------
+
+@dataclass
+class CacheEntry:
+    signature: Tuple
+    value: object
+    nbytes: int
+
+
+class FrameCache:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = int(max_bytes)
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, signature: Tuple) -> Optional[object]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.signature != signature:
+                # input modificato: la voce non e' piu' valida
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, signature: Tuple, value: object, nbytes: int) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = CacheEntry(signature=signature, value=value, nbytes=nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes and self._entries:
+                old_key = next(iter(self._entries))
+                self._drop(old_key)
+                self.evictions += 1
+
+    def invalidate(self, prefix: Tuple = ()) -> int:
+        with self._lock:
+            keys = [k for k in self._entries if isinstance(k, tuple) and k[:len(prefix)] == prefix]
+            for k in keys:
+                self._drop(k)
+            return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.nbytes
+
+
+# ----------------------------
+# Parsed runs
+# ----------------------------
+
+@dataclass
+class CachedRun:
+    kind: str
+    role: str
+    scenario: str
+    run_id: str
+    source_file: Path
+    samples: pd.DataFrame
+    events: pd.DataFrame
+    # solo PTP: intervalli degli stati di porta (ptp_analysis_v3.ParsedRun.states)
+    states: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # solo PTP: campioni mancanti rispetto alla cadenza dei config (ParsedRun.gaps)
+    gaps: pd.DataFrame = field(default_factory=pd.DataFrame)
+
+
+def parse_run_log(kind: str, role: str, path: Path, scenario: str, run_id: str) -> CachedRun:
+    states = gaps = pd.DataFrame()
+    if kind == "ptp":
+        run = ptp_v3.parse_ptp4l_log(path, role=role, scenario=scenario, run_id=run_id)
+        samples, events, states, gaps = run.samples, run.events, run.states, run.gaps
+    elif kind == "ntpsec":
+        run = ntpsec_v3.parse_ntpq_snapshots(path, role=role, scenario=scenario, run_id=run_id)
+        samples, events = run.samples, run.events
+    elif kind == "chrony":
+        if role == "tracking":
+            samples = chrony_v3.build_tracking_df(chrony_v3.parse_tracking_series(path), scenario, run_id)
+        elif role == "sourcestats":
+            samples = chrony_v3.build_sourcestats_df(chrony_v3.parse_sourcestats_series(path), scenario, run_id)
+        else:
+            raise ValueError(f"Unknown chrony role: {role}")
+        events = pd.DataFrame()
+    else:
+        raise ValueError(f"Unknown kind: {kind}")
+
+    return CachedRun(
+        kind=kind,
+        role=role,
+        scenario=scenario,
+        run_id=run_id,
+        source_file=path,
+        samples=samples,
+        events=events,
+        states=states,
+        gaps=gaps,
+    )
+
+
+def align_to_lock(run: CachedRun) -> pd.DataFrame:
+    """
+    Taglia i campioni prima dell'aggancio e rinumera sample_idx da 0:
+    PTP usa la prima transizione verso SLAVE, NTPsec il primo peer selected.
+    """
+    s = run.samples
+    if s.empty:
+        return s
+
+    if run.kind == "ptp":
+        e = run.events
+        if e.empty or "to" not in e.columns:
+            return s.iloc[0:0]
+        lock = e[(e["type"] == "state") & (e["to"] == "SLAVE")]
+        if lock.empty:
+            return s.iloc[0:0]
+        post = s[s["t"] >= float(lock["t"].min())]
+    elif run.kind == "ntpsec":
+        sel = s["selected"].astype(bool)
+        if not sel.any():
+            return s.iloc[0:0]
+        post = s[s["sample_idx"] >= s.loc[sel, "sample_idx"].min()]
+    else:
+        raise ValueError(f"--align lock not supported for {run.kind}")
+
+    post = post.reset_index(drop=True)
+    post["sample_idx"] = post.index.astype(int)
+    return post
+
+
+class CampaignCache:
+    """Cache condivisa di run parsed e curve aggregate per un albero T3_multiplerun."""
+
+    def __init__(self, root: Path, max_bytes: int, use_hash: bool = False) -> None:
+        self.root = root
+        self.use_hash = use_hash
+        self.frames = FrameCache(max_bytes)
+
+    def campaign_root(self, campaign: str) -> Path:
+        path = self.root / campaign
+        if not path.is_dir():
+            raise FileNotFoundError(f"Campaign directory not found: {path}")
+        return path
+
+    def _run_inputs(self, campaign: str, role: str, scenario: str) -> List[Tuple[str, Path]]:
+        kind = campaign_kind(campaign)
+        if role not in KIND_LAYOUT[kind]:
+            raise ValueError(f"Unknown role for {campaign}: {role}")
+        log_name = KIND_LAYOUT[kind][role][0]
+        out = []
+        for run_dir in list_run_dirs(self.campaign_root(campaign), scenario):
+            path = run_dir / log_name
+            if path.exists():
+                out.append((run_dir.name, path))
+        return out
+
+    def get_run(self, campaign: str, role: str, scenario: str, run_id: str, path: Path) -> CachedRun:
+        key = ("run", campaign, role, scenario, run_id)
+        sig = file_signature(path, self.use_hash)
+        run = self.frames.get(key, sig)
+        if run is None:
+            run = parse_run_log(campaign_kind(campaign), role, path, scenario, run_id)
+            self.frames.put(key, sig, run, frame_nbytes(run.samples, run.events, run.states))
+        return run
+
+    def get_runs(self, campaign: str, role: str, scenario: str) -> List[CachedRun]:
+        return [
+            self.get_run(campaign, role, scenario, run_id, path)
+            for run_id, path in self._run_inputs(campaign, role, scenario)
+        ]
+
+    def get_aggregate(
+        self,
+        campaign: str,
+        role: str,
+        metric: str,
+        scenario: str,
+        align: str = "index",
+        source: Optional[str] = None,
+    ) -> pd.DataFrame:
+        if align not in ALIGN_MODES:
+            raise ValueError(f"Unknown align mode: {align}")
+
+        inputs = self._run_inputs(campaign, role, scenario)
+        key = ("agg", campaign, role, scenario, metric, align, source)
+        sig = tuple((run_id, file_signature(path, self.use_hash)) for run_id, path in inputs)
+        cached = self.frames.get(key, sig)
+        if cached is not None:
+            return cached
+
+        runs = [self.get_run(campaign, role, scenario, run_id, path) for run_id, path in inputs]
+        out = aggregate_runs(runs, role, scenario, metric, align=align, source=source)
+        self.frames.put(key, sig, out, frame_nbytes(out))
+        return out
+
+    def invalidate(self, campaign: Optional[str] = None) -> int:
+        if campaign is None:
+            return self.frames.invalidate(())
+        return self.frames.invalidate(("run", campaign)) + self.frames.invalidate(("agg", campaign))
+
+
+def aggregate_runs(
+    runs: List[CachedRun],
+    role: str,
+    scenario: str,
+    metric: str,
+    align: str = "index",
+    source: Optional[str] = None,
+) -> pd.DataFrame:
+    if not runs:
+        return pd.DataFrame()
+
+    kind = runs[0].kind
+    frames = [align_to_lock(r) if align == "lock" else r.samples for r in runs]
+
+    if kind == "chrony":
+        df_all = pd.concat([f for f in frames if not f.empty], ignore_index=True) if any(
+            not f.empty for f in frames
+        ) else pd.DataFrame()
+        return chrony_v3.aggregate_metric(df_all, scenario=scenario, metric=metric, source=source)
+
+    module = ptp_v3 if kind == "ptp" else ntpsec_v3
+    parsed = [
+        module.ParsedRun(
+            role=r.role,
+            scenario=r.scenario,
+            run_id=r.run_id,
+            source_file=r.source_file,
+            samples=f,
+            events=r.events,
+        )
+        for r, f in zip(runs, frames)
+    ]
+    return module.aggregate_metric(parsed, role=role, scenario=scenario, metric=metric)
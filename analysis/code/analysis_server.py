@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_SOCKET = Path("/tmp/tesi_sync_lab_analysis.sock")
+
+
+# ----------------------------
+# Wire protocol: una richiesta JSON per riga, una risposta JSON per riga
+# ----------------------------
+
+def _send_line(sock_file, payload: Dict) -> None:
+    sock_file.write((json.dumps(payload) + "\n").encode("utf-8"))
+    sock_file.flush()
+
+
+class _RequestParser(argparse.ArgumentParser):
+    def error(self, message: str) -> None:
+        raise ValueError(message)
+
+    def exit(self, status: int = 0, message: Optional[str] = None) -> None:
+        raise ValueError(message or f"exit {status}")
+
+
+def build_request_parser() -> argparse.ArgumentParser:
+    ap = _RequestParser(prog="query", add_help=False)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    agg = sub.add_parser("aggregate", add_help=False)
+    agg.add_argument("campaign", help="ptp | ntpsec | chrony_servergm | chrony_clientchrony")
+    agg.add_argument("role", help="boundary/client (ptp, ntpsec) or tracking/sourcestats (chrony)")
+    agg.add_argument("metric")
+    agg.add_argument("scenario")
+    agg.add_argument("--align", choices=["index", "lock"], default="index")
+    agg.add_argument("--source", default=None, help="Chrony sourcestats source name")
+
+    runs = sub.add_parser("runs", add_help=False)
+    runs.add_argument("campaign")
+    runs.add_argument("role")
+    runs.add_argument("scenario")
+
+    inv = sub.add_parser("invalidate", add_help=False)
+    inv.add_argument("campaign", nargs="?", default=None)
+
+    sub.add_parser("stats", add_help=False)
+    sub.add_parser("shutdown", add_help=False)
+    return ap
+
+
+# ----------------------------
+# Server
+# ----------------------------
+
+def handle_request(cache, argv: List[str]) -> Dict:
+    args = build_request_parser().parse_args(argv)
+
+    if args.cmd == "aggregate":
+        df = cache.get_aggregate(
+            args.campaign, args.role, args.metric, args.scenario,
+            align=args.align, source=args.source,
+        )
+        return {"rows": int(len(df)), "csv": df.to_csv(index=False)}
+
+    if args.cmd == "runs":
+        from event_runs import event_count
+
+        rows = []
+        for r in cache.get_runs(args.campaign, args.role, args.scenario):
+            rows.append({
+                "run_id": r.run_id,
+                "source_file": str(r.source_file),
+                "n_samples": int(len(r.samples)),
+                "n_events": event_count(r.events),
+            })
+        return {"runs": rows}
+
+    if args.cmd == "invalidate":
+        return {"dropped": cache.invalidate(args.campaign)}
+
+    if args.cmd == "stats":
+        return {"cache": cache.frames.stats()}
+
+    if args.cmd == "shutdown":
+        return {"shutdown": True}
+
+    raise ValueError(f"Unknown command: {args.cmd}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for raw in self.rfile:
+            t0 = time.perf_counter()
+            try:
+                req = json.loads(raw.decode("utf-8"))
+                resp = handle_request(self.server.cache, list(req.get("argv", [])))
+                resp["ok"] = True
+            except Exception as exc:  # l'errore torna al client, il server resta vivo
+                resp = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+            resp["elapsed_ms"] = round((time.perf_counter() - t0) * 1e3, 3)
+            _send_line(self.wfile, resp)
+
+            if resp.get("shutdown"):
+                # shutdown() blocca finche' serve_forever non esce: va chiamato da un altro thread
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(root: Path, socket_path: Path, port: Optional[int], max_mb: float, use_hash: bool) -> None:
+    # import pesanti (pandas, matplotlib, parser) pagati una sola volta all'avvio
+    from analysis_cache import CampaignCache
+
+    cache = CampaignCache(root, max_bytes=int(max_mb * 1024 * 1024), use_hash=use_hash)
+
+    if port is not None:
+        server = _TCPServer(("127.0.0.1", port), _Handler)
+        where = f"127.0.0.1:{port}"
+    else:
+        if socket_path.exists():
+            socket_path.unlink()
+        server = _UnixServer(str(socket_path), _Handler)
+        where = str(socket_path)
+
+    server.cache = cache
+    print(f"[OK] Analysis server su {where} (root={root}, cache={max_mb:.0f} MB)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if port is None and socket_path.exists():
+            socket_path.unlink()
+
+
+# ----------------------------
+# Client
+# ----------------------------
+
+def query(argv: List[str], socket_path: Path, port: Optional[int]) -> Dict:
+    if port is not None:
+        sock = socket.create_connection(("127.0.0.1", port))
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(str(socket_path))
+
+    with sock, sock.makefile("rwb") as f:
+        _send_line(f, {"argv": argv})
+        line = f.readline()
+    if not line:
+        raise ConnectionError("Empty response from analysis server")
+    return json.loads(line.decode("utf-8"))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Persistent analysis server with an in-memory DataFrame cache.")
+    ap.add_argument("--socket", type=Path, default=DEFAULT_SOCKET, help="Unix socket path")
+    ap.add_argument("--port", type=int, default=None, help="Use TCP on 127.0.0.1:PORT instead of a Unix socket")
+    sub = ap.add_subparsers(dest="mode", required=True)
+
+    sp = sub.add_parser("serve", help="Start the server")
+    sp.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Multi-run campaign root, e.g. .../analysis/raw_logs/T3_multiplerun",
+    )
+    sp.add_argument("--max-mb", type=float, default=1024.0, help="Cache memory budget in MB")
+    sp.add_argument("--hash", action="store_true", help="Invalidate by content hash instead of mtime/size")
+
+    qp = sub.add_parser("query", help="Send a request, e.g. 'aggregate ptp client rms_ns high --align lock'")
+    qp.add_argument("--out", type=Path, default=None, help="Write the returned CSV here instead of stdout")
+    qp.add_argument("request", nargs=argparse.REMAINDER)
+
+    args = ap.parse_args()
+
+    if args.mode == "serve":
+        serve(args.root.resolve(), args.socket, args.port, args.max_mb, args.hash)
+        return
+
+    resp = query(args.request, args.socket, args.port)
+    if not resp.get("ok"):
+        print(f"[ERR] {resp.get('error')}", file=sys.stderr)
+        sys.exit(1)
+
+    if "csv" in resp:
+        if args.out is not None:
+            args.out.write_text(resp["csv"], encoding="utf-8")
+            print(f"[OK] {resp['rows']} righe in {args.out} ({resp['elapsed_ms']} ms)")
+        else:
+            sys.stdout.write(resp["csv"])
+    else:
+        print(json.dumps({k: v for k, v in resp.items() if k != "ok"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from atomic_output import (
+    active_manifest,
+    current_inputs,
+    savefig_atomic,
+    write_csv_atomic,
+    write_json_atomic,
+    write_npz_atomic,
+)
+from profiling import span
+
+
+# Lettura dei log in anticipo e scrittura di CSV/PNG in background, cosi' CPU e disco
+# lavorano in parallelo. Senza un contesto attivo tutto resta sincrono come prima.
+
+_ACTIVE_WRITER: Optional["BackgroundWriter"] = None
+_ACTIVE_PREFETCHER: Optional["LogPrefetcher"] = None
+
+
+# ----------------------------
+# Prefetch dei log
+# ----------------------------
+
+class LogPrefetcher:
+    def __init__(self, paths: Iterable[Path], depth: int = 4, workers: int = 2) -> None:
+        self._queue = [Path(p) for p in paths]
+        self._depth = max(1, depth)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+        self._futures: Dict[Path, Future] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._fill()
+
+    def _fill(self) -> None:
+        while self._next < len(self._queue) and len(self._futures) < self._depth:
+            path = self._queue[self._next]
+            self._futures[path] = self._pool.submit(path.read_text, encoding="utf-8", errors="replace")
+            self._next += 1
+
+    def take(self, path: Path) -> Optional[str]:
+        if os.getpid() != self._pid:
+            return None
+        with self._lock:
+            fut = self._futures.pop(Path(path), None)
+            self._fill()
+        return fut.result() if fut is not None else None
+
+    def close(self) -> None:
+        for fut in self._futures.values():
+            fut.cancel()
+        self._futures.clear()
+        self._pool.shutdown(wait=True)
+
+
+def read_text(path: Path) -> str:
+    with span("read", file=path.name):
+        if _ACTIVE_PREFETCHER is not None:
+            text = _ACTIVE_PREFETCHER.take(path)
+            if text is not None:
+                return text
+        return path.read_text(encoding="utf-8", errors="replace")
+
+
+@contextmanager
+def prefetch_logs(paths: Iterable[Path], depth: int = 4) -> Iterator[LogPrefetcher]:
+    global _ACTIVE_PREFETCHER
+    prefetcher = LogPrefetcher(paths, depth=depth)
+    _ACTIVE_PREFETCHER = prefetcher
+    try:
+        yield prefetcher
+    finally:
+        _ACTIVE_PREFETCHER = None
+        prefetcher.close()
+
+
+# ----------------------------
+# Scritture in background
+# ----------------------------
+
+class BackgroundWriter:
+    def __init__(self, workers: int = 2, max_pending: int = 8) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="writer")
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._futures: List[Future] = []
+        self._errors: List[BaseException] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._closed = False
+
+    def _done(self, fut: Future) -> None:
+        self._slots.release()
+        exc = fut.exception()
+        if exc is not None:
+            with self._lock:
+                self._errors.append(exc)
+
+    def _raise_errors(self) -> None:
+        with self._lock:
+            errors = list(self._errors)
+            self._errors.clear()
+        if errors:
+            msg = "; ".join(f"{type(e).__name__}: {e}" for e in errors)
+            raise RuntimeError(f"{len(errors)} background write(s) failed: {msg}") from errors[0]
+
+    def submit(self, fn: Callable, *args, **kwargs) -> None:
+        # nei processi figli (fork) i thread del pool non esistono: scrittura sincrona
+        if self._closed or os.getpid() != self._pid:
+            fn(*args, **kwargs)
+            return
+        self._raise_errors()
+        self._slots.acquire()
+        fut = self._pool.submit(fn, *args, **kwargs)
+        fut.add_done_callback(self._done)
+        self._futures.append(fut)
+
+    def flush(self) -> None:
+        futures, self._futures = self._futures, []
+        for fut in futures:
+            try:
+                fut.result()
+            except BaseException:
+                pass  # gia' registrato da _done
+        self._raise_errors()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            self._pool.shutdown(wait=True)
+
+
+def submit_write(fn: Callable, *args, **kwargs) -> None:
+    if _ACTIVE_WRITER is not None:
+        _ACTIVE_WRITER.submit(fn, *args, **kwargs)
+    else:
+        fn(*args, **kwargs)
+
+
+def write_csv(df: pd.DataFrame, path: Path, inputs: Optional[Iterable[Path]] = None, **kwargs) -> None:
+    # input e manifest vanno letti qui: il thread di scrittura non vede il contesto del chiamante
+    inputs = current_inputs() if inputs is None else list(inputs)
+    submit_write(write_csv_atomic, df, path, inputs=inputs, manifest=active_manifest(), **kwargs)
+
+
+def write_json(obj, path: Path, inputs: Optional[Iterable[Path]] = None) -> None:
+    inputs = current_inputs() if inputs is None else list(inputs)
+    submit_write(write_json_atomic, obj, path, inputs=inputs, manifest=active_manifest())
+
+
+def write_npz(arrays: Dict[str, np.ndarray], path: Path, inputs: Optional[Iterable[Path]] = None) -> None:
+    inputs = current_inputs() if inputs is None else list(inputs)
+    submit_write(write_npz_atomic, arrays, path, inputs=inputs, manifest=active_manifest())
+
+
+def save_current_figure(outpath: Path, dpi: int = 200) -> None:
+    # la figura viene staccata da pyplot subito, il rendering su disco puo' andare in background
+    fig = plt.gcf()
+    plt.close(fig)
+    submit_write(savefig_atomic, fig, outpath, inputs=current_inputs(), manifest=active_manifest(), dpi=dpi)
+
+
+@contextmanager
+def background_writer(workers: int = 2, max_pending: int = 8) -> Iterator[BackgroundWriter]:
+    global _ACTIVE_WRITER
+    writer = BackgroundWriter(workers=workers, max_pending=max_pending)
+    _ACTIVE_WRITER = writer
+    atexit.register(writer.close)
+    try:
+        yield writer
+    finally:
+        _ACTIVE_WRITER = None
+        atexit.unregister(writer.close)
+        writer.close()
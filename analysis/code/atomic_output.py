@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from profiling import span
+
+
+# Scritture atomiche (file temporaneo + os.replace), lock consultivo per campagna e
+# manifest degli output: driver, watch mode e script di statistiche possono girare
+# insieme senza che un lettore veda mai un file scritto a meta'.
+
+LOCK_NAME = ".analysis.lock"
+MANIFEST_NAME = "manifest.json"
+
+_ACTIVE_MANIFEST: Optional["OutputManifest"] = None
+_CURRENT_INPUTS: List[Path] = []
+
+# lock gia' acquisiti da questo processo: path -> (fd, profondita')
+_HELD_LOCKS: Dict[Path, List[int]] = {}
+_HELD_LOCKS_GUARD = threading.Lock()
+
+
+# ----------------------------
+# Atomic writes
+# ----------------------------
+
+def atomic_replace(path: Path, write: Callable[[Path], None]) -> None:
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def write_csv_atomic(
+    df: pd.DataFrame,
+    path: Path,
+    inputs: Optional[Iterable[Path]] = None,
+    manifest: Optional["OutputManifest"] = None,
+    **kwargs,
+) -> None:
+    kwargs.setdefault("index", False)
+    with span("write.csv", file=Path(path).name):
+        atomic_replace(path, lambda tmp: df.to_csv(tmp, **kwargs))
+    _record(path, inputs, manifest)
+
+
+def write_json_atomic(
+    obj,
+    path: Path,
+    inputs: Optional[Iterable[Path]] = None,
+    manifest: Optional["OutputManifest"] = None,
+) -> None:
+    text = json.dumps(obj, indent=1)
+    with span("write.json", file=Path(path).name):
+        atomic_replace(path, lambda tmp: tmp.write_text(text, encoding="utf-8"))
+    _record(path, inputs, manifest)
+
+
+def write_npz_atomic(
+    arrays: Mapping[str, np.ndarray],
+    path: Path,
+    inputs: Optional[Iterable[Path]] = None,
+    manifest: Optional["OutputManifest"] = None,
+) -> None:
+    def write(tmp: Path) -> None:
+        # file aperto a mano: con un nome savez_compressed aggiungerebbe .npz al temporaneo
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+
+    with span("write.npz", file=Path(path).name):
+        atomic_replace(path, write)
+    _record(path, inputs, manifest)
+
+
+def savefig_atomic(
+    fig,
+    path: Path,
+    inputs: Optional[Iterable[Path]] = None,
+    manifest: Optional["OutputManifest"] = None,
+    **kwargs,
+) -> None:
+    # il nome temporaneo non ha l'estensione giusta: il formato va passato esplicitamente
+    kwargs.setdefault("format", Path(path).suffix.lstrip(".") or None)
+    with span("write.png", file=Path(path).name):
+        atomic_replace(path, lambda tmp: fig.savefig(tmp, **kwargs))
+    _record(path, inputs, manifest)
+
+
+def _record(path: Path, inputs: Optional[Iterable[Path]], manifest: Optional["OutputManifest"]) -> None:
+    manifest = manifest if manifest is not None else _ACTIVE_MANIFEST
+    if manifest is not None:
+        manifest.record(path, current_inputs() if inputs is None else inputs)
+
+
+# ----------------------------
+# Input scope
+# ----------------------------
+
+@contextmanager
+def output_inputs(paths: Iterable[Path]) -> Iterator[None]:
+    """Gli output scritti nel blocco vengono registrati nel manifest come prodotti da `paths`."""
+    global _CURRENT_INPUTS
+    previous = _CURRENT_INPUTS
+    _CURRENT_INPUTS = [Path(p) for p in paths]
+    try:
+        yield
+    finally:
+        _CURRENT_INPUTS = previous
+
+
+def current_inputs() -> List[Path]:
+    return list(_CURRENT_INPUTS)
+
+
+def active_manifest() -> Optional["OutputManifest"]:
+    return _ACTIVE_MANIFEST
+
+
+# ----------------------------
+# Campaign lock
+# ----------------------------
+
+@contextmanager
+def campaign_lock(root: Path, poll_s: float = 1.0) -> Iterator[Path]:
+    """Lock consultivo esclusivo su <root>/.analysis.lock, rientrante nello stesso processo."""
+    lock_path = (Path(root) / LOCK_NAME).resolve()
+
+    with _HELD_LOCKS_GUARD:
+        held = _HELD_LOCKS.get(lock_path)
+        if held is not None:
+            held[1] += 1
+
+    if held is None:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        waited = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if not waited:
+                    print(f"[WAIT] Campagna in uso da un'altra analisi: {lock_path}")
+                    waited = True
+                time.sleep(poll_s)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        with _HELD_LOCKS_GUARD:
+            _HELD_LOCKS[lock_path] = [fd, 1]
+
+    try:
+        yield lock_path
+    finally:
+        with _HELD_LOCKS_GUARD:
+            entry = _HELD_LOCKS[lock_path]
+            entry[1] -= 1
+            release = entry[1] == 0
+            if release:
+                del _HELD_LOCKS[lock_path]
+        if release:
+            fcntl.flock(entry[0], fcntl.LOCK_UN)
+            os.close(entry[0])
+
+
+# ----------------------------
+# Manifest
+# ----------------------------
+
+def _file_entry(path: Path, root: Path) -> Dict[str, object]:
+    try:
+        st = path.stat()
+        mtime_ns, size = st.st_mtime_ns, st.st_size
+    except OSError:
+        mtime_ns, size = None, None
+    return {"path": _rel(path, root), "mtime_ns": mtime_ns, "size": size}
+
+
+def _rel(path: Path, root: Path) -> str:
+    path = Path(path).resolve()
+    try:
+        return str(path.relative_to(root))
+    except ValueError:
+        return str(path)
+
+
+class OutputManifest:
+    """Per ogni output (relativo alla root di campagna) gli input e le loro firme (mtime_ns, size)."""
+
+    def __init__(self, root: Path, producer: str) -> None:
+        self.root = Path(root).resolve()
+        self.path = self.root / "_aggregated" / MANIFEST_NAME
+        self.producer = producer
+        self._entries: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def record(self, output: Path, inputs: Iterable[Path]) -> None:
+        entry = {
+            "producer": self.producer,
+            "written_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "size": Path(output).stat().st_size,
+            "inputs": [_file_entry(Path(p), self.root) for p in sorted(set(inputs))],
+        }
+        key = _rel(output, self.root)
+
+        if os.getpid() != self._pid:
+            # processo worker (fork): journal a parte, il parent lo integra in save()
+            line = json.dumps({"output": key, **entry}) + "\n"
+            with open(self._journal_path(os.getpid()), "a", encoding="utf-8") as f:
+                f.write(line)
+            return
+
+        with self._lock:
+            self._entries[key] = entry
+
+    def _journal_path(self, pid: int) -> Path:
+        return self.path.with_name(f".{self.path.name}.{pid}.journal")
+
+    def _collect_journals(self) -> None:
+        for journal in sorted(self.path.parent.glob(f".{self.path.name}.*.journal")):
+            for line in journal.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    item = json.loads(line)
+                    self._entries[item.pop("output")] = item
+            journal.unlink()
+
+    def save(self) -> None:
+        # da chiamare con il lock di campagna acquisito: unisce le voci al manifest esistente
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._collect_journals()
+            if not self._entries:
+                return
+
+            outputs: Dict[str, object] = {}
+            if self.path.exists():
+                try:
+                    outputs = json.loads(self.path.read_text(encoding="utf-8")).get("outputs", {})
+                except (OSError, ValueError):
+                    outputs = {}
+            outputs.update(self._entries)
+            self._entries.clear()
+
+        payload = {"root": str(self.root), "outputs": dict(sorted(outputs.items()))}
+        atomic_replace(self.path, lambda tmp: tmp.write_text(json.dumps(payload, indent=1), encoding="utf-8"))
+
+
+@contextmanager
+def campaign_outputs(root: Path, producer: str) -> Iterator[OutputManifest]:
+    """Lock di campagna + manifest attivo; il manifest viene salvato prima di rilasciare il lock."""
+    global _ACTIVE_MANIFEST
+    with campaign_lock(root):
+        previous = _ACTIVE_MANIFEST
+        if previous is not None and previous.root == Path(root).resolve():
+            # gia' dentro una sessione sulla stessa campagna (es. stats chiamate dal watcher)
+            yield previous
+            return
+
+        manifest = OutputManifest(root, producer)
+        _ACTIVE_MANIFEST = manifest
+        try:
+            yield manifest
+        finally:
+            _ACTIVE_MANIFEST = previous
+            manifest.save()
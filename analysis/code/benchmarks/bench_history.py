@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import statistics
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Storico dei benchmark (JSON lines, una riga per caso e scala, con il commit git) e
+# confronto di una nuova esecuzione con una baseline mobile: mediana delle mediane delle
+# ultime N esecuzioni, con soglia relativa e soglia sul rumore (MAD) insieme.
+
+DEFAULT_HISTORY = Path(__file__).resolve().parent / "results" / "history.jsonl"
+DEFAULT_RESULTS = Path(__file__).resolve().parent / "results" / "latest.json"
+
+MAD_TO_SIGMA = 1.4826
+
+
+@dataclass
+class Verdict:
+    case: str
+    scale: int
+    status: str  # "ok" | "regression" | "improvement" | "new"
+    current_s: float
+    baseline_s: Optional[float]
+    ratio: Optional[float]
+    noise_s: Optional[float]
+    n_baseline: int
+    current_rss_mb: Optional[float]
+    baseline_rss_mb: Optional[float]
+    rss_regression: bool
+
+
+# ----------------------------
+# Store
+# ----------------------------
+
+def results_to_records(payload: Dict) -> List[Dict]:
+    git = payload.get("git") or {}
+    commit = git.get("commit")
+    run_id = f"{payload['created_at']}@{(commit or 'nogit')[:12]}"
+    return [
+        {
+            "run_id": run_id,
+            "commit": commit,
+            "dirty": git.get("dirty"),
+            "created_at": payload["created_at"],
+            "case": r["case"],
+            "scale": r["scale"],
+            "runs_per_scenario": r.get("runs_per_scenario"),
+            "times_s": r["times_s"],
+            "median_s": r["median_s"],
+            "lines_per_s": r.get("lines_per_s"),
+            "rows_per_s": r.get("rows_per_s"),
+            "peak_rss_mb": r.get("peak_rss_mb"),
+        }
+        for r in payload["results"]
+    ]
+
+
+def load_history(path: Path) -> List[Dict]:
+    if not path.exists():
+        return []
+    out = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            out.append(json.loads(line))
+    return out
+
+
+def append_history(path: Path, records: List[Dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+
+# ----------------------------
+# Comparison
+# ----------------------------
+
+def _mad(values: List[float]) -> float:
+    if len(values) < 2:
+        return 0.0
+    med = statistics.median(values)
+    return statistics.median(abs(v - med) for v in values)
+
+
+def compare(
+    records: List[Dict],
+    history: List[Dict],
+    window: int = 5,
+    tolerance: float = 0.10,
+    noise_k: float = 3.0,
+    rss_tolerance: float = 0.25,
+    min_history: int = 2,
+) -> List[Verdict]:
+    """Confronta i record correnti con le ultime `window` esecuzioni precedenti dello stesso caso e scala."""
+    current_runs = {r["run_id"] for r in records}
+    by_key: Dict[Tuple[str, int, Optional[int]], List[Dict]] = {}
+    for rec in history:
+        if rec["run_id"] in current_runs:
+            continue
+        by_key.setdefault((rec["case"], rec["scale"], rec.get("runs_per_scenario")), []).append(rec)
+
+    verdicts = []
+    for rec in records:
+        past = by_key.get((rec["case"], rec["scale"], rec.get("runs_per_scenario")), [])[-window:]
+        cur = rec["median_s"]
+        if len(past) < min_history:
+            verdicts.append(Verdict(rec["case"], rec["scale"], "new", cur, None, None, None, len(past),
+                                    rec.get("peak_rss_mb"), None, False))
+            continue
+
+        base_medians = [p["median_s"] for p in past]
+        base = statistics.median(base_medians)
+        # rumore: dispersione tra le mediane passate + errore della mediana corrente sulle ripetizioni
+        base_sigma = MAD_TO_SIGMA * _mad(base_medians)
+        cur_sigma = MAD_TO_SIGMA * _mad(rec["times_s"]) / math.sqrt(max(len(rec["times_s"]), 1))
+        noise = math.hypot(base_sigma, cur_sigma)
+        delta = cur - base
+        ratio = cur / base if base > 0 else None
+
+        status = "ok"
+        if ratio is not None and ratio > 1.0 + tolerance and delta > noise_k * noise:
+            status = "regression"
+        elif ratio is not None and ratio < 1.0 - tolerance and -delta > noise_k * noise:
+            status = "improvement"
+
+        past_rss = [p["peak_rss_mb"] for p in past if p.get("peak_rss_mb") is not None]
+        base_rss = statistics.median(past_rss) if past_rss else None
+        cur_rss = rec.get("peak_rss_mb")
+        rss_regression = bool(base_rss and cur_rss and cur_rss > base_rss * (1.0 + rss_tolerance))
+
+        verdicts.append(Verdict(rec["case"], rec["scale"], status, cur, base, ratio, noise, len(past),
+                                cur_rss, base_rss, rss_regression))
+    return verdicts
+
+
+def format_report(verdicts: List[Verdict], commit: Optional[str]) -> str:
+    lines = [
+        f"# Benchmark report ({(commit or 'no git')[:12]})",
+        "",
+        "| case | scale | status | current (s) | baseline (s) | ratio | noise (s) | n | peak RSS (MB) | baseline RSS (MB) |",
+        "|---|---|---|---|---|---|---|---|---|---|",
+    ]
+
+    def fmt(v: Optional[float], spec: str) -> str:
+        return "-" if v is None else format(v, spec)
+
+    for v in sorted(verdicts, key=lambda x: (x.scale, x.case)):
+        status = v.status + (" +RSS" if v.rss_regression else "")
+        lines.append(
+            f"| {v.case} | x{v.scale} | {status} | {v.current_s:.4f} | {fmt(v.baseline_s, '.4f')} | "
+            f"{fmt(v.ratio, '.3f')} | {fmt(v.noise_s, '.4f')} | {v.n_baseline} | "
+            f"{fmt(v.current_rss_mb, '.0f')} | {fmt(v.baseline_rss_mb, '.0f')} |"
+        )
+
+    n_reg = sum(v.status == "regression" or v.rss_regression for v in verdicts)
+    n_imp = sum(v.status == "improvement" for v in verdicts)
+    lines += ["", f"{n_reg} regression(s), {n_imp} improvement(s), {len(verdicts)} case(s) compared."]
+    return "\n".join(lines) + "\n"
+
+
+def check(
+    results: Path,
+    history: Path,
+    report: Optional[Path] = None,
+    record: bool = True,
+    **thresholds,
+) -> int:
+    """Registra i risultati nello storico e li confronta con la baseline; ritorna l'exit code."""
+    payload = json.loads(results.read_text(encoding="utf-8"))
+    records = results_to_records(payload)
+    past = load_history(history)
+
+    verdicts = compare(records, past, **thresholds)
+    text = format_report(verdicts, (payload.get("git") or {}).get("commit"))
+    print(text, end="")
+    if report is not None:
+        report.parent.mkdir(parents=True, exist_ok=True)
+        report.write_text(text, encoding="utf-8")
+
+    if record and not any(r["run_id"] in {p["run_id"] for p in past} for r in records):
+        append_history(history, records)
+
+    return 1 if any(v.status == "regression" or v.rss_regression for v in verdicts) else 0
+
+
+def add_threshold_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--history", type=Path, default=DEFAULT_HISTORY, help="History store (JSON lines)")
+    ap.add_argument("--window", type=int, default=5, help="Previous runs in the rolling baseline")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="Relative slowdown tolerated (0.10 = 10%%)")
+    ap.add_argument("--noise-k", type=float, default=3.0, help="Slowdown must also exceed k * robust noise")
+    ap.add_argument("--rss-tolerance", type=float, default=0.25, help="Relative peak RSS growth tolerated")
+    ap.add_argument("--min-history", type=int, default=2, help="Baseline runs needed before judging a case")
+
+
+def threshold_kwargs(args: argparse.Namespace) -> Dict:
+    return {
+        "window": args.window,
+        "tolerance": args.tolerance,
+        "noise_k": args.noise_k,
+        "rss_tolerance": args.rss_tolerance,
+        "min_history": args.min_history,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Record benchmark results per git commit and flag regressions.")
+    ap.add_argument("results", type=Path, nargs="?", default=DEFAULT_RESULTS, help="Results JSON from run_benchmarks.py")
+    ap.add_argument("--report", type=Path, default=None, help="Also write the Markdown report here")
+    ap.add_argument("--no-record", action="store_true", help="Compare only, do not append to the history")
+    add_threshold_args(ap)
+    args = ap.parse_args()
+
+    sys.exit(check(args.results, args.history, args.report, record=not args.no_record, **threshold_kwargs(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+CODE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(CODE_DIR))
+sys.path.insert(0, str(CODE_DIR / "code_statistics"))
+
+import chrony_analysis_v3 as chrony_v3  # noqa: E402
+import chrony_stats_aggregated  # noqa: E402
+import ntpsec_analysis_v3 as ntpsec_v3  # noqa: E402
+import ntpsec_stats_aggregated  # noqa: E402
+import ptp_analysis_v3 as ptp_v3  # noqa: E402
+import ptp_stats_aggregated  # noqa: E402
+from bench_history import add_threshold_args, check, threshold_kwargs  # noqa: E402
+from memory_budget import current_rss, peak_rss  # noqa: E402
+from synthetic_logs import SCENARIOS, CorpusInfo, write_campaign  # noqa: E402
+
+
+# Benchmark dei punti caldi della pipeline su un corpus sintetico a 1x/10x/100x.
+# Ogni caso gira in un processo figlio (fork). Il figlio parte con l'RSS del parent (moduli,
+# corpus), quindi il picco riportato e' quello del caso: picco del figlio meno il suo RSS
+# all'avvio. Su Linux il picco del kernel (VmHWM) viene azzerato all'avvio del caso; senza
+# /proc resta ru_maxrss, che puo' includere il picco ereditato dal parent.
+
+DEFAULT_OUT = Path(__file__).resolve().parent / "results" / "latest.json"
+
+
+@dataclass
+class Workload:
+    lines: int = 0
+    rows: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class BenchCase:
+    name: str
+    group: str
+    setup: Callable[[CorpusInfo], object]
+    run: Callable[[object], Workload]
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+
+def _count_lines(paths: List[Path]) -> int:
+    return sum(p.read_bytes().count(b"\n") for p in paths)
+
+
+def _run_meta(path: Path) -> Tuple[str, str]:
+    # .../<scenario>/<runNN>/<file>
+    return path.parent.parent.name, path.parent.name
+
+
+def _ptp_runs(paths: List[Path], role: str) -> List[ptp_v3.ParsedRun]:
+    return [ptp_v3.parse_ptp4l_log(p, role, *_run_meta(p)) for p in paths]
+
+
+def _ntpsec_runs(info: CorpusInfo) -> List[ntpsec_v3.ParsedRun]:
+    return [
+        ntpsec_v3.parse_ntpq_snapshots(p, role, *_run_meta(p))
+        for role, kind in (("client", "ntpq_client"), ("boundary", "ntpq_boundary"))
+        for p in info.files[kind]
+    ]
+
+
+def _chrony_frames(info: CorpusInfo) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    tracking = [
+        chrony_v3.build_tracking_df(chrony_v3.parse_tracking_series(p), *_run_meta(p))
+        for p in info.files["chrony_tracking"]
+    ]
+    sourcestats = [
+        chrony_v3.build_sourcestats_df(chrony_v3.parse_sourcestats_series(p), *_run_meta(p))
+        for p in info.files["chrony_sourcestats"]
+    ]
+    return pd.concat(tracking, ignore_index=True), pd.concat(sourcestats, ignore_index=True)
+
+
+# ----------------------------
+# Parsers
+# ----------------------------
+
+def _parse_files_setup(kind: str) -> Callable[[CorpusInfo], object]:
+    def setup(info: CorpusInfo) -> object:
+        paths = info.files[kind]
+        return paths, _count_lines(paths), sum(p.stat().st_size for p in paths)
+    return setup
+
+
+def _parse_ptp(role: str) -> Callable[[object], Workload]:
+    def run(state) -> Workload:
+        paths, lines, nbytes = state
+        runs = _ptp_runs(paths, role)
+        return Workload(lines=lines, rows=sum(len(r.samples) + len(r.events) for r in runs), bytes=nbytes)
+    return run
+
+
+def _parse_ntpq(role: str) -> Callable[[object], Workload]:
+    def run(state) -> Workload:
+        paths, lines, nbytes = state
+        runs = [ntpsec_v3.parse_ntpq_snapshots(p, role, *_run_meta(p)) for p in paths]
+        return Workload(lines=lines, rows=sum(len(r.samples) + len(r.events) for r in runs), bytes=nbytes)
+    return run
+
+
+def _parse_chrony_tracking(state) -> Workload:
+    paths, lines, nbytes = state
+    rows = 0
+    for p in paths:
+        rows += len(chrony_v3.build_tracking_df(chrony_v3.parse_tracking_series(p), *_run_meta(p)))
+    return Workload(lines=lines, rows=rows, bytes=nbytes)
+
+
+def _parse_chrony_sourcestats(state) -> Workload:
+    paths, lines, nbytes = state
+    rows = 0
+    for p in paths:
+        rows += len(chrony_v3.build_sourcestats_df(chrony_v3.parse_sourcestats_series(p), *_run_meta(p)))
+    return Workload(lines=lines, rows=rows, bytes=nbytes)
+
+
+# ----------------------------
+# Aggregation
+# ----------------------------
+
+def _aggregate_ptp_setup(info: CorpusInfo) -> object:
+    return _ptp_runs(info.files["ptp4l_boundary"], "boundary") + _ptp_runs(info.files["ptp4l_client"], "client")
+
+
+def _aggregate_ptp(runs: List[ptp_v3.ParsedRun]) -> Workload:
+    rows = 0
+    for scenario in SCENARIOS:
+        for role, metrics in (("boundary", ptp_v3.BOUNDARY_METRICS), ("client", ptp_v3.CLIENT_METRICS)):
+            for metric in metrics:
+                ptp_v3.aggregate_metric(runs, role=role, scenario=scenario, metric=metric)
+                rows += sum(len(r.samples) for r in runs if r.role == role and r.scenario == scenario)
+    return Workload(rows=rows)
+
+
+def _aggregate_ntpsec(runs: List[ntpsec_v3.ParsedRun]) -> Workload:
+    rows = 0
+    for scenario in SCENARIOS:
+        for role in ("client", "boundary"):
+            for metric in ntpsec_v3.METRIC_SPECS:
+                ntpsec_v3.aggregate_metric(runs, role=role, scenario=scenario, metric=metric)
+                rows += sum(len(r.samples) for r in runs if r.role == role and r.scenario == scenario)
+    return Workload(rows=rows)
+
+
+def _aggregate_chrony(frames: Tuple[pd.DataFrame, pd.DataFrame]) -> Workload:
+    tracking, sourcestats = frames
+    rows = 0
+    sources = sorted(sourcestats["source"].dropna().unique().tolist())
+    for scenario in SCENARIOS:
+        n_tracking = int((tracking["scenario"] == scenario).sum())
+        for metric in chrony_v3.TRACKING_METRICS:
+            chrony_v3.aggregate_metric(tracking, scenario=scenario, metric=metric)
+            rows += n_tracking
+        for metric in chrony_v3.SOURCESTATS_METRICS:
+            for source in sources:
+                chrony_v3.aggregate_metric(sourcestats, scenario=scenario, metric=metric, source=source)
+                rows += int(((sourcestats["scenario"] == scenario) & (sourcestats["source"] == source)).sum())
+    return Workload(rows=rows)
+
+
+# ----------------------------
+# Stats and plots
+# ----------------------------
+
+def _csv_rows(paths: List[Path]) -> int:
+    return sum(max(_count_lines([p]) - 1, 0) for p in paths)
+
+
+def _stats_setup(campaign: str) -> Callable[[CorpusInfo], object]:
+    # richiede le uscite dei driver (parsed_*.csv e *_aggregated.csv), preparate da prepare_outputs()
+    def setup(info: CorpusInfo) -> object:
+        root = info.root / campaign
+        inputs = sorted(root.glob("*/run*/parsed_*.csv")) + sorted((root / "_aggregated").rglob("*_aggregated.csv"))
+        return root, _csv_rows(inputs)
+    return setup
+
+
+def _stats_ptp(state) -> Workload:
+    root, rows = state
+    for scenario in SCENARIOS:
+        ptp_stats_aggregated.write_scenario_stats(root, scenario)
+    return Workload(rows=rows)
+
+
+def _stats_ntpsec(state) -> Workload:
+    root, rows = state
+    stats_dirs = ntpsec_stats_aggregated.ensure_stats_dirs(root)
+    for scenario in SCENARIOS:
+        ntpsec_stats_aggregated.write_scenario_stats(root, scenario, stats_dirs[scenario])
+    return Workload(rows=rows)
+
+
+def _stats_chrony(state) -> Workload:
+    root, rows = state
+    stats_dirs = chrony_stats_aggregated.ensure_stats_dirs(root)
+    for scenario in SCENARIOS:
+        chrony_stats_aggregated.write_scenario_stats(root, scenario, stats_dirs[scenario])
+    return Workload(rows=rows)
+
+
+def _plot_setup(info: CorpusInfo) -> object:
+    runs = _aggregate_ptp_setup(info)
+    tables = []
+    for scenario in SCENARIOS:
+        for role, metrics in (("boundary", ptp_v3.BOUNDARY_METRICS), ("client", ptp_v3.CLIENT_METRICS)):
+            for metric, (ylabel, _) in metrics.items():
+                df = ptp_v3.aggregate_metric(runs, role=role, scenario=scenario, metric=metric)
+                if not df.empty:
+                    tables.append((scenario, role, metric, ylabel, df))
+    outdir = Path(tempfile.mkdtemp(prefix="bench_plots_"))
+    return tables, outdir
+
+
+def _plot_ptp(state) -> Workload:
+    tables, outdir = state
+    rows = 0
+    for scenario, role, metric, ylabel, df in tables:
+        ptp_v3.plot_mean_ci(df, scenario, role, metric, ylabel, outdir / f"{role}_{scenario}_{metric}_ci.png")
+        ptp_v3.plot_mean_iqr_p10p90(df, scenario, role, metric, ylabel, outdir / f"{role}_{scenario}_{metric}_iqr.png")
+        rows += 2 * len(df)
+    return Workload(rows=rows)
+
+
+CASES: List[BenchCase] = [
+    BenchCase("parse.ptp4l_boundary", "parse", _parse_files_setup("ptp4l_boundary"), _parse_ptp("boundary")),
+    BenchCase("parse.ptp4l_client", "parse", _parse_files_setup("ptp4l_client"), _parse_ptp("client")),
+    BenchCase("parse.ntpq_client", "parse", _parse_files_setup("ntpq_client"), _parse_ntpq("client")),
+    BenchCase("parse.ntpq_boundary", "parse", _parse_files_setup("ntpq_boundary"), _parse_ntpq("boundary")),
+    BenchCase("parse.chrony_tracking", "parse", _parse_files_setup("chrony_tracking"), _parse_chrony_tracking),
+    BenchCase("parse.chrony_sourcestats", "parse", _parse_files_setup("chrony_sourcestats"), _parse_chrony_sourcestats),
+    BenchCase("aggregate.ptp", "aggregate", _aggregate_ptp_setup, _aggregate_ptp),
+    BenchCase("aggregate.ntpsec", "aggregate", _ntpsec_runs, _aggregate_ntpsec),
+    BenchCase("aggregate.chrony", "aggregate", _chrony_frames, _aggregate_chrony),
+    BenchCase("stats.ptp", "stats", _stats_setup("ptp"), _stats_ptp),
+    BenchCase("stats.ntpsec", "stats", _stats_setup("ntpsec"), _stats_ntpsec),
+    BenchCase("stats.chrony", "stats", _stats_setup("chrony_servergm"), _stats_chrony),
+    BenchCase("plot.ptp", "plot", _plot_setup, _plot_ptp),
+]
+
+
+# ----------------------------
+# Runner
+# ----------------------------
+
+def prepare_outputs(info: CorpusInfo, jobs: int) -> None:
+    """Esegue i driver v3 sul corpus: gli script di statistiche leggono le loro uscite."""
+    for module, campaign in ((ptp_v3, "ptp"), (ntpsec_v3, "ntpsec"), (chrony_v3, "chrony_servergm")):
+        module.run_campaign(argparse.Namespace(root=info.root / campaign, jobs=jobs, io_threads=0, low_memory=False, out_of_core="chunked"))
+
+
+def _reset_peak_rss() -> None:
+    # "5" in clear_refs azzera VmHWM (Linux >= 4.0)
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _case_peak_rss() -> int:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            m = re.search(r"^VmHWM:\s+(\d+) kB", f.read(), re.MULTILINE)
+    except OSError:
+        m = None
+    return int(m.group(1)) * 1024 if m else peak_rss()
+
+
+def _run_case(case_idx: int, info: CorpusInfo, repeat: int, warmup: int) -> Dict[str, object]:
+    case = CASES[case_idx]
+    base_rss = current_rss()
+    _reset_peak_rss()
+    state = case.setup(info)
+    # la prima esecuzione paga cache del filesystem, compilazione delle regex e import pigri
+    for _ in range(warmup):
+        case.run(state)
+
+    times: List[float] = []
+    work = Workload()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        work = case.run(state)
+        times.append(time.perf_counter() - t0)
+
+    median_s = statistics.median(times)
+    return {
+        "case": case.name,
+        "group": case.group,
+        "scale": info.scale,
+        "runs_per_scenario": info.runs,
+        "repeat": repeat,
+        "warmup": warmup,
+        "times_s": [round(t, 6) for t in times],
+        "median_s": round(median_s, 6),
+        "min_s": round(min(times), 6),
+        "lines": work.lines,
+        "rows": work.rows,
+        "bytes": work.bytes,
+        "lines_per_s": round(work.lines / median_s, 1) if work.lines and median_s > 0 else None,
+        "rows_per_s": round(work.rows / median_s, 1) if work.rows and median_s > 0 else None,
+        "mb_per_s": round(work.bytes / 1e6 / median_s, 3) if work.bytes and median_s > 0 else None,
+        # memoria del caso (setup compreso), senza quella ereditata dal parent
+        "peak_rss_mb": round(max(_case_peak_rss() - base_rss, 0) / (1024.0 * 1024.0), 1),
+        "base_rss_mb": round(base_rss / (1024.0 * 1024.0), 1),
+    }
+
+
+def run_case_isolated(case: BenchCase, info: CorpusInfo, repeat: int, warmup: int = 1) -> Dict[str, object]:
+    # fork: il figlio eredita moduli e corpus (e il loro RSS, tolto in _run_case);
+    # al figlio passa solo l'indice del caso (setup/run sono closure non serializzabili)
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("fork")) as ex:
+        return ex.submit(_run_case, CASES.index(case), info, repeat, warmup).result()
+
+
+def git_commit(repo_dir: Path) -> Dict[str, object]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=repo_dir, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def select_cases(patterns: Optional[List[str]]) -> List[BenchCase]:
+    if not patterns:
+        return list(CASES)
+    return [c for c in CASES if any(p in c.name for p in patterns)]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark parsers, aggregation, stats and plots on a synthetic corpus.")
+    ap.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="Campaign sizes (x real run length)")
+    ap.add_argument("--runs", type=int, default=15, help="Runs per scenario in the synthetic corpus")
+    ap.add_argument("--repeat", type=int, default=3, help="Timed repetitions per case")
+    ap.add_argument("--warmup", type=int, default=1, help="Untimed runs per case before the timed ones")
+    ap.add_argument("--only", nargs="+", default=None, help="Run only cases whose name contains one of these")
+    ap.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus")
+    ap.add_argument("--jobs", type=int, default=1, help="Worker processes used to prepare driver outputs for stats")
+    ap.add_argument("--workdir", type=Path, default=None, help="Where to write the corpus (default: temp dir)")
+    ap.add_argument("--keep", action="store_true", help="Keep the generated corpus")
+    ap.add_argument("--out", type=Path, default=DEFAULT_OUT, help="JSON results file")
+    ap.add_argument(
+        "--check",
+        action="store_true",
+        help="Record the results in the history and exit non-zero on a regression (see bench_history.py)",
+    )
+    add_threshold_args(ap)
+    args = ap.parse_args()
+
+    cases = select_cases(args.only)
+    if not cases:
+        raise SystemExit(f"Nessun caso corrisponde a {args.only}")
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="tesi_bench_"))
+    results: List[Dict[str, object]] = []
+    corpora: List[Dict[str, object]] = []
+
+    try:
+        for scale in args.scales:
+            root = workdir / f"x{scale}"
+            if root.exists():
+                shutil.rmtree(root)
+
+            t0 = time.perf_counter()
+            info = write_campaign(root, scale=scale, runs=args.runs, seed=args.seed)
+            corpora.append({
+                "scale": scale,
+                "runs_per_scenario": args.runs,
+                "bytes": {kind: info.total_bytes(kind) for kind in info.files},
+                "generate_s": round(time.perf_counter() - t0, 3),
+            })
+            print(f"[OK] Corpus x{scale}: {sum(corpora[-1]['bytes'].values()) / 1e6:.1f} MB")
+
+            if any(c.group == "stats" for c in cases):
+                prepare_outputs(info, args.jobs)
+
+            for case in cases:
+                res = run_case_isolated(case, info, args.repeat, args.warmup)
+                results.append(res)
+                rate = res["lines_per_s"] or res["rows_per_s"]
+                unit = "lines/s" if res["lines_per_s"] else "rows/s"
+                print(
+                    f"  {case.name:<28} x{scale:<4} median {res['median_s']:8.3f}s  "
+                    f"{rate or 0:>12,.0f} {unit}  peak RSS {res['peak_rss_mb']:.0f} MB"
+                )
+
+            if not args.keep:
+                shutil.rmtree(root, ignore_errors=True)
+    finally:
+        if args.workdir is None and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    payload = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_commit(CODE_DIR),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "corpora": corpora,
+        "results": results,
+    }
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(payload, indent=1), encoding="utf-8")
+    print(f"[OK] Risultati salvati in: {args.out}")
+
+    if args.check:
+        sys.exit(check(args.out, args.history, **threshold_kwargs(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+
+# Generatori deterministici di log sintetici con la stessa forma di quelli raccolti da
+# bootstrapT3_V2.sh: ptp4l boundary/client, snapshot ntpq -p, serie chronyc SAMPLE.
+# scale=1 produce run lunghe come quelle reali; scale=N le allunga di N volte.
+
+SCENARIOS = ["low", "medium", "high"]
+
+# deviazione standard del rumore di offset per scenario (ns), come i profili netem low/medium/high
+JITTER_NS = {"low": 40_000.0, "medium": 150_000.0, "high": 450_000.0}
+
+# lunghezza di una run reale a scale=1
+PTP_BOUNDARY_SAMPLES = 240
+PTP_CLIENT_SUMMARIES = 110
+NTPQ_SNAPSHOTS = 100
+CHRONY_SAMPLES = 20
+
+GM_ID = "52e72c.fffe.0d2a76"
+BOUNDARY_ID = "3ec19a.fffe.f22d17"
+CLIENT_ID = "026365.fffe.e2fb2c"
+
+
+@dataclass
+class CorpusInfo:
+    root: Path
+    scale: int
+    runs: int
+    files: Dict[str, List[Path]] = field(default_factory=dict)
+
+    def total_bytes(self, kind: str) -> int:
+        return sum(p.stat().st_size for p in self.files.get(kind, []))
+
+
+def _rng(seed: int, *keys: int) -> np.random.Generator:
+    return np.random.default_rng([seed, *keys])
+
+
+def _ptp_line(t: float, msg: str) -> str:
+    return f"ptp4l[{t:.3f}]: {msg}"
+
+
+# ----------------------------
+# ptp4l
+# ----------------------------
+
+def _fault_episode(t: float, port: int) -> List[str]:
+    return [
+        _ptp_line(t, "timed out while polling for tx timestamp"),
+        _ptp_line(t, "increasing tx_timestamp_timeout may correct this issue, but it is likely caused by a driver bug"),
+        _ptp_line(t, f"port {port}: send sync failed"),
+        _ptp_line(t, f"port {port}: MASTER to FAULTY on FAULT_DETECTED (FT_UNSPECIFIED)"),
+    ]
+
+
+def ptp_boundary_log(rng: np.random.Generator, scenario: str, n_samples: int, t0: float = 5192.852) -> str:
+    jitter = JITTER_NS[scenario]
+    lines = [
+        _ptp_line(t0, "port 1: INITIALIZING to LISTENING on INIT_COMPLETE"),
+        _ptp_line(t0 + 0.001, "port 2: INITIALIZING to LISTENING on INIT_COMPLETE"),
+        _ptp_line(t0 + 0.001, "port 0: INITIALIZING to LISTENING on INIT_COMPLETE"),
+        _ptp_line(t0 + 3.256, f"port 1: new foreign master {GM_ID}-1"),
+        _ptp_line(t0 + 6.045, "port 1: LISTENING to MASTER on ANNOUNCE_RECEIPT_TIMEOUT_EXPIRES"),
+        _ptp_line(t0 + 6.046, f"selected local clock {BOUNDARY_ID} as best master"),
+        _ptp_line(t0 + 6.046, "port 1: assuming the grand master role"),
+        _ptp_line(t0 + 7.260, f"selected best master clock {GM_ID}"),
+        _ptp_line(t0 + 7.260, "foreign master not using PTP timescale"),
+        _ptp_line(t0 + 7.260, "port 1: MASTER to UNCALIBRATED on RS_SLAVE"),
+        _ptp_line(t0 + 7.826, "port 2: LISTENING to MASTER on ANNOUNCE_RECEIPT_TIMEOUT_EXPIRES"),
+    ]
+
+    # s0 per qualche secondo, un s1, poi s2 con offset AR(1); ogni tanto una perdita di lock
+    n_s0 = int(rng.integers(5, 25))
+    offset = 0.0
+    delay = 600_000.0 + rng.normal(0.0, jitter)
+    freq = -1_500_000
+    t = t0 + 9.263
+    fault_until = -1.0
+    state = 0
+    for i in range(n_samples):
+        t += 1.0 + rng.normal(0.0, 0.0005)
+
+        if i < n_s0:
+            state = 0
+            offset = rng.normal(0.0, 3.0 * jitter)
+        elif i == n_s0:
+            state = 1
+            offset = rng.normal(0.0, jitter)
+            freq = int(rng.normal(1_200_000, 30_000))
+        else:
+            if state != 2:
+                lines.append(_ptp_line(t - 0.001, "port 1: UNCALIBRATED to SLAVE on MASTER_CLOCK_SELECTED"))
+            state = 2
+            offset = 0.7 * offset + rng.normal(0.0, jitter)
+            freq += int(rng.normal(0.0, 300.0))
+            if rng.random() < 0.004:
+                # re-selezione: il servo riparte da s0
+                lines.append(_ptp_line(t - 0.002, "port 1: SLAVE to UNCALIBRATED on SYNCHRONIZATION_FAULT"))
+                lines.append(_ptp_line(t - 0.001, "clockcheck: clock jumped forward or running faster than expected!"))
+                n_s0 = i + int(rng.integers(2, 6))
+                state = 0
+
+        if rng.random() < 0.3:
+            delay = 600_000.0 + abs(rng.normal(0.0, jitter))
+
+        lines.append(
+            _ptp_line(t, f"master offset {int(offset):10d} s{state} freq {freq:+d} path delay {int(delay):9d}")
+        )
+
+        if t > fault_until and rng.random() < 0.01:
+            lines.extend(_fault_episode(t + 0.3, port=2))
+            fault_until = t + 16.0
+        elif 0 < fault_until <= t:
+            lines.append(_ptp_line(t + 0.2, "port 2: FAULTY to LISTENING on INIT_COMPLETE"))
+            fault_until = -1.0
+
+    return "\n".join(lines) + "\n"
+
+
+def ptp_client_log(rng: np.random.Generator, scenario: str, n_summaries: int, t0: float = 5196.246) -> str:
+    jitter = JITTER_NS[scenario]
+    lines = [
+        _ptp_line(t0, "port 1: INITIALIZING to LISTENING on INIT_COMPLETE"),
+        _ptp_line(t0 + 0.001, "port 0: INITIALIZING to LISTENING on INIT_COMPLETE"),
+        _ptp_line(t0 + 4.440, f"port 1: new foreign master {BOUNDARY_ID}-2"),
+        _ptp_line(t0 + 6.672, f"selected local clock {CLIENT_ID} as best master"),
+        _ptp_line(t0 + 8.449, f"selected best master clock {GM_ID}"),
+        _ptp_line(t0 + 8.449, "foreign master not using PTP timescale"),
+        _ptp_line(t0 + 8.449, "port 1: LISTENING to UNCALIBRATED on RS_SLAVE"),
+    ]
+
+    t = t0 + 11.457
+    freq = int(rng.normal(1_200_000, 30_000))
+    locked = False
+    for i in range(n_summaries):
+        # summary_interval 1: una riga rms ogni 2 s
+        t += 2.0 + rng.normal(0.0, 0.002)
+        rms = abs(rng.normal(1.5 * jitter, 0.5 * jitter))
+        mx = rms * (1.0 + abs(rng.normal(0.3, 0.2)))
+        freq += int(rng.normal(0.0, 2_000.0))
+        delay = 600_000.0 + abs(rng.normal(0.0, jitter))
+        lines.append(
+            _ptp_line(
+                t,
+                f"rms {int(rms)} max {int(mx)} freq {freq:+d} +/- {int(abs(rng.normal(0, 15_000))):3d} "
+                f"delay {int(delay)} +/- {int(abs(rng.normal(0, jitter / 4))):3d}",
+            )
+        )
+        if not locked and i >= 1:
+            lines.append(_ptp_line(t, "port 1: UNCALIBRATED to SLAVE on MASTER_CLOCK_SELECTED"))
+            locked = True
+        elif locked and rng.random() < 0.01:
+            lines.append(_ptp_line(t + 0.5, "port 1: SLAVE to UNCALIBRATED on SYNCHRONIZATION_FAULT"))
+            lines.append(_ptp_line(t + 0.6, f"selected local clock {CLIENT_ID} as best master"))
+            lines.append(_ptp_line(t + 3.0, f"selected best master clock {GM_ID}"))
+            lines.append(_ptp_line(t + 3.0, "port 1: LISTENING to UNCALIBRATED on RS_SLAVE"))
+            locked = False
+
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------
+# ntpq -p snapshots
+# ----------------------------
+
+NTPQ_HEADER = (
+    "     remote           refid      st t when poll reach   delay   offset   jitter\n"
+    "==============================================================================="
+)
+
+
+def ntpq_snapshot_log(
+    rng: np.random.Generator,
+    scenario: str,
+    n_snapshots: int,
+    remote: str,
+    refid: str,
+    stratum: int,
+    start_s: int = 23 * 3600 + 50 * 60,
+) -> str:
+    # la run parte alle 23:50 per attraversare la mezzanotte (rollover HH:MM:SS)
+    jitter_ms = JITTER_NS[scenario] / 1e6
+    n_init = int(rng.integers(3, 12))
+    reach = 0
+    offset = 0.0
+    out = []
+    t = start_s
+    for i in range(n_snapshots):
+        t += 15 if rng.random() > 0.1 else 16
+        hh, mm, ss = (t // 3600) % 24, (t // 60) % 60, t % 60
+        out.append(f"--- {hh:02d}:{mm:02d}:{ss:02d} ---")
+        out.append(NTPQ_HEADER)
+        if i < n_init:
+            out.append(f" {remote:<15} .INIT.          16 u    -   64    0   0.0000   0.0000   0.0002")
+            continue
+
+        reach = ((reach << 1) | int(rng.random() > 0.02)) & 0xFF
+        offset = 0.8 * offset + rng.normal(0.0, jitter_ms)
+        delay = 5.0 + abs(rng.normal(0.0, 2.0 * jitter_ms))
+        tally = "*" if i >= n_init + 2 else ("+" if rng.random() < 0.5 else " ")
+        when = int(rng.integers(1, 64))
+        out.append(
+            f"{tally}{remote:<15} {refid:<15} {stratum:2d} u {when:4d}   64  {reach:3o}"
+            f" {delay:8.4f} {offset:8.4f} {abs(rng.normal(0.0, jitter_ms)):8.4f}"
+        )
+    return "\n".join(out) + "\n"
+
+
+# ----------------------------
+# chronyc tracking / sourcestats
+# ----------------------------
+
+def _with_unit(value_s: float, rng: np.random.Generator) -> str:
+    # chronyc passa all'unita' successiva oltre 9999; in piu' una parte dei valori va in ms
+    # con decimali, cosi' il parser vede tutte e tre le unita' in ogni scenario
+    mag = abs(value_s)
+    if mag >= 1e-4 and rng.random() < 0.1:
+        return f"{value_s * 1e3:.3f}ms"
+    if mag < 1e-5:
+        return f"{value_s * 1e9:.0f}ns"
+    if mag < 1e-2:
+        return f"{value_s * 1e6:.0f}us"
+    return f"{value_s * 1e3:.0f}ms"
+
+
+def chrony_tracking_series(
+    rng: np.random.Generator, scenario: str, n_samples: int, start: datetime, source: str = "servergm"
+) -> str:
+    jitter_s = JITTER_NS[scenario] / 1e9
+    blocks = []
+    system = 0.0
+    t = start
+    for i in range(n_samples):
+        t += timedelta(seconds=61 + int(rng.integers(0, 3)))
+        system = 0.6 * system + rng.normal(0.0, jitter_s / 10.0)
+        last = rng.normal(0.0, jitter_s)
+        blocks.append(
+            "\n".join(
+                [
+                    f"===== SAMPLE {i + 1}/{n_samples} @ {t.isoformat(timespec='seconds')} =====",
+                    f"Reference ID    : 0A000A01 ({source})",
+                    "Stratum         : 9",
+                    f"Ref time (UTC)  : {t.strftime('%a %b %d %H:%M:%S %Y')}",
+                    f"System time     : {abs(system):.9f} seconds {'fast' if system >= 0 else 'slow'} of NTP time",
+                    f"Last offset     : {last:+.9f} seconds",
+                    f"RMS offset      : {abs(rng.normal(jitter_s, jitter_s / 3)):.9f} seconds",
+                    f"Frequency       : {402.983 + rng.normal(0.0, 0.5):.3f} ppm slow",
+                    f"Residual freq   : {rng.normal(0.0, 0.2):+.3f} ppm",
+                    f"Skew            : {abs(rng.normal(3.0, 1.0)):.3f} ppm",
+                    f"Root delay      : {0.000226664 + abs(rng.normal(0.0, jitter_s)):.9f} seconds",
+                    f"Root dispersion : {0.0005 + 0.0003 * (i % 10):.9f} seconds",
+                    "Update interval : 8.1 seconds",
+                    "Leap status     : Normal",
+                ]
+            )
+        )
+    return "\n\n".join(blocks) + "\n"
+
+
+def chrony_sourcestats_series(
+    rng: np.random.Generator, scenario: str, n_samples: int, start: datetime, source: str = "servergm"
+) -> str:
+    jitter_s = JITTER_NS[scenario] / 1e9
+    blocks = []
+    offset = 0.0
+    t = start
+    for i in range(n_samples):
+        t += timedelta(seconds=61 + int(rng.integers(0, 3)))
+        offset = 0.7 * offset + rng.normal(0.0, jitter_s)
+        np_ = min(6 + 5 * i, 64)
+        row = (
+            f"{source:<24} {np_:4d} {max(np_ // 2, 3):3d} {min(20 * (i + 1), 1000):5d}"
+            f" {rng.normal(0.0, 1.0):10.3f} {abs(rng.normal(10.0, 5.0)):10.3f}"
+            f" {_with_unit(offset, rng):>8} {_with_unit(abs(rng.normal(jitter_s, jitter_s / 4)), rng):>7}"
+        )
+        blocks.append(
+            "\n".join(
+                [
+                    f"===== SAMPLE {i + 1}/{n_samples} @ {t.isoformat(timespec='seconds')} =====",
+                    "Name/IP Address            NP  NR  Span  Frequency  Freq Skew  Offset  Std Dev",
+                    "==============================================================================",
+                    row,
+                ]
+            )
+        )
+    return "\n\n".join(blocks) + "\n"
+
+
+# ----------------------------
+# Campaign writer
+# ----------------------------
+
+def write_campaign(root: Path, scale: int = 1, runs: int = 15, seed: int = 0) -> CorpusInfo:
+    """Scrive <root>/{ptp,ntpsec,chrony_servergm}/<scenario>/runNN con log lunghi scale volte quelli reali."""
+    info = CorpusInfo(root=root, scale=scale, runs=runs)
+    start = datetime(2026, 4, 5, 7, 44, 13, tzinfo=timezone.utc)
+
+    for s_idx, scenario in enumerate(SCENARIOS):
+        for r in range(1, runs + 1):
+            keys = (s_idx, r)
+
+            run_dir = root / "ptp" / scenario / f"run{r:02d}"
+            run_dir.mkdir(parents=True, exist_ok=True)
+            files = {
+                "ptp4l_boundary": (run_dir / "ptp_boundary.log",
+                                   ptp_boundary_log(_rng(seed, 0, *keys), scenario, PTP_BOUNDARY_SAMPLES * scale)),
+                "ptp4l_client": (run_dir / "ptp_client.log",
+                                 ptp_client_log(_rng(seed, 1, *keys), scenario, PTP_CLIENT_SUMMARIES * scale)),
+            }
+
+            run_dir = root / "ntpsec" / scenario / f"run{r:02d}"
+            run_dir.mkdir(parents=True, exist_ok=True)
+            files["ntpq_client"] = (
+                run_dir / "ntp_client_live.log",
+                ntpq_snapshot_log(_rng(seed, 2, *keys), scenario, NTPQ_SNAPSHOTS * scale, "boundary1", "10.0.10.4", 10),
+            )
+            files["ntpq_boundary"] = (
+                run_dir / "ntp_boundary_live.log",
+                ntpq_snapshot_log(_rng(seed, 3, *keys), scenario, NTPQ_SNAPSHOTS * scale, "serverntp", "127.127.1.0", 9),
+            )
+
+            run_dir = root / "chrony_servergm" / scenario / f"run{r:02d}"
+            run_dir.mkdir(parents=True, exist_ok=True)
+            files["chrony_tracking"] = (
+                run_dir / "chrony_tracking_series.txt",
+                chrony_tracking_series(_rng(seed, 4, *keys), scenario, CHRONY_SAMPLES * scale, start),
+            )
+            files["chrony_sourcestats"] = (
+                run_dir / "chrony_sourcestats_series.txt",
+                chrony_sourcestats_series(_rng(seed, 5, *keys), scenario, CHRONY_SAMPLES * scale, start),
+            )
+
+            for kind, (path, text) in files.items():
+                path.write_text(text, encoding="utf-8")
+                info.files.setdefault(kind, []).append(path)
+
+    return info
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Generate a synthetic multi-run campaign (ptp, ntpsec, chrony).")
+    ap.add_argument("--out", type=Path, required=True, help="Output root (same layout as T3_multiplerun)")
+    ap.add_argument("--scale", type=int, default=1, help="Run length as a multiple of the real campaign")
+    ap.add_argument("--runs", type=int, default=15, help="Runs per scenario")
+    ap.add_argument("--seed", type=int, default=0, help="Seed of the deterministic generators")
+    args = ap.parse_args()
+
+    info = write_campaign(args.out, scale=args.scale, runs=args.runs, seed=args.seed)
+    total = sum(info.total_bytes(k) for k in info.files)
+    print(f"[OK] Corpus sintetico x{args.scale} in {args.out} ({total / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
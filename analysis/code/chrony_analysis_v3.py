@@ -5,7 +5,8 @@ from __future__ import annotations
 import argparse
 import math
 import re
-from dataclasses import dataclass
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
@@ -13,6 +14,33 @@ from typing import Dict, List, Optional, Tuple
 import matplotlib.pyplot as plt
 import pandas as pd
 
+from async_io import background_writer, prefetch_logs, read_text, save_current_figure, write_csv
+from atomic_output import campaign_outputs, output_inputs
+from chunked_aggregate import OutOfCoreAggregator, make_aggregator
+from frame_schema import compact_frame, disk_frame
+from memory_budget import (
+    SWITCH_FRACTION,
+    add_memory_args,
+    memory_session,
+    plan_for_logs,
+    should_switch,
+    switched_to_low_memory,
+)
+from outlier_filter import (
+    add_outlier_args,
+    add_outlier_masks,
+    configure_outlier_filter,
+    has_metric,
+    metric_frame,
+    outlier_filter_enabled,
+    with_filtered,
+)
+from parse_stats import ParseStats, write_parse_stats
+from profiling import add_profile_args, profile_session, profiled, stage
+from shm_frames import iter_shared
+from time_base import ISO_TIME_BASE, add_time_base_args, attach_utc, set_time_base, time_base_enabled
+from units import as_float, canonical_ns, ns_to, parse_ns, present_aggregate, storage_column
+
 
 RE_SAMPLE_HDR = re.compile(r"^=+\s*SAMPLE\s+\d+/\d+\s+@\s+(?P<ts>[^ ]+)\s*=+\s*$")
 
@@ -31,20 +59,36 @@ RE_SOURCESTATS_ROW = re.compile(
 
 RE_TABLE_SEPARATOR = re.compile(r"^=+\s*$")
 
+# altre righe "Campo : valore" di chronyc tracking (Stratum, Frequency, ...): note ma non usate
+RE_TRACKING_FIELD = re.compile(r"^[A-Za-z][A-Za-z ()/]*?\s*:\s")
+
+# metric -> (ylabel, ylim simmetrico), in unita' di presentazione: i frame hanno <grandezza>_ns interi
+TRACKING_METRICS = {
+    "system_time_us": ("system time offset (us)", True),
+    "last_offset_us": ("last offset (us)", True),
+}
+
+SOURCESTATS_METRICS = {
+    "offset_us": ("source offset (us)", True),
+    "stddev_us": ("std dev (us)", False),
+}
+
 
 @dataclass
 class TrackingSeries:
     t: List[datetime]
-    system_time_s: List[float]
-    last_offset_s: List[float]
+    system_time_ns: List[Optional[int]]
+    last_offset_ns: List[Optional[int]]
+    parse_stats: Dict[str, object] = field(default_factory=dict)
 
 
 @dataclass
 class SourceStatsSeries:
     t: List[datetime]
     source: List[str]
-    offset_s: List[float]
-    stddev_s: List[float]
+    offset_ns: List[int]
+    stddev_ns: List[int]
+    parse_stats: Dict[str, object] = field(default_factory=dict)
 
 
 @dataclass
@@ -54,6 +98,7 @@ class ParsedRun:
     run_dir: Path
     tracking_df: pd.DataFrame
     sourcestats_df: pd.DataFrame
+    parse_stats: List[Dict[str, object]] = field(default_factory=list)
 
 
 def parse_iso_ts(ts: str) -> datetime:
@@ -70,37 +115,31 @@ def to_rel_seconds(times: List[datetime]) -> List[float]:
     return [t.timestamp() - t0 for t in times]
 
 
-def parse_quantity_with_unit(s: str) -> float:
+def parse_quantity_ns(s: str) -> int:
     s = s.strip()
     m = re.fullmatch(r"(?P<num>[+-]?\d+(?:\.\d+)?)(?P<unit>ns|us|ms|s)?", s)
     if not m:
         raise ValueError(f"Cannot parse quantity: {s}")
-
-    num = float(m.group("num"))
-    unit = m.group("unit") or "s"
-
-    if unit == "s":
-        return num
-    if unit == "ms":
-        return num * 1e-3
-    if unit == "us":
-        return num * 1e-6
-    if unit == "ns":
-        return num * 1e-9
-
-    raise ValueError(f"Unknown unit: {unit}")
+    return parse_ns(m.group("num"), m.group("unit") or "s")
 
 
+@profiled("parse.chrony_tracking", args=("path",))
 def parse_tracking_series(path: Path) -> TrackingSeries:
-    lines = path.read_text(encoding="utf-8", errors="replace").splitlines()
+    stats = ParseStats(
+        "chrony.tracking",
+        path,
+        patterns=("sample_header", "system_time", "last_offset"),
+        required=("sample_header", "system_time"),
+    )
+    lines = read_text(path).splitlines()
 
     times: List[datetime] = []
-    system_time_s: List[float] = []
-    last_offset_s: List[float] = []
+    system_time_ns: List[Optional[int]] = []
+    last_offset_ns: List[Optional[int]] = []
 
     cur_ts: Optional[datetime] = None
-    cur_system: Optional[float] = None
-    cur_last: Optional[float] = None
+    cur_system: Optional[int] = None
+    cur_last: Optional[int] = None
 
     def flush_sample() -> None:
         nonlocal cur_ts, cur_system, cur_last
@@ -110,8 +149,8 @@ def parse_tracking_series(path: Path) -> TrackingSeries:
             cur_ts = None
             return
         times.append(cur_ts)
-        system_time_s.append(cur_system if cur_system is not None else float("nan"))
-        last_offset_s.append(cur_last if cur_last is not None else float("nan"))
+        system_time_ns.append(cur_system)
+        last_offset_ns.append(cur_last)
         cur_ts = None
         cur_system = None
         cur_last = None
@@ -119,36 +158,57 @@ def parse_tracking_series(path: Path) -> TrackingSeries:
     for line in lines:
         m = RE_SAMPLE_HDR.match(line.strip())
         if m:
+            stats.hit("sample_header")
             flush_sample()
             cur_ts = parse_iso_ts(m.group("ts"))
             continue
 
+        if not line.strip():
+            stats.skip("blank")
+            continue
+
         if cur_ts is None:
+            stats.skip("before_sample")
             continue
 
         m = RE_TRACKING_SYSTEM_TIME.match(line.strip())
         if m:
-            v = float(m.group("val"))
+            stats.hit("system_time")
+            v = parse_ns(m.group("val"), "s")
             dir_ = m.group("dir")
             cur_system = -v if dir_ == "slow" else +v
             continue
 
         m = RE_TRACKING_LAST_OFFSET.match(line.strip())
         if m:
-            cur_last = float(m.group("val"))
+            stats.hit("last_offset")
+            cur_last = parse_ns(m.group("val"), "s")
+            continue
+
+        if RE_TRACKING_FIELD.match(line.strip()):
+            stats.skip("other_field")
             continue
 
+        stats.miss(line)
+
     flush_sample()
-    return TrackingSeries(times, system_time_s, last_offset_s)
+    return TrackingSeries(times, system_time_ns, last_offset_ns, parse_stats=stats.finish(len(lines)).as_dict())
 
 
+@profiled("parse.chrony_sourcestats", args=("path",))
 def parse_sourcestats_series(path: Path) -> SourceStatsSeries:
-    lines = path.read_text(encoding="utf-8", errors="replace").splitlines()
+    stats = ParseStats(
+        "chrony.sourcestats",
+        path,
+        patterns=("sample_header", "source_row"),
+        required=("sample_header", "source_row"),
+    )
+    lines = read_text(path).splitlines()
 
     times: List[datetime] = []
     sources: List[str] = []
-    offsets: List[float] = []
-    stddevs: List[float] = []
+    offsets: List[int] = []
+    stddevs: List[int] = []
 
     cur_ts: Optional[datetime] = None
     in_table = False
@@ -158,34 +218,47 @@ def parse_sourcestats_series(path: Path) -> SourceStatsSeries:
 
         m = RE_SAMPLE_HDR.match(ls)
         if m:
+            stats.hit("sample_header")
             cur_ts = parse_iso_ts(m.group("ts"))
             in_table = False
             continue
 
+        if not ls:
+            stats.skip("blank")
+            continue
+
         if cur_ts is None:
+            stats.skip("before_sample")
             continue
 
         if RE_TABLE_SEPARATOR.match(ls):
+            stats.skip("separator")
             in_table = True
             continue
 
         if not in_table:
+            stats.skip("header")
             continue
 
         m = RE_SOURCESTATS_ROW.match(ls)
-        if m:
-            name = m.group("name")
-            off_s = parse_quantity_with_unit(m.group("offset"))
-            sd_s = parse_quantity_with_unit(m.group("stddev"))
+        if not m:
+            stats.miss(ls)
+            continue
 
-            times.append(cur_ts)
-            sources.append(name)
-            offsets.append(off_s)
-            stddevs.append(sd_s)
+        stats.hit("source_row")
+        name = m.group("name")
+        off_ns = parse_quantity_ns(m.group("offset"))
+        sd_ns = parse_quantity_ns(m.group("stddev"))
 
-    return SourceStatsSeries(times, sources, offsets, stddevs)
+        times.append(cur_ts)
+        sources.append(name)
+        offsets.append(off_ns)
+        stddevs.append(sd_ns)
 
+    return SourceStatsSeries(times, sources, offsets, stddevs, parse_stats=stats.finish(len(lines)).as_dict())
 
+
+@profiled("build.frames", args=("scenario", "run_id"))
 def build_tracking_df(ts: TrackingSeries, scenario: str, run_id: str) -> pd.DataFrame:
     if not ts.t:
         return pd.DataFrame()
@@ -199,16 +272,16 @@ def build_tracking_df(ts: TrackingSeries, scenario: str, run_id: str) -> pd.Data
             "t_s": ts.t[i].timestamp(),
             "t_rel_s": rel[i],
             "t_bin_s": round(rel[i]),
-            "system_time_s": ts.system_time_s[i],
-            "system_time_us": ts.system_time_s[i] * 1e6 if ts.system_time_s[i] == ts.system_time_s[i] else float("nan"),
-            "last_offset_s": ts.last_offset_s[i],
-            "last_offset_us": ts.last_offset_s[i] * 1e6 if ts.last_offset_s[i] == ts.last_offset_s[i] else float("nan"),
+            "system_time_ns": ts.system_time_ns[i],
+            "last_offset_ns": ts.last_offset_ns[i],
             "scenario": scenario,
             "run_id": run_id,
         })
-    return pd.DataFrame(rows)
+    df = compact_frame(canonical_ns(pd.DataFrame(rows)))
+    return attach_utc(df, ISO_TIME_BASE, "t_s") if time_base_enabled() else df
 
 
+@profiled("build.frames", args=("scenario", "run_id"))
 def build_sourcestats_df(ss: SourceStatsSeries, scenario: str, run_id: str) -> pd.DataFrame:
     if not ss.t:
         return pd.DataFrame()
@@ -223,14 +296,13 @@ def build_sourcestats_df(ss: SourceStatsSeries, scenario: str, run_id: str) -> p
             "t_rel_s": rel[i],
             "t_bin_s": round(rel[i]),
             "source": ss.source[i],
-            "offset_s": ss.offset_s[i],
-            "offset_us": ss.offset_s[i] * 1e6,
-            "stddev_s": ss.stddev_s[i],
-            "stddev_us": ss.stddev_s[i] * 1e6,
+            "offset_ns": ss.offset_ns[i],
+            "stddev_ns": ss.stddev_ns[i],
             "scenario": scenario,
             "run_id": run_id,
         })
-    return pd.DataFrame(rows)
+    df = compact_frame(canonical_ns(pd.DataFrame(rows)))
+    return attach_utc(df, ISO_TIME_BASE, "t_s") if time_base_enabled() else df
 
 
 def _t_critical_95(n: int) -> float:
@@ -250,24 +322,8 @@ def _t_critical_95(n: int) -> float:
     return 1.96
 
 
-def aggregate_metric(df_all: pd.DataFrame, scenario: str, metric: str, source: Optional[str] = None) -> pd.DataFrame:
-    if df_all.empty or metric not in df_all.columns:
-        return pd.DataFrame()
-
-    df = df_all[df_all["scenario"] == scenario].copy()
-
-    if source is not None and "source" in df.columns:
-        df = df[df["source"] == source].copy()
-
-    if df.empty:
-        return pd.DataFrame()
-
-    df = df[["sample_idx", metric, "run_id"]].copy()
-    df = df.dropna(subset=[metric])
-
-    if df.empty:
-        return pd.DataFrame()
-
+def aggregate_long(long_df: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """Statistiche per sample_idx su un frame long (sample_idx, metric, run_id); usata anche a blocchi."""
     def agg_fn(g: pd.DataFrame) -> pd.Series:
         vals = pd.to_numeric(g[metric], errors="coerce").dropna()
         n = len(vals)
@@ -295,7 +351,7 @@ def aggregate_metric(df_all: pd.DataFrame, scenario: str, metric: str, source: O
             "max": vals.max(),
         })
 
-    out = df.groupby("sample_idx", as_index=False).apply(agg_fn)
+    out = long_df.groupby("sample_idx", as_index=False).apply(agg_fn)
     if isinstance(out.index, pd.MultiIndex):
         out = out.reset_index()
     if "level_0" in out.columns:
@@ -303,6 +359,30 @@ def aggregate_metric(df_all: pd.DataFrame, scenario: str, metric: str, source: O
     return out
 
 
+@profiled("aggregate", args=("scenario", "metric", "source"))
+def aggregate_metric(df_all: pd.DataFrame, scenario: str, metric: str, source: Optional[str] = None) -> pd.DataFrame:
+    column, unit = storage_column(metric)
+    if df_all.empty or not has_metric(df_all, column):
+        return pd.DataFrame()
+
+    df = df_all[df_all["scenario"] == scenario].copy()
+
+    if source is not None and "source" in df.columns:
+        df = df[df["source"] == source].copy()
+
+    if df.empty:
+        return pd.DataFrame()
+
+    df = metric_frame(df, column)
+    df = df.dropna(subset=[column])
+
+    if df.empty:
+        return pd.DataFrame()
+
+    # statistiche sui ns interi, unita' della metrica solo sul risultato
+    return present_aggregate(aggregate_long(df, column), unit)
+
+
 def _compute_global_ylim(
     aggregated_tables: List[pd.DataFrame],
     lower_col: str,
@@ -310,23 +390,27 @@ def _compute_global_ylim(
     symmetric: bool,
     pad: float = 0.05,
 ) -> Optional[Tuple[float, float]]:
-    vals = []
+    # solo min e max correnti: niente liste Python con tutti i valori delle curve
+    lo: Optional[float] = None
+    hi: Optional[float] = None
     for df in aggregated_tables:
         if df.empty or lower_col not in df.columns or upper_col not in df.columns:
             continue
-        vals.extend(pd.to_numeric(df[lower_col], errors="coerce").dropna().tolist())
-        vals.extend(pd.to_numeric(df[upper_col], errors="coerce").dropna().tolist())
+        for col in (lower_col, upper_col):
+            vals = pd.to_numeric(df[col], errors="coerce").dropna()
+            if vals.empty:
+                continue
+            lo = float(vals.min()) if lo is None else min(lo, float(vals.min()))
+            hi = float(vals.max()) if hi is None else max(hi, float(vals.max()))
 
-    if not vals:
+    if lo is None:
         return None
 
     if symmetric:
-        m = max(abs(v) for v in vals)
+        m = max(abs(lo), abs(hi))
         m *= (1.0 + pad)
         return (-m, m)
 
-    lo = min(vals)
-    hi = max(vals)
     if lo > 0:
         lo = 0.0
     span = hi - lo
@@ -335,6 +419,7 @@ def _compute_global_ylim(
     return (lo, hi + pad * span)
 
 
+@profiled("plot.render", args=("title",))
 def plot_mean_ci(
     df: pd.DataFrame,
     title: str,
@@ -354,10 +439,10 @@ def plot_mean_ci(
         plt.ylim(*ylim)
     plt.legend()
     plt.tight_layout()
-    plt.savefig(outpath, dpi=200)
-    plt.close()
+    save_current_figure(outpath)
 
 
+@profiled("plot.render", args=("title",))
 def plot_mean_iqr_p10p90(
     df: pd.DataFrame,
     title: str,
@@ -378,10 +463,10 @@ def plot_mean_iqr_p10p90(
         plt.ylim(*ylim)
     plt.legend()
     plt.tight_layout()
-    plt.savefig(outpath, dpi=200)
-    plt.close()
+    save_current_figure(outpath)
 
 
+@profiled("summarize")
 def summarize_tracking_run(df: pd.DataFrame, scenario: str, run_id: str, run_dir: Path) -> pd.DataFrame:
     if df.empty:
         return pd.DataFrame([{
@@ -394,14 +479,15 @@ def summarize_tracking_run(df: pd.DataFrame, scenario: str, run_id: str, run_dir
         "scenario": scenario,
         "run_id": run_id,
         "run_dir": str(run_dir),
-        "system_time_mean_us": float(df["system_time_us"].mean()) if "system_time_us" in df else None,
-        "system_time_std_us": float(df["system_time_us"].std(ddof=1)) if "system_time_us" in df and len(df) > 1 else None,
-        "last_offset_mean_us": float(df["last_offset_us"].mean()) if "last_offset_us" in df else None,
-        "last_offset_std_us": float(df["last_offset_us"].std(ddof=1)) if "last_offset_us" in df and len(df) > 1 else None,
+        "system_time_mean_us": ns_to(as_float(df["system_time_ns"].mean()), "us") if "system_time_ns" in df else None,
+        "system_time_std_us": ns_to(as_float(df["system_time_ns"].std(ddof=1)), "us") if "system_time_ns" in df and len(df) > 1 else None,
+        "last_offset_mean_us": ns_to(as_float(df["last_offset_ns"].mean()), "us") if "last_offset_ns" in df else None,
+        "last_offset_std_us": ns_to(as_float(df["last_offset_ns"].std(ddof=1)), "us") if "last_offset_ns" in df and len(df) > 1 else None,
     }
     return pd.DataFrame([out])
 
 
+@profiled("summarize")
 def summarize_sourcestats_run(df: pd.DataFrame, scenario: str, run_id: str, run_dir: Path) -> pd.DataFrame:
     if df.empty:
         return pd.DataFrame([{
@@ -414,84 +500,155 @@ def summarize_sourcestats_run(df: pd.DataFrame, scenario: str, run_id: str, run_
         "scenario": scenario,
         "run_id": run_id,
         "run_dir": str(run_dir),
-        "offset_mean_us": float(df["offset_us"].mean()) if "offset_us" in df else None,
-        "offset_std_us": float(df["offset_us"].std(ddof=1)) if "offset_us" in df and len(df) > 1 else None,
-        "stddev_mean_us": float(df["stddev_us"].mean()) if "stddev_us" in df else None,
-        "stddev_std_us": float(df["stddev_us"].std(ddof=1)) if "stddev_us" in df and len(df) > 1 else None,
+        "offset_mean_us": ns_to(as_float(df["offset_ns"].mean()), "us") if "offset_ns" in df else None,
+        "offset_std_us": ns_to(as_float(df["offset_ns"].std(ddof=1)), "us") if "offset_ns" in df and len(df) > 1 else None,
+        "stddev_mean_us": ns_to(as_float(df["stddev_ns"].mean()), "us") if "stddev_ns" in df else None,
+        "stddev_std_us": ns_to(as_float(df["stddev_ns"].std(ddof=1)), "us") if "stddev_ns" in df and len(df) > 1 else None,
     }
     return pd.DataFrame([out])
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser(description="Parse and aggregate Chrony multi-run logs.")
-    ap.add_argument(
-        "--root",
-        type=Path,
-        required=True,
-        help="Root directory of Chrony multi-run logs, e.g. .../analysis/raw_logs/T3_multiplerun/chrony_servergm",
+@profiled("run", args=("scenario", "run_id"))
+def process_run_dir(run_dir: Path, scenario: str, run_id: str) -> Tuple[ParsedRun, pd.DataFrame, pd.DataFrame]:
+    tracking_path = run_dir / "chrony_tracking_series.txt"
+    sourcestats_path = run_dir / "chrony_sourcestats_series.txt"
+    tr = parse_tracking_series(tracking_path)
+    ss = parse_sourcestats_series(sourcestats_path)
+
+    tracking_df = build_tracking_df(tr, scenario, run_id)
+    sourcestats_df = build_sourcestats_df(ss, scenario, run_id)
+    if outlier_filter_enabled():
+        tracking_df = add_outlier_masks(tracking_df, [storage_column(m)[0] for m in TRACKING_METRICS], scenario, run_id)
+        sourcestats_df = add_outlier_masks(
+            sourcestats_df, [storage_column(m)[0] for m in SOURCESTATS_METRICS], scenario, run_id, by="source"
+        )
+
+    if not tracking_df.empty:
+        write_csv(disk_frame(tracking_df), run_dir / "parsed_tracking.csv", inputs=[tracking_path])
+    if not sourcestats_df.empty:
+        write_csv(disk_frame(sourcestats_df), run_dir / "parsed_sourcestats.csv", inputs=[sourcestats_path])
+
+    run = ParsedRun(
+        scenario=scenario,
+        run_id=run_id,
+        run_dir=run_dir,
+        tracking_df=tracking_df,
+        sourcestats_df=sourcestats_df,
+        parse_stats=[tr.parse_stats, ss.parse_stats],
     )
-    args = ap.parse_args()
+    return (
+        run,
+        summarize_tracking_run(tracking_df, scenario, run_id, run_dir),
+        summarize_sourcestats_run(sourcestats_df, scenario, run_id, run_dir),
+    )
+
+
+def _out_of_core(args: argparse.Namespace, budget_bytes: Optional[int]) -> OutOfCoreAggregator:
+    return make_aggregator(args.out_of_core, aggregate_long, _t_critical_95, budget_bytes)
+
+
+def _stream_run(streaming: OutOfCoreAggregator, run: ParsedRun) -> None:
+    for metric in with_filtered(TRACKING_METRICS):
+        column = storage_column(metric)[0]
+        if has_metric(run.tracking_df, column):
+            streaming.add_frame(("tracking", run.scenario, metric, None), metric_frame(run.tracking_df, column), column)
+    ss = run.sourcestats_df
+    if ss.empty or "source" not in ss.columns:
+        return
+    for source, df in ss.groupby("source", sort=False, observed=True):
+        for metric in with_filtered(SOURCESTATS_METRICS):
+            column = storage_column(metric)[0]
+            if has_metric(df, column):
+                streaming.add_frame(("sourcestats", run.scenario, metric, source), metric_frame(df, column), column)
+
 
+def run_campaign(args: argparse.Namespace) -> None:
     root = args.root
     scenarios = ["low", "medium", "high"]
+    stage("discover")
 
     parsed_runs: List[ParsedRun] = []
     tracking_summaries: List[pd.DataFrame] = []
     sourcestats_summaries: List[pd.DataFrame] = []
 
+    tasks = []
     for scenario in scenarios:
         scenario_dir = root / scenario
         if not scenario_dir.exists():
             continue
 
         for run_dir in sorted([p for p in scenario_dir.iterdir() if p.is_dir() and p.name.startswith("run")]):
-            run_id = run_dir.name
-
             tracking_path = run_dir / "chrony_tracking_series.txt"
             sourcestats_path = run_dir / "chrony_sourcestats_series.txt"
 
             if not tracking_path.exists() or not sourcestats_path.exists():
                 continue
 
-            tr = parse_tracking_series(tracking_path)
-            ss = parse_sourcestats_series(sourcestats_path)
-
-            tracking_df = build_tracking_df(tr, scenario, run_id)
-            sourcestats_df = build_sourcestats_df(ss, scenario, run_id)
-
-            if not tracking_df.empty:
-                tracking_df.to_csv(run_dir / "parsed_tracking.csv", index=False)
-            if not sourcestats_df.empty:
-                sourcestats_df.to_csv(run_dir / "parsed_sourcestats.csv", index=False)
-
-            parsed_runs.append(
-                ParsedRun(
-                    scenario=scenario,
-                    run_id=run_id,
-                    run_dir=run_dir,
-                    tracking_df=tracking_df,
-                    sourcestats_df=sourcestats_df,
-                )
-            )
-
-            tracking_summaries.append(summarize_tracking_run(tracking_df, scenario, run_id, run_dir))
-            sourcestats_summaries.append(summarize_sourcestats_run(sourcestats_df, scenario, run_id, run_dir))
+            tasks.append((run_dir, scenario, run_dir.name))
 
+    scenario_logs: Dict[str, List[Path]] = {}
+    for run_dir, scenario, _ in tasks:
+        scenario_logs.setdefault(scenario, []).extend(
+            run_dir / name for name in ("chrony_tracking_series.txt", "chrony_sourcestats_series.txt")
+        )
+    all_logs = [p for scenario in scenarios for p in scenario_logs.get(scenario, [])]
+
+    # oltre il budget di memoria: uno scenario alla volta e curve aggregate fuori memoria
+    # (a blocchi di sample_idx da colonne su disco, o in streaming con --out-of-core sketch)
+    plan = plan_for_logs(all_logs, force_low_memory=args.low_memory)
+    streaming: Optional[OutOfCoreAggregator] = _out_of_core(args, plan.budget_bytes) if plan.low_memory else None
+    groups = [[t for t in tasks if t[1] == scenario] for scenario in scenarios] if plan.low_memory else [tasks]
+
+    stage("parse")
+    run_parse_stats: Dict[Path, List[Dict[str, object]]] = {}
+    for group in groups:
+        # prefetch dei log solo nel percorso seriale: con --jobs ogni worker legge i propri
+        prefetch = [
+            run_dir / name
+            for run_dir, _, _ in group
+            for name in ("chrony_tracking_series.txt", "chrony_sourcestats_series.txt")
+        ] if args.jobs <= 1 and args.io_threads > 0 else []
+        with prefetch_logs(prefetch):
+            for run, tracking_summary, sourcestats_summary in iter_shared(process_run_dir, group, jobs=args.jobs):
+                run_parse_stats[run.run_dir] = run.parse_stats
+                tracking_summaries.append(tracking_summary)
+                sourcestats_summaries.append(sourcestats_summary)
+
+                if streaming is None and should_switch():
+                    switched_to_low_memory(f"RSS oltre il {SWITCH_FRACTION:.0%} del budget durante il parsing")
+                    streaming = _out_of_core(args, plan.budget_bytes)
+                    for kept in parsed_runs:
+                        _stream_run(streaming, kept)
+                    parsed_runs.clear()
+
+                if streaming is not None:
+                    _stream_run(streaming, run)
+                else:
+                    parsed_runs.append(run)
+
+    stage("summaries")
     agg_root = root / "_aggregated"
     tracking_dir = agg_root / "tracking"
     sourcestats_dir = agg_root / "sourcestats"
     tracking_dir.mkdir(parents=True, exist_ok=True)
     sourcestats_dir.mkdir(parents=True, exist_ok=True)
 
+    write_parse_stats(root, run_parse_stats)
+
     if tracking_summaries:
-        pd.concat(tracking_summaries, ignore_index=True).to_csv(
-            agg_root / "tracking_summary_all_runs.csv", index=False
+        write_csv(
+            pd.concat(tracking_summaries, ignore_index=True),
+            agg_root / "tracking_summary_all_runs.csv",
+            inputs=all_logs,
         )
     if sourcestats_summaries:
-        pd.concat(sourcestats_summaries, ignore_index=True).to_csv(
-            agg_root / "sourcestats_summary_all_runs.csv", index=False
+        write_csv(
+            pd.concat(sourcestats_summaries, ignore_index=True),
+            agg_root / "sourcestats_summary_all_runs.csv",
+            inputs=all_logs,
         )
 
+    stage("aggregate")
     tracking_all = pd.concat(
         [r.tracking_df for r in parsed_runs if not r.tracking_df.empty],
         ignore_index=True
@@ -502,16 +659,9 @@ def main() -> None:
         ignore_index=True
     ) if parsed_runs else pd.DataFrame()
 
-    tracking_metrics = {
-        "system_time_us": ("system time offset (us)", True),
-        "last_offset_us": ("last offset (us)", True),
-    }
-
+    tracking_metrics = with_filtered(TRACKING_METRICS)
     # per sourcestats conviene aggregare per metrica e per source
-    sourcestats_metrics = {
-        "offset_us": ("source offset (us)", True),
-        "stddev_us": ("std dev (us)", False),
-    }
+    sourcestats_metrics = with_filtered(SOURCESTATS_METRICS)
 
     tracking_tables: Dict[Tuple[str, str], pd.DataFrame] = {}
     sourcestats_tables: Dict[Tuple[str, str, str], pd.DataFrame] = {}
@@ -523,7 +673,9 @@ def main() -> None:
     sourcestats_iqr_tables: Dict[Tuple[str, str], List[pd.DataFrame]] = {}
 
     available_sources = []
-    if not sourcestats_all.empty and "source" in sourcestats_all.columns:
+    if streaming is not None:
+        available_sources = sorted({key[3] for key in streaming.keys() if key[0] == "sourcestats"})
+    elif not sourcestats_all.empty and "source" in sourcestats_all.columns:
         available_sources = sorted(sourcestats_all["source"].dropna().unique().tolist())
 
     for metric in sourcestats_metrics:
@@ -533,7 +685,10 @@ def main() -> None:
 
     for scenario in scenarios:
         for metric in tracking_metrics:
-            df = aggregate_metric(tracking_all, scenario=scenario, metric=metric)
+            if streaming is not None:
+                df = present_aggregate(streaming.result(("tracking", scenario, metric, None)), storage_column(metric)[1])
+            else:
+                df = aggregate_metric(tracking_all, scenario=scenario, metric=metric)
             tracking_tables[(scenario, metric)] = df
             if not df.empty:
                 tracking_ci_tables[metric].append(df)
@@ -541,12 +696,22 @@ def main() -> None:
 
         for metric in sourcestats_metrics:
             for source in available_sources:
-                df = aggregate_metric(sourcestats_all, scenario=scenario, metric=metric, source=source)
+                if streaming is not None:
+                    df = present_aggregate(
+                        streaming.result(("sourcestats", scenario, metric, source)), storage_column(metric)[1]
+                    )
+                else:
+                    df = aggregate_metric(sourcestats_all, scenario=scenario, metric=metric, source=source)
                 sourcestats_tables[(scenario, metric, source)] = df
                 if not df.empty:
                     sourcestats_ci_tables[(metric, source)].append(df)
                     sourcestats_iqr_tables[(metric, source)].append(df)
 
+    if streaming is not None:
+        if streaming.note():
+            print(f"[INFO] {streaming.note()}")
+        streaming.close()
+
     tracking_ylims_ci = {
         metric: _compute_global_ylim(tbls, "ci95_low", "ci95_high", symmetric=sym)
         for metric, (_, sym) in tracking_metrics.items()
@@ -571,65 +736,104 @@ def main() -> None:
         for tbls in [sourcestats_iqr_tables[(metric, source)]]
     }
 
+    stage("plot")
     for scenario in scenarios:
-        scenario_tracking_dir = tracking_dir / scenario
-        scenario_sourcestats_dir = sourcestats_dir / scenario
-        scenario_tracking_dir.mkdir(parents=True, exist_ok=True)
-        scenario_sourcestats_dir.mkdir(parents=True, exist_ok=True)
-
-        for metric, (ylabel, _) in tracking_metrics.items():
-            df = tracking_tables.get((scenario, metric), pd.DataFrame())
-            if df.empty:
-                continue
-
-            df.to_csv(scenario_tracking_dir / f"{metric}_aggregated.csv", index=False)
-
-            plot_mean_ci(
-                df=df,
-                title=f"tracking - {scenario} - {metric} - mean + 95% CI",
-                ylabel=ylabel,
-                outpath=scenario_tracking_dir / f"{metric}_mean_ci95.png",
-                ylim=tracking_ylims_ci[metric],
-            )
-
-            plot_mean_iqr_p10p90(
-                df=df,
-                title=f"tracking - {scenario} - {metric} - mean + IQR + p10/p90",
-                ylabel=ylabel,
-                outpath=scenario_tracking_dir / f"{metric}_mean_iqr_p10_p90.png",
-                ylim=tracking_ylims_iqr[metric],
-            )
-
-        for metric, (ylabel, _) in sourcestats_metrics.items():
-            for source in available_sources:
-                df = sourcestats_tables.get((scenario, metric, source), pd.DataFrame())
+        with output_inputs(scenario_logs.get(scenario, [])):
+            scenario_tracking_dir = tracking_dir / scenario
+            scenario_sourcestats_dir = sourcestats_dir / scenario
+            scenario_tracking_dir.mkdir(parents=True, exist_ok=True)
+            scenario_sourcestats_dir.mkdir(parents=True, exist_ok=True)
+
+            for metric, (ylabel, _) in tracking_metrics.items():
+                df = tracking_tables.get((scenario, metric), pd.DataFrame())
                 if df.empty:
                     continue
 
-                safe_source = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(source))
-                source_dir = scenario_sourcestats_dir / safe_source
-                source_dir.mkdir(parents=True, exist_ok=True)
-
-                df.to_csv(source_dir / f"{metric}_aggregated.csv", index=False)
+                write_csv(df, scenario_tracking_dir / f"{metric}_aggregated.csv")
 
                 plot_mean_ci(
                     df=df,
-                    title=f"sourcestats - {scenario} - {safe_source} - {metric} - mean + 95% CI",
+                    title=f"tracking - {scenario} - {metric} - mean + 95% CI",
                     ylabel=ylabel,
-                    outpath=source_dir / f"{metric}_mean_ci95.png",
-                    ylim=sourcestats_ylims_ci[(metric, source)],
+                    outpath=scenario_tracking_dir / f"{metric}_mean_ci95.png",
+                    ylim=tracking_ylims_ci[metric],
                 )
 
                 plot_mean_iqr_p10p90(
                     df=df,
-                    title=f"sourcestats - {scenario} - {safe_source} - {metric} - mean + IQR + p10/p90",
+                    title=f"tracking - {scenario} - {metric} - mean + IQR + p10/p90",
                     ylabel=ylabel,
-                    outpath=source_dir / f"{metric}_mean_iqr_p10_p90.png",
-                    ylim=sourcestats_ylims_iqr[(metric, source)],
+                    outpath=scenario_tracking_dir / f"{metric}_mean_iqr_p10_p90.png",
+                    ylim=tracking_ylims_iqr[metric],
                 )
 
+            for metric, (ylabel, _) in sourcestats_metrics.items():
+                for source in available_sources:
+                    df = sourcestats_tables.get((scenario, metric, source), pd.DataFrame())
+                    if df.empty:
+                        continue
+
+                    safe_source = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(source))
+                    source_dir = scenario_sourcestats_dir / safe_source
+                    source_dir.mkdir(parents=True, exist_ok=True)
+
+                    write_csv(df, source_dir / f"{metric}_aggregated.csv")
+
+                    plot_mean_ci(
+                        df=df,
+                        title=f"sourcestats - {scenario} - {safe_source} - {metric} - mean + 95% CI",
+                        ylabel=ylabel,
+                        outpath=source_dir / f"{metric}_mean_ci95.png",
+                        ylim=sourcestats_ylims_ci[(metric, source)],
+                    )
+
+                    plot_mean_iqr_p10p90(
+                        df=df,
+                        title=f"sourcestats - {scenario} - {safe_source} - {metric} - mean + IQR + p10/p90",
+                        ylabel=ylabel,
+                        outpath=source_dir / f"{metric}_mean_iqr_p10_p90.png",
+                        ylim=sourcestats_ylims_iqr[(metric, source)],
+                    )
+
     print(f"[OK] Parsing per-run completato e aggregazione salvata in: {agg_root}")
 
 
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Parse and aggregate Chrony multi-run logs.")
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Root directory of Chrony multi-run logs, e.g. .../analysis/raw_logs/T3_multiplerun/chrony_servergm",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Parse runs in N worker processes (parsed arrays come back via shared memory)",
+    )
+    ap.add_argument(
+        "--io-threads",
+        type=int,
+        default=2,
+        help="Background threads for log prefetch and CSV/PNG writes (0 = synchronous I/O)",
+    )
+    add_profile_args(ap)
+    add_memory_args(ap)
+    add_time_base_args(ap)
+    add_outlier_args(ap)
+    args = ap.parse_args()
+    set_time_base(args.utc, args.utc_anchor)
+    configure_outlier_filter(args)
+
+    # il writer si svuota prima che il manifest venga salvato e il lock rilasciato
+    with profile_session(args, "chrony_analysis_v3"):
+        with campaign_outputs(args.root, producer="chrony_analysis_v3"):
+            with memory_session(args, args.root):
+                with background_writer(workers=args.io_threads) if args.io_threads > 0 else nullcontext():
+                    run_campaign(args)
+                    stage("flush")
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from streaming_aggregate import StreamingAggregator
+
+
+# Aggregazione out-of-core esatta: ogni run scrive le sue colonne metriche su disco come
+# array .npy densi per sample_idx (NaN = campione assente); l'aggregazione legge poi un
+# intervallo di sample_idx alla volta da tutte le run (memmap) e applica la stessa funzione
+# dei driver. Ogni sample_idx vede gli stessi valori nello stesso ordine (ordine delle run)
+# del percorso in memoria, quindi le curve concatenate sono identiche.
+
+# valori (run x sample_idx) tenuti in memoria per blocco
+DEFAULT_CHUNK_VALUES = 1_000_000
+
+
+class RunColumnStore:
+    """Colonne metriche per run su disco, una per (chiave, run), indicizzate per sample_idx."""
+
+    def __init__(self, directory: Optional[Path] = None) -> None:
+        self._tmp: Optional[tempfile.TemporaryDirectory] = None
+        if directory is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="chunked-agg-")
+            directory = Path(self._tmp.name)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # chiave -> [(run_id, file, lunghezza)] nell'ordine di inserimento
+        self._columns: Dict[Hashable, List[Tuple[str, Path, int]]] = {}
+        self._n_files = 0
+
+    def add(self, key: Hashable, run_id: str, sample_idx: np.ndarray, values: np.ndarray) -> None:
+        idx = np.asarray(sample_idx, dtype=np.int64)
+        vals = np.asarray(values, dtype=float)
+        keep = ~np.isnan(vals)
+        idx, vals = idx[keep], vals[keep]
+        if len(idx) == 0:
+            return
+        if idx.min() < 0:
+            raise ValueError("sample_idx must be non-negative")
+        if len(np.unique(idx)) != len(idx):
+            raise ValueError(f"duplicate sample_idx in run {run_id} for {key}")
+
+        dense = np.full(int(idx.max()) + 1, np.nan)
+        dense[idx] = vals
+        path = self.directory / f"col{self._n_files:06d}.npy"
+        self._n_files += 1
+        np.save(path, dense)
+        self._columns.setdefault(key, []).append((run_id, path, len(dense)))
+
+    def keys(self) -> List[Hashable]:
+        return list(self._columns)
+
+    def n_runs(self, key: Hashable) -> int:
+        return len(self._columns.get(key, []))
+
+    def iter_long_chunks(
+        self, key: Hashable, metric: str, chunk_values: int = DEFAULT_CHUNK_VALUES
+    ) -> Iterator[pd.DataFrame]:
+        """Blocchi long (sample_idx, metric, run_id) per intervalli di sample_idx, run in ordine di inserimento."""
+        cols = self._columns.get(key, [])
+        if not cols:
+            return
+        length = max(n for _, _, n in cols)
+        width = max(1, chunk_values // len(cols))
+
+        for start in range(0, length, width):
+            stop = min(start + width, length)
+            pieces = []
+            for run_id, path, n in cols:
+                if start >= n:
+                    continue
+                block = np.load(path, mmap_mode="r")[start:min(stop, n)]
+                present = np.nonzero(~np.isnan(block))[0]
+                if len(present) == 0:
+                    continue
+                pieces.append(pd.DataFrame({
+                    "sample_idx": present + start,
+                    metric: np.asarray(block[present]),
+                    "run_id": run_id,
+                }))
+            if pieces:
+                yield pd.concat(pieces, ignore_index=True)
+
+    def close(self) -> None:
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+
+class ChunkedAggregator:
+    """
+    Stessa interfaccia di StreamingAggregator, risultato esatto: `aggregate_long(long_df, metric)`
+    e' la funzione di aggregazione del driver, applicata blocco per blocco.
+    """
+
+    def __init__(
+        self,
+        aggregate_long: Callable[[pd.DataFrame, str], pd.DataFrame],
+        directory: Optional[Path] = None,
+        chunk_values: int = DEFAULT_CHUNK_VALUES,
+    ) -> None:
+        self.aggregate_long = aggregate_long
+        self.chunk_values = chunk_values
+        self.store = RunColumnStore(directory)
+        self._metrics: Dict[Hashable, str] = {}
+
+    def add_frame(self, key: Hashable, df: pd.DataFrame, metric: str) -> None:
+        if df.empty or metric not in df.columns:
+            return
+        run_id = str(df["run_id"].iloc[0]) if "run_id" in df.columns else str(self.store.n_runs(key))
+        values = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        self._metrics[key] = metric
+        self.store.add(key, run_id, df["sample_idx"].to_numpy(), values)
+
+    def keys(self) -> List[Hashable]:
+        return self.store.keys()
+
+    def result(self, key: Hashable) -> pd.DataFrame:
+        metric = self._metrics.get(key)
+        if metric is None:
+            return pd.DataFrame()
+        parts = [
+            self.aggregate_long(chunk, metric)
+            for chunk in self.store.iter_long_chunks(key, metric, self.chunk_values)
+        ]
+        parts = [p for p in parts if not p.empty]
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True)
+
+    def note(self) -> Optional[str]:
+        return None
+
+    def close(self) -> None:
+        self.store.close()
+
+
+# ----------------------------
+# Factory
+# ----------------------------
+
+OUT_OF_CORE_MODES = ("chunked", "sketch")
+
+# byte per valore nel frame long di un blocco (colonne + groupby), per ricavare il blocco dal budget
+BYTES_PER_CHUNK_VALUE = 200
+
+
+def make_aggregator(
+    mode: str,
+    aggregate_long: Callable[[pd.DataFrame, str], pd.DataFrame],
+    t_critical: Callable[[int], float],
+    budget_bytes: Optional[int] = None,
+) -> "OutOfCoreAggregator":
+    """Aggregatore del percorso a bassa memoria: 'chunked' (esatto, su disco) o 'sketch' (streaming)."""
+    if mode == "sketch":
+        return StreamingAggregator(t_critical)
+    if mode != "chunked":
+        raise ValueError(f"unknown out-of-core mode: {mode}")
+    chunk_values = DEFAULT_CHUNK_VALUES
+    if budget_bytes is not None:
+        # un quarto del budget al blocco in aggregazione
+        chunk_values = max(1, min(chunk_values, budget_bytes // (4 * BYTES_PER_CHUNK_VALUE)))
+    return ChunkedAggregator(aggregate_long, chunk_values=chunk_values)
+
+
+OutOfCoreAggregator = Union[ChunkedAggregator, StreamingAggregator]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from atomic_output import campaign_outputs, output_inputs, write_csv_atomic  # noqa: E402
+from changepoint import DEFAULT_MAX_CANDIDATES, DEFAULT_MIN_SIZE, DEFAULT_PENALTY_SCALE, run_changepoints  # noqa: E402
+from cross_run import mean_ci  # noqa: E402
+from run_series import KEY, SCENARIOS, SERIES, SeriesSpec, load_series, run_times, value_rows  # noqa: E402
+from shm_frames import map_shared  # noqa: E402
+
+
+# Regimi per run delle serie di offset (offset_ns PTP boundary, rms_ns PTP client, offset_ns
+# del peer ntpq selezionato, system_time_ns di chrony) con PELT. Gli eventi di stato dicono
+# quando il servo aggancia; i segmenti dicono quando l'offset smette davvero di muoversi
+# (settle) e se la run cambia regime dopo. Una run per task, in parallelo con --jobs.
+
+SUMMARY_QUANTITIES = ["settle_time_s", "settle_after_lock_s", "n_changes", "settled_std"]
+
+
+def series_segments(
+    spec: SeriesSpec, samples: pd.DataFrame, events: pd.DataFrame, args: argparse.Namespace
+) -> pd.DataFrame:
+    """Segmenti di tutte le run (scenario, run_id, segment, t_start_s, ...), tempi relativi a t0 della run."""
+    s = value_rows(spec, samples).dropna(subset=[spec.offset_col])
+    if s.empty:
+        return pd.DataFrame()
+    s = s.sort_values([*KEY, spec.time_col], kind="mergesort")
+
+    groups = list(s.groupby(KEY, sort=True, observed=True))
+    tasks = [
+        (g[spec.time_col].to_numpy(dtype=float), g[spec.offset_col].to_numpy(dtype=float),
+         args.penalty, args.min_size, args.max_candidates)
+        for _, g in groups
+    ]
+    results = map_shared(run_changepoints, tasks, jobs=args.jobs, drop_columns=())
+
+    frames = []
+    for (key, _), seg in zip(groups, results):
+        seg = seg.copy()
+        seg.insert(0, "run_id", key[1])
+        seg.insert(0, "scenario", key[0])
+        frames.append(seg)
+    out = pd.concat(frames, ignore_index=True).join(run_times(spec, samples, events), on=KEY)
+    out["t_start_s"] = out["t_start"] - out["t0"]
+    out["t_end_s"] = out["t_end"] - out["t0"]
+    out["lock_time_s"] = out["t_lock"] - out["t0"]
+    return out[[*KEY, "segment", "t_start_s", "t_end_s", "n", "mean", "std", "min", "max", "settled", "lock_time_s"]]
+
+
+def run_summary(segments: pd.DataFrame) -> pd.DataFrame:
+    """Una riga per run: cambi di regime, istante di assestamento, statistiche del regime finale."""
+    g = segments.groupby(KEY, sort=True, observed=True)
+    settled = segments[segments["settled"]].groupby(KEY, sort=True, observed=True)
+    final = g.tail(1).set_index(KEY)
+    out = pd.DataFrame({
+        "n_samples": g["n"].sum(),
+        "n_changes": g["segment"].max(),
+        "lock_time_s": g["lock_time_s"].first(),
+        "settle_time_s": settled["t_start_s"].min(),
+        "settled_mean": final["mean"],
+        "settled_std": final["std"],
+    })
+    out["settle_after_lock_s"] = out["settle_time_s"] - out["lock_time_s"]
+    return out.reset_index()
+
+
+def write_series_changepoints(root: Path, spec: SeriesSpec, args: argparse.Namespace) -> List[Path]:
+    inputs: List[Path] = []
+    samples, events = load_series(root, spec, inputs)
+    segments = series_segments(spec, samples, events, args)
+    if segments.empty:
+        return []
+
+    summary = run_summary(segments)
+    long = summary.melt(id_vars=KEY, value_vars=SUMMARY_QUANTITIES, var_name="quantity").dropna(subset=["value"])
+    agg = mean_ci(long, ["scenario", "quantity"], "value")
+
+    metric = spec.offset_col
+    produced = []
+    with output_inputs(inputs):
+        for scenario in SCENARIOS:
+            if not (summary["scenario"] == scenario).any():
+                continue
+            out_dir = root / spec.campaign / "_aggregated" / spec.role / scenario
+            out_dir.mkdir(parents=True, exist_ok=True)
+            outputs = {
+                f"{metric}_segments.csv": segments,
+                f"{metric}_changepoints_per_run.csv": summary,
+                f"{metric}_changepoints_aggregated.csv": agg,
+            }
+            for name, df in outputs.items():
+                out_csv = out_dir / name
+                write_csv_atomic(
+                    df[df["scenario"] == scenario].drop(columns=["scenario"]), out_csv, inputs=inputs
+                )
+                produced.append(out_csv)
+    return produced
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description="Segment per-run offset series into regimes (PELT) and report settle time, "
+        "regime changes and per-segment statistics across runs."
+    )
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Multi-run root holding the campaign directories (ptp, ntpsec, chrony_*), "
+        "e.g. .../analysis/raw_logs/T3_multiplerun",
+    )
+    ap.add_argument(
+        "--campaign",
+        action="append",
+        default=None,
+        help="Only these campaign directories (repeatable; default: all present)",
+    )
+    ap.add_argument(
+        "--penalty",
+        type=float,
+        default=DEFAULT_PENALTY_SCALE,
+        help=f"Penalty per change point, in units of log(n) on the noise-normalised series "
+        f"(default: {DEFAULT_PENALTY_SCALE})",
+    )
+    ap.add_argument(
+        "--min-size",
+        type=int,
+        default=DEFAULT_MIN_SIZE,
+        help=f"Minimum segment length in samples (default: {DEFAULT_MIN_SIZE})",
+    )
+    ap.add_argument(
+        "--max-candidates",
+        type=int,
+        default=DEFAULT_MAX_CANDIDATES,
+        help=f"Keep at most N change-point candidates after pruning, the lowest-cost ones "
+        f"(bounds the cost on long stationary runs; default: {DEFAULT_MAX_CANDIDATES})",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Segment runs in N worker processes",
+    )
+    args = ap.parse_args()
+
+    root = args.root.resolve()
+    produced: List[Path] = []
+    for spec in SERIES:
+        if not (root / spec.campaign).is_dir():
+            continue
+        if args.campaign and spec.campaign not in args.campaign:
+            continue
+        with campaign_outputs(root / spec.campaign, producer="changepoints_aggregated"):
+            produced.extend(write_series_changepoints(root, spec, args))
+
+    if not produced:
+        raise RuntimeError("Nessuna segmentazione prodotta. Esegui prima i driver *_analysis_v3.py.")
+
+    print("[OK] File dei cambi di regime creati:")
+    for p in produced:
+        print(f" - {p}")
+
+
+if __name__ == "__main__":
+    main()
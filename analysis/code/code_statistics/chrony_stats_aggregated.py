@@ -3,18 +3,45 @@
 from __future__ import annotations
 
 import argparse
+import sys
 from pathlib import Path
 from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from atomic_output import campaign_outputs, write_csv_atomic  # noqa: E402
+from outlier_filter import add_filtered_columns, filtered_name, mask_column  # noqa: E402
+from profiling import add_profile_args, profile_session, span, stage  # noqa: E402
+from units import present_columns, storage_column  # noqa: E402
+
 
 SCENARIOS = ["low", "medium", "high"]
 
 TRACKING_METRICS = ["system_time_us", "last_offset_us"]
 SOURCESTATS_METRICS = ["offset_us", "stddev_us"]
 
+TRACKING_STORAGE = [storage_column(m)[0] for m in TRACKING_METRICS]
+SOURCESTATS_STORAGE = [storage_column(m)[0] for m in SOURCESTATS_METRICS]
+
+# con --outlier-filter nei driver i parsed hanno le maschere <colonna>_outlier: ogni tabella
+# riporta anche la variante filtered_<metrica> (valori grezzi con NaN sugli outlier), nello
+# stesso giro sui dati; senza maschere le varianti filtrate non compaiono
+REPORTED_TRACKING_METRICS = [*TRACKING_METRICS, *(filtered_name(m) for m in TRACKING_METRICS)]
+REPORTED_SOURCESTATS_METRICS = [*SOURCESTATS_METRICS, *(filtered_name(m) for m in SOURCESTATS_METRICS)]
+
+# colonne dei parsed per-run usate qui: il resto non viene caricato.
+# I parsed hanno le grandezze in ns interi (<grandezza>_ns); le colonne in us si ricavano al caricamento.
+TRACKING_COLUMNS = [
+    "sample_idx", "t_rel_s", *TRACKING_METRICS, *TRACKING_STORAGE, *(mask_column(c) for c in TRACKING_STORAGE)
+]
+SOURCESTATS_COLUMNS = [
+    "sample_idx", "t_rel_s", "source", *SOURCESTATS_METRICS, *SOURCESTATS_STORAGE,
+    *(mask_column(c) for c in SOURCESTATS_STORAGE),
+]
+
 
 def safe_cv(mean_val: float, std_val: float) -> float:
     if pd.isna(mean_val) or pd.isna(std_val):
@@ -105,11 +132,11 @@ def load_tracking_runs(root: Path, scenario: str) -> pd.DataFrame:
         if not csv_path.exists():
             continue
 
-        df = pd.read_csv(csv_path)
+        df = pd.read_csv(csv_path, usecols=lambda c: c in TRACKING_COLUMNS)
         if df.empty:
             continue
 
-        df = df.copy()
+        df = present_columns(add_filtered_columns(df, TRACKING_STORAGE), REPORTED_TRACKING_METRICS)
         df["run_id"] = run_dir.name
         if "sample_idx" not in df.columns:
             df = df.reset_index(drop=True)
@@ -134,11 +161,11 @@ def load_sourcestats_runs(root: Path, scenario: str) -> pd.DataFrame:
         if not csv_path.exists():
             continue
 
-        df = pd.read_csv(csv_path)
+        df = pd.read_csv(csv_path, usecols=lambda c: c in SOURCESTATS_COLUMNS)
         if df.empty:
             continue
 
-        df = df.copy()
+        df = present_columns(add_filtered_columns(df, SOURCESTATS_STORAGE), REPORTED_SOURCESTATS_METRICS)
         df["run_id"] = run_dir.name
         if "sample_idx" not in df.columns:
             df = df.reset_index(drop=True)
@@ -159,7 +186,7 @@ def build_tracking_global_raw_stats(df_all: pd.DataFrame, scenario: str) -> pd.D
 
     n_runs = df_all["run_id"].nunique() if "run_id" in df_all.columns else np.nan
 
-    for metric in TRACKING_METRICS:
+    for metric in REPORTED_TRACKING_METRICS:
         if metric not in df_all.columns:
             continue
 
@@ -190,7 +217,7 @@ def build_sourcestats_global_raw_stats(df_all: pd.DataFrame, scenario: str) -> p
     for source_name, gsrc in df_all.groupby("source"):
         n_runs = gsrc["run_id"].nunique() if "run_id" in gsrc.columns else np.nan
 
-        for metric in SOURCESTATS_METRICS:
+        for metric in REPORTED_SOURCESTATS_METRICS:
             if metric not in gsrc.columns:
                 continue
 
@@ -286,7 +313,7 @@ def summarize_curve_df(df: pd.DataFrame) -> Dict[str, object]:
 def build_tracking_aggregated_curve_stats(root: Path, scenario: str) -> pd.DataFrame:
     rows = []
 
-    for metric in TRACKING_METRICS:
+    for metric in REPORTED_TRACKING_METRICS:
         df = load_tracking_aggregated_csv(root, scenario, metric)
         if df is None:
             continue
@@ -307,7 +334,7 @@ def build_sourcestats_aggregated_curve_stats(root: Path, scenario: str, availabl
     rows = []
 
     for source_name in available_sources:
-        for metric in SOURCESTATS_METRICS:
+        for metric in REPORTED_SOURCESTATS_METRICS:
             df = load_sourcestats_aggregated_csv(root, scenario, source_name, metric)
             if df is None:
                 continue
@@ -348,7 +375,7 @@ def build_tracking_per_run_summary(df_all: pd.DataFrame, scenario: str) -> pd.Da
             row["t_rel_min_s"] = float(tvals.min()) if not tvals.empty else np.nan
             row["t_rel_max_s"] = float(tvals.max()) if not tvals.empty else np.nan
 
-        for metric in TRACKING_METRICS:
+        for metric in REPORTED_TRACKING_METRICS:
             if metric in g.columns:
                 stats = compute_stats(g[metric])
                 row[f"{metric}_mean"] = stats["mean"]
@@ -386,7 +413,7 @@ def build_sourcestats_per_run_summary(df_all: pd.DataFrame, scenario: str) -> pd
             row["t_rel_min_s"] = float(tvals.min()) if not tvals.empty else np.nan
             row["t_rel_max_s"] = float(tvals.max()) if not tvals.empty else np.nan
 
-        for metric in SOURCESTATS_METRICS:
+        for metric in REPORTED_SOURCESTATS_METRICS:
             if metric in g.columns:
                 stats = compute_stats(g[metric])
                 row[f"{metric}_mean"] = stats["mean"]
@@ -400,6 +427,40 @@ def build_sourcestats_per_run_summary(df_all: pd.DataFrame, scenario: str) -> pd
     return pd.DataFrame(rows)
 
 
+def _stats_inputs(root: Path, scenario: str) -> List[Path]:
+    return sorted((root / scenario).glob("run*/parsed_*.csv")) + sorted(
+        (root / "_aggregated").glob(f"*/{scenario}/**/*_aggregated.csv")
+    )
+
+
+def write_scenario_stats(root: Path, scenario: str, outdir: Path) -> None:
+    inputs = _stats_inputs(root, scenario)
+    with span("stats.load", scenario=scenario):
+        tracking_all = load_tracking_runs(root, scenario)
+        sourcestats_all = load_sourcestats_runs(root, scenario)
+
+    available_sources = []
+    if not sourcestats_all.empty and "source" in sourcestats_all.columns:
+        available_sources = sorted(sourcestats_all["source"].dropna().unique().tolist())
+
+    with span("stats.compute", scenario=scenario):
+        tables = {
+            "tracking_global_raw_stats.csv": build_tracking_global_raw_stats(tracking_all, scenario),
+            "tracking_aggregated_curve_stats.csv": build_tracking_aggregated_curve_stats(root, scenario),
+            "tracking_per_run_summary.csv": build_tracking_per_run_summary(tracking_all, scenario),
+            "sourcestats_global_raw_stats.csv": build_sourcestats_global_raw_stats(sourcestats_all, scenario),
+            "sourcestats_aggregated_curve_stats.csv": build_sourcestats_aggregated_curve_stats(
+                root, scenario, available_sources
+            ),
+            "sourcestats_per_run_summary.csv": build_sourcestats_per_run_summary(sourcestats_all, scenario),
+        }
+
+    with span("stats.write", scenario=scenario):
+        for name, df in tables.items():
+            if not df.empty:
+                write_csv_atomic(round_numeric_columns(df), outdir / name, inputs=inputs)
+
+
 def main() -> None:
     ap = argparse.ArgumentParser(description="Compute aggregated statistics for Chrony multiple-run analysis.")
     ap.add_argument(
@@ -408,6 +469,7 @@ def main() -> None:
         required=True,
         help="Root directory of Chrony multi-run logs, e.g. .../analysis/raw_logs/T3_multiplerun/chrony_servergm",
     )
+    add_profile_args(ap)
     args = ap.parse_args()
 
     root = args.root.resolve()
@@ -416,45 +478,11 @@ def main() -> None:
 
     stats_dirs = ensure_stats_dirs(root)
 
-    for scenario in SCENARIOS:
-        tracking_all = load_tracking_runs(root, scenario)
-        sourcestats_all = load_sourcestats_runs(root, scenario)
-
-        available_sources = []
-        if not sourcestats_all.empty and "source" in sourcestats_all.columns:
-            available_sources = sorted(sourcestats_all["source"].dropna().unique().tolist())
-
-        outdir = stats_dirs[scenario]
-
-        tracking_global = build_tracking_global_raw_stats(tracking_all, scenario)
-        if not tracking_global.empty:
-            tracking_global = round_numeric_columns(tracking_global)
-            tracking_global.to_csv(outdir / "tracking_global_raw_stats.csv", index=False)
-
-        tracking_curve = build_tracking_aggregated_curve_stats(root, scenario)
-        if not tracking_curve.empty:
-            tracking_curve = round_numeric_columns(tracking_curve)
-            tracking_curve.to_csv(outdir / "tracking_aggregated_curve_stats.csv", index=False)
-
-        tracking_per_run = build_tracking_per_run_summary(tracking_all, scenario)
-        if not tracking_per_run.empty:
-            tracking_per_run = round_numeric_columns(tracking_per_run)
-            tracking_per_run.to_csv(outdir / "tracking_per_run_summary.csv", index=False)
-
-        sourcestats_global = build_sourcestats_global_raw_stats(sourcestats_all, scenario)
-        if not sourcestats_global.empty:
-            sourcestats_global = round_numeric_columns(sourcestats_global)
-            sourcestats_global.to_csv(outdir / "sourcestats_global_raw_stats.csv", index=False)
-
-        sourcestats_curve = build_sourcestats_aggregated_curve_stats(root, scenario, available_sources)
-        if not sourcestats_curve.empty:
-            sourcestats_curve = round_numeric_columns(sourcestats_curve)
-            sourcestats_curve.to_csv(outdir / "sourcestats_aggregated_curve_stats.csv", index=False)
-
-        sourcestats_per_run = build_sourcestats_per_run_summary(sourcestats_all, scenario)
-        if not sourcestats_per_run.empty:
-            sourcestats_per_run = round_numeric_columns(sourcestats_per_run)
-            sourcestats_per_run.to_csv(outdir / "sourcestats_per_run_summary.csv", index=False)
+    with profile_session(args, "chrony_stats_aggregated"):
+        with campaign_outputs(root, producer="chrony_stats_aggregated"):
+            stage("stats")
+            for scenario in SCENARIOS:
+                write_scenario_stats(root, scenario, stats_dirs[scenario])
 
     print(f"[OK] Chrony aggregated statistics saved in: {root / '_aggregated' / 'stats'}")
 
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from async_io import save_current_figure  # noqa: E402
+from atomic_output import campaign_outputs, output_inputs, write_csv_atomic  # noqa: E402
+from cross_run import mean_ci  # noqa: E402
+from min_delay import DEFAULT_WINDOW, min_delay_picks  # noqa: E402
+from run_series import KEY, SCENARIOS, SERIES, SeriesSpec, load_series, run_times, value_rows  # noqa: E402
+
+
+# Offset filtrato a delay minimo (min_delay.py) per le serie che registrano offset e path
+# delay nello stesso campione: PTP boundary (offset_ns), PTP client (rms_ns), peer ntpq
+# selezionato. Tutte le run e tutti gli scenari di una serie passano da un solo
+# sliding_argmin. Per ogni scenario:
+# - <offset>_min_delay_aggregated.csv: curva per sample_idx (media tra le run + CI95) accanto
+#   alla curva grezza <offset>_aggregated.csv del driver
+# - <offset>_min_delay_stats.csv: statistiche dopo l'aggancio, grezze e filtrate, per run e
+#   poi mediate tra le run
+
+VARIANTS = {"raw": "raw", "min_delay": "min-delay"}
+
+STATS = ["mean", "std", "rms", "p95_abs"]
+
+
+def series_min_delay(spec: SeriesSpec, samples: pd.DataFrame, events: pd.DataFrame, window: int) -> pd.DataFrame:
+    """Una riga per finestra: chiavi, sample_idx e t_rel_s del suo ultimo campione, raw, min_delay, delay scelto."""
+    s = value_rows(spec, samples).dropna(subset=[spec.offset_col, spec.delay_col])
+    if s.empty:
+        return pd.DataFrame()
+    s = s.sort_values([*KEY, spec.time_col], kind="mergesort").reset_index(drop=True)
+    s = s.join(run_times(spec, samples, events), on=KEY)
+
+    codes = s.groupby(KEY, sort=True, observed=True).ngroup().to_numpy()
+    end, pick = min_delay_picks(s[spec.delay_col].to_numpy(dtype=float), codes, window)
+    if len(end) == 0:
+        return pd.DataFrame()
+
+    offset = s[spec.offset_col].to_numpy(dtype=float)
+    t = s[spec.time_col].to_numpy(dtype=float)
+    out = s.loc[end, KEY].reset_index(drop=True)
+    # sample_idx del parser (non la posizione dopo i filtri): la curva si sovrappone a quella del driver
+    out["sample_idx"] = s["sample_idx"].to_numpy()[end]
+    out["t_rel_s"] = t[end] - s["t0"].to_numpy()[end]
+    out["post_lock"] = t[end] >= s["t_lock"].to_numpy()[end]
+    out["raw"] = offset[end]
+    out["min_delay"] = offset[pick]
+    out["delay_ns"] = s[spec.delay_col].to_numpy(dtype=float)[pick] * spec.delay_one_way
+    return out
+
+
+def run_stats(windows: pd.DataFrame) -> pd.DataFrame:
+    """Per run dopo l'aggancio: mean, std, rms e p95 di |x| delle due varianti, in formato long."""
+    post = windows[windows["post_lock"]]
+    long = post.melt(id_vars=KEY, value_vars=list(VARIANTS), var_name="variant")
+    g = long.assign(sq=long["value"] ** 2, abs=long["value"].abs()).groupby([*KEY, "variant"], observed=True)
+    stats = pd.DataFrame({
+        "mean": g["value"].mean(),
+        "std": g["value"].std(ddof=1),
+        "rms": np.sqrt(g["sq"].mean()),
+        "p95_abs": g["abs"].quantile(0.95),
+    }).reset_index()
+    return stats.melt(id_vars=[*KEY, "variant"], value_vars=STATS, var_name="stat").dropna(subset=["value"])
+
+
+def plot_min_delay(curves: pd.DataFrame, title: str, outpath: Path) -> None:
+    if curves.empty:
+        return
+
+    plt.figure(figsize=(9, 5))
+    for variant, label in VARIANTS.items():
+        c = curves[curves["variant"] == variant]
+        if c.empty:
+            continue
+        line, = plt.plot(c["sample_idx"], c["mean"], label=label)
+        plt.fill_between(c["sample_idx"], c["ci95_low"], c["ci95_high"], alpha=0.2, color=line.get_color())
+    plt.xlabel("sample index (end of window)")
+    plt.ylabel("ns")
+    plt.title(f"{title} - mean across runs + 95% CI")
+    plt.legend()
+    plt.tight_layout()
+    save_current_figure(outpath)
+
+
+def write_series_min_delay(root: Path, spec: SeriesSpec, window: int) -> List[Path]:
+    inputs: List[Path] = []
+    samples, events = load_series(root, spec, inputs)
+    windows = series_min_delay(spec, samples, events, window)
+    if windows.empty:
+        return []
+
+    long = windows.melt(id_vars=[*KEY, "sample_idx"], value_vars=list(VARIANTS), var_name="variant")
+    curves = mean_ci(long, ["scenario", "variant", "sample_idx"], "value")
+    stats = mean_ci(run_stats(windows), ["scenario", "variant", "stat"], "value")
+
+    metric = spec.offset_col
+    produced = []
+    with output_inputs(inputs):
+        for scenario in SCENARIOS:
+            sc_curves = curves[curves["scenario"] == scenario].drop(columns=["scenario"])
+            if sc_curves.empty:
+                continue
+            out_dir = root / spec.campaign / "_aggregated" / spec.role / scenario
+            out_dir.mkdir(parents=True, exist_ok=True)
+
+            out_csv = out_dir / f"{metric}_min_delay_aggregated.csv"
+            write_csv_atomic(
+                sc_curves[sc_curves["variant"] == "min_delay"].drop(columns=["variant"]), out_csv, inputs=inputs
+            )
+            produced.append(out_csv)
+
+            sc_stats = stats[stats["scenario"] == scenario].drop(columns=["scenario"])
+            if not sc_stats.empty:
+                stats_csv = out_dir / f"{metric}_min_delay_stats.csv"
+                write_csv_atomic(sc_stats, stats_csv, inputs=inputs)
+                produced.append(stats_csv)
+
+            plot_min_delay(
+                sc_curves, f"{spec.protocol} - {scenario} - {metric}, min-delay window {window}",
+                out_dir / f"{metric}_min_delay.png",
+            )
+    return produced
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description="Minimum-delay ('lucky packet') offset estimator over sliding path-delay windows, "
+        "for every run and scenario from parsed per-run CSVs."
+    )
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Multi-run root holding the campaign directories (ptp, ntpsec, chrony_*), "
+        "e.g. .../analysis/raw_logs/T3_multiplerun",
+    )
+    ap.add_argument(
+        "--campaign",
+        action="append",
+        default=None,
+        help="Only these campaign directories (repeatable; default: all present)",
+    )
+    ap.add_argument(
+        "--window",
+        type=int,
+        default=DEFAULT_WINDOW,
+        help=f"Sliding window length in samples (default: {DEFAULT_WINDOW})",
+    )
+    args = ap.parse_args()
+
+    root = args.root.resolve()
+    produced: List[Path] = []
+    for spec in SERIES:
+        if spec.delay_col is None or not (root / spec.campaign).is_dir():
+            continue
+        if args.campaign and spec.campaign not in args.campaign:
+            continue
+        with campaign_outputs(root / spec.campaign, producer="min_delay_aggregated"):
+            produced.extend(write_series_min_delay(root, spec, args.window))
+
+    if not produced:
+        raise RuntimeError("Nessuna serie a delay minimo prodotta. Esegui prima i driver *_analysis_v3.py.")
+
+    print("[OK] File a delay minimo creati:")
+    for p in produced:
+        print(f" - {p}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,20 @@
 from __future__ import annotations
 
 import argparse
+import sys
 from pathlib import Path
 from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from atomic_output import campaign_outputs, write_csv_atomic  # noqa: E402
+from outlier_filter import add_filtered_columns, filtered_name, mask_column  # noqa: E402
+from profiling import add_profile_args, profile_session, span, stage  # noqa: E402
+from units import present_columns, storage_column  # noqa: E402
+
 
 SCENARIOS = ["low", "medium", "high"]
 ROLES = ["client", "boundary"]
@@ -20,6 +28,19 @@ ROLE_FILE_MAP = {
 
 METRICS = ["offset_ms", "jitter_ms", "delay_ms"]
 
+STORAGE_COLUMNS = [storage_column(m)[0] for m in METRICS]
+
+# con --outlier-filter nei driver i parsed hanno le maschere <colonna>_outlier: ogni tabella
+# riporta anche la variante filtered_<metrica> (valori grezzi con NaN sugli outlier), nello
+# stesso giro sui dati; senza maschere le varianti filtrate non compaiono
+REPORTED_METRICS = [*METRICS, *(filtered_name(m) for m in METRICS)]
+
+# colonne dei parsed per-run usate qui: `raw` e il resto non vengono caricati.
+# I parsed hanno le grandezze in ns interi (<grandezza>_ns); le colonne in ms si ricavano al caricamento.
+RUN_COLUMNS = [
+    "sample_idx", "t_rel_s", "selected", *METRICS, *STORAGE_COLUMNS, *(mask_column(c) for c in STORAGE_COLUMNS)
+]
+
 
 def safe_cv(mean_val: float, std_val: float) -> float:
     if pd.isna(mean_val) or pd.isna(std_val):
@@ -99,11 +120,11 @@ def load_run_files(root: Path, scenario: str, role: str) -> pd.DataFrame:
         if not csv_path.exists():
             continue
 
-        df = pd.read_csv(csv_path)
+        df = pd.read_csv(csv_path, usecols=lambda c: c in RUN_COLUMNS)
         if df.empty:
             continue
 
-        df = df.copy()
+        df = present_columns(add_filtered_columns(df, STORAGE_COLUMNS), REPORTED_METRICS)
         df["run_id"] = run_dir.name
 
         if "sample_idx" not in df.columns:
@@ -155,7 +176,7 @@ def build_global_raw_stats(df_all: pd.DataFrame, scenario: str, role: str, sourc
 
     n_runs = df_all["run_id"].nunique() if "run_id" in df_all.columns else np.nan
 
-    for metric in METRICS:
+    for metric in REPORTED_METRICS:
         if metric not in df_all.columns:
             continue
 
@@ -370,7 +391,7 @@ def build_aggregated_curve_stats(
 ) -> pd.DataFrame:
     rows = []
 
-    for metric in METRICS:
+    for metric in REPORTED_METRICS:
         raw_curve = load_aggregated_curve_csv(root, scenario, role, metric)
         post_curve = rebuild_post_selected_curve(df_all, metric)
 
@@ -429,7 +450,7 @@ def build_per_run_summary(df_all: pd.DataFrame, scenario: str, role: str, summar
             row["n_selected_rows"] = int(sel.sum())
             row["selected_fraction"] = float(sel.mean()) if len(sel) > 0 else np.nan
 
-        for metric in METRICS:
+        for metric in REPORTED_METRICS:
             if metric in g.columns:
                 metric_vals = pd.to_numeric(g[metric], errors="coerce").dropna()
                 stats = compute_stats(g[metric])
@@ -457,31 +478,25 @@ def ensure_stats_dirs(root: Path) -> Dict[str, Path]:
     return out
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser(description="Compute aggregated statistics for NTPsec multiple-run analysis.")
-    ap.add_argument(
-        "--root",
-        type=Path,
-        required=True,
-        help="Root directory of NTPsec multi-run logs, e.g. .../analysis/raw_logs/T3_multiplerun/ntpsec",
+def _stats_inputs(root: Path, scenario: str) -> List[Path]:
+    return sorted((root / scenario).glob("run*/parsed_*_samples.csv")) + sorted(
+        (root / "_aggregated").glob(f"*/{scenario}/*_aggregated.csv")
     )
-    args = ap.parse_args()
-
-    root = args.root.resolve()
-    if not root.exists() or not root.is_dir():
-        raise FileNotFoundError(f"Root directory not found: {root}")
 
-    stats_dirs = ensure_stats_dirs(root)
 
-    for scenario in SCENARIOS:
-        scenario_frames_global_raw = []
-        scenario_frames_global_post = []
-        scenario_frames_curve = []
-        scenario_frames_per_run_raw = []
-        scenario_frames_per_run_post = []
+def write_scenario_stats(root: Path, scenario: str, outdir: Path) -> None:
+    inputs = _stats_inputs(root, scenario)
+    scenario_frames_global_raw = []
+    scenario_frames_global_post = []
+    scenario_frames_curve = []
+    scenario_frames_per_run_raw = []
+    scenario_frames_per_run_post = []
 
-        for role in ROLES:
+    for role in ROLES:
+        with span("stats.load", scenario=scenario, role=role):
             df_all = load_run_files(root, scenario, role)
+
+        with span("stats.compute", scenario=scenario, role=role):
             df_post = filter_post_selected_per_run(df_all)
 
             global_raw = build_global_raw_stats(
@@ -514,43 +529,53 @@ def main() -> None:
                 summary_source="post_selected",
             )
 
-            if not global_raw.empty:
-                scenario_frames_global_raw.append(global_raw)
-            if not global_post.empty:
-                scenario_frames_global_post.append(global_post)
-            if not curve_stats.empty:
-                scenario_frames_curve.append(curve_stats)
-            if not per_run_raw.empty:
-                scenario_frames_per_run_raw.append(per_run_raw)
-            if not per_run_post.empty:
-                scenario_frames_per_run_post.append(per_run_post)
-
-        outdir = stats_dirs[scenario]
-
-        if scenario_frames_global_raw:
-            global_raw_df = pd.concat(scenario_frames_global_raw, ignore_index=True)
-            global_raw_df = round_numeric_columns(global_raw_df)
-            global_raw_df.to_csv(outdir / "global_raw_stats.csv", index=False)
-
-        if scenario_frames_global_post:
-            global_post_df = pd.concat(scenario_frames_global_post, ignore_index=True)
-            global_post_df = round_numeric_columns(global_post_df)
-            global_post_df.to_csv(outdir / "global_post_selected_stats.csv", index=False)
-
-        if scenario_frames_curve:
-            curve_df = pd.concat(scenario_frames_curve, ignore_index=True)
-            curve_df = round_numeric_columns(curve_df)
-            curve_df.to_csv(outdir / "aggregated_curve_stats.csv", index=False)
-
-        if scenario_frames_per_run_raw:
-            per_run_raw_df = pd.concat(scenario_frames_per_run_raw, ignore_index=True)
-            per_run_raw_df = round_numeric_columns(per_run_raw_df)
-            per_run_raw_df.to_csv(outdir / "per_run_summary.csv", index=False)
-
-        if scenario_frames_per_run_post:
-            per_run_post_df = pd.concat(scenario_frames_per_run_post, ignore_index=True)
-            per_run_post_df = round_numeric_columns(per_run_post_df)
-            per_run_post_df.to_csv(outdir / "per_run_post_selected_summary.csv", index=False)
+        if not global_raw.empty:
+            scenario_frames_global_raw.append(global_raw)
+        if not global_post.empty:
+            scenario_frames_global_post.append(global_post)
+        if not curve_stats.empty:
+            scenario_frames_curve.append(curve_stats)
+        if not per_run_raw.empty:
+            scenario_frames_per_run_raw.append(per_run_raw)
+        if not per_run_post.empty:
+            scenario_frames_per_run_post.append(per_run_post)
+
+    tables = {
+        "global_raw_stats.csv": scenario_frames_global_raw,
+        "global_post_selected_stats.csv": scenario_frames_global_post,
+        "aggregated_curve_stats.csv": scenario_frames_curve,
+        "per_run_summary.csv": scenario_frames_per_run_raw,
+        "per_run_post_selected_summary.csv": scenario_frames_per_run_post,
+    }
+    with span("stats.write", scenario=scenario):
+        for name, frames in tables.items():
+            if frames:
+                df = round_numeric_columns(pd.concat(frames, ignore_index=True))
+                write_csv_atomic(df, outdir / name, inputs=inputs)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compute aggregated statistics for NTPsec multiple-run analysis.")
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Root directory of NTPsec multi-run logs, e.g. .../analysis/raw_logs/T3_multiplerun/ntpsec",
+    )
+    add_profile_args(ap)
+    args = ap.parse_args()
+
+    root = args.root.resolve()
+    if not root.exists() or not root.is_dir():
+        raise FileNotFoundError(f"Root directory not found: {root}")
+
+    stats_dirs = ensure_stats_dirs(root)
+
+    with profile_session(args, "ntpsec_stats_aggregated"):
+        with campaign_outputs(root, producer="ntpsec_stats_aggregated"):
+            stage("stats")
+            for scenario in SCENARIOS:
+                write_scenario_stats(root, scenario, stats_dirs[scenario])
 
     print(f"[OK] NTPsec aggregated statistics saved in: {root / '_aggregated' / 'stats'}")
 
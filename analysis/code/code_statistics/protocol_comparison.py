@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from async_io import save_current_figure  # noqa: E402
+from atomic_output import campaign_outputs, output_inputs, write_csv_atomic  # noqa: E402
+from cross_run import mean_ci  # noqa: E402
+from run_series import KEY, SCENARIOS, SERIES, SeriesSpec, load_series, run_times, value_rows  # noqa: E402
+
+
+# Confronto NTP vs PTP (README, Fase 4): ogni campagna viene riletta dai CSV parsed per-run e
+# le sue grandezze vengono riportate su un vocabolario comune, in ns e secondi:
+# - steady_offset_ns: RMS dell'offset dopo l'aggancio (per il client PTP, RMS dei valori rms)
+# - dispersion_ns: deviazione standard dell'offset con segno dopo l'aggancio (non definita per
+#   il client PTP, che registra solo rms/max)
+# - delay_ns: ritardo di percorso a una via (mean path delay PTP, delay NTP / 2); chrony non
+#   registra il ritardo nei campioni parsati
+# - time_to_lock_s: dal primo evento del log all'aggancio (PTP: prima transizione a SLAVE,
+#   NTPsec: primo peer selezionato). Le serie chrony iniziano a sincronizzazione gia' avvenuta:
+#   tutti i campioni sono a regime e il tempo di aggancio non e' osservabile.
+
+QUANTITIES = ["steady_offset_ns", "dispersion_ns", "delay_ns", "time_to_lock_s"]
+
+# griglia comune delle curve sovrapposte: cadenza degli snapshot ntpq
+CURVE_BIN_S = 15.0
+
+CURVE_QUANTITIES = {
+    "offset_abs_ns": "|offset| (ns, RMS per bin)",
+    "delay_ns": "one-way delay (ns)",
+}
+
+
+# ----------------------------
+# Per-run quantities
+# ----------------------------
+
+def run_quantities(spec: SeriesSpec, samples: pd.DataFrame, events: pd.DataFrame) -> pd.DataFrame:
+    """Una riga per run con le grandezze comuni; tutte le run di una serie in un solo groupby."""
+    t = spec.time_col
+    if samples.empty:
+        return pd.DataFrame(columns=["protocol", *KEY, "locked", *QUANTITIES])
+
+    runs = run_times(spec, samples, events)
+    s = value_rows(spec, samples).join(runs, on=KEY)
+    post = s[s[t] >= s["t_lock"]]
+
+    offset = post[spec.offset_col]
+    g_key = [post[c] for c in KEY]
+    out = pd.DataFrame({"steady_offset_ns": np.sqrt((offset ** 2).groupby(g_key).mean())})
+    out["dispersion_ns"] = np.nan if spec.offset_is_rms else offset.groupby(g_key).std(ddof=1)
+    if spec.delay_col:
+        out["delay_ns"] = post[spec.delay_col].groupby(g_key).mean() * spec.delay_one_way
+    else:
+        out["delay_ns"] = np.nan
+
+    out = runs.join(out, how="left")
+    out["locked"] = out["t_lock"].notna()
+    out["time_to_lock_s"] = np.nan if spec.lock == "none" else out["t_lock"] - out["t0"]
+    out = out.reset_index()
+    out.insert(0, "protocol", spec.protocol)
+    return out[["protocol", *KEY, "locked", *QUANTITIES]]
+
+
+def run_curves(spec: SeriesSpec, samples: pd.DataFrame, events: pd.DataFrame) -> pd.DataFrame:
+    """Per run e bin di CURVE_BIN_S dall'inizio: RMS dell'offset e ritardo medio (long)."""
+    t = spec.time_col
+    if samples.empty:
+        return pd.DataFrame()
+    s = value_rows(spec, samples).join(run_times(spec, samples, events)["t0"], on=KEY)
+    t_bin = np.floor((s[t] - s["t0"]) / CURVE_BIN_S) * CURVE_BIN_S
+
+    g_key = [s["scenario"], s["run_id"], t_bin.rename("t_bin_s")]
+    per_bin = pd.DataFrame({
+        "offset_abs_ns": np.sqrt((s[spec.offset_col] ** 2).groupby(g_key).mean()),
+        "delay_ns": (
+            s[spec.delay_col].groupby(g_key).mean() * spec.delay_one_way
+            if spec.delay_col else np.nan
+        ),
+    })
+    long = per_bin.reset_index().melt(
+        id_vars=[*KEY, "t_bin_s"], value_vars=list(CURVE_QUANTITIES), var_name="quantity"
+    )
+    long.insert(0, "protocol", spec.protocol)
+    return long.dropna(subset=["value"])
+
+
+# ----------------------------
+# Matrix and curves
+# ----------------------------
+
+def comparison_matrix(per_run: pd.DataFrame) -> pd.DataFrame:
+    """Scenario x protocollo x grandezza: media tra run con CI95 (t di Student) e mediana."""
+    long = per_run.melt(
+        id_vars=["protocol", *KEY], value_vars=QUANTITIES, var_name="quantity"
+    )
+    out = mean_ci(long, ["scenario", "protocol", "quantity"], "value")
+    return out.merge(run_counts(per_run), on=["scenario", "protocol"], how="left")
+
+
+def run_counts(per_run: pd.DataFrame) -> pd.DataFrame:
+    return per_run.groupby(["scenario", "protocol"], observed=True).agg(
+        runs_total=("run_id", "size"), runs_locked=("locked", "sum")
+    ).reset_index()
+
+
+def comparison_table(matrix: pd.DataFrame, per_run: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tabella larga per il report: una riga per scenario e protocollo, 'mean [ci_low, ci_high]';
+    le coppie senza run agganciate restano con le sole colonne di conteggio.
+    """
+    cell = matrix.assign(cell=[
+        f"{m:.4g} [{lo:.4g}, {hi:.4g}] (n={n})"
+        for m, lo, hi, n in zip(matrix["mean"], matrix["ci95_low"], matrix["ci95_high"], matrix["n_runs"])
+    ])
+    table = cell.pivot(index=["scenario", "protocol"], columns="quantity", values="cell")
+    table = table.reindex(columns=QUANTITIES)
+    table = run_counts(per_run).join(table, on=["scenario", "protocol"])
+    table["_ord"] = table["scenario"].map({s: i for i, s in enumerate(SCENARIOS)})
+    table["_p_ord"] = table["protocol"].map({s.protocol: i for i, s in enumerate(SERIES)})
+    return table.sort_values(["_ord", "_p_ord"]).drop(columns=["_ord", "_p_ord"]).reset_index(drop=True)
+
+
+def comparison_curves(curves: pd.DataFrame) -> pd.DataFrame:
+    return mean_ci(curves, ["quantity", "scenario", "protocol", "t_bin_s"], "value")
+
+
+def plot_overlay(curves: pd.DataFrame, quantity: str, scenario: str, outpath: Path) -> None:
+    sub = curves[(curves["quantity"] == quantity) & (curves["scenario"] == scenario)]
+    if sub.empty:
+        return
+
+    plt.figure(figsize=(9, 5))
+    for spec in SERIES:
+        c = sub[sub["protocol"] == spec.protocol]
+        if c.empty:
+            continue
+        line, = plt.plot(c["t_bin_s"], c["mean"], label=spec.protocol)
+        # asse log: dove il CI scende sotto zero la banda resta aperta invece di toccare il fondo
+        plt.fill_between(
+            c["t_bin_s"], c["ci95_low"].where(c["ci95_low"] > 0), c["ci95_high"],
+            alpha=0.15, color=line.get_color(),
+        )
+    plt.yscale("log")
+    plt.xlabel("time since run start (s)")
+    plt.ylabel(CURVE_QUANTITIES[quantity])
+    plt.title(f"{scenario} - {quantity} - mean across runs + 95% CI")
+    plt.legend(fontsize=8)
+    plt.tight_layout()
+    save_current_figure(outpath)
+
+
+# ----------------------------
+# Main
+# ----------------------------
+
+def build_comparison(root: Path) -> Dict[str, object]:
+    inputs: List[Path] = []
+    per_run, curves = [], []
+    for spec in SERIES:
+        if not (root / spec.campaign).is_dir():
+            continue
+        samples, events = load_series(root, spec, inputs)
+        per_run.append(run_quantities(spec, samples, events))
+        curves.append(run_curves(spec, samples, events))
+
+    per_run = [p for p in per_run if not p.empty]
+    curves = [c for c in curves if not c.empty]
+    if not per_run:
+        return {}
+
+    per_run_df = pd.concat(per_run, ignore_index=True)
+    matrix = comparison_matrix(per_run_df)
+    return {
+        "inputs": inputs,
+        "per_run": per_run_df,
+        "matrix": matrix,
+        "table": comparison_table(matrix, per_run_df),
+        "curves": comparison_curves(pd.concat(curves, ignore_index=True)) if curves else pd.DataFrame(),
+    }
+
+
+def write_comparison(root: Path, out_dir: Path) -> List[Path]:
+    result = build_comparison(root)
+    if not result:
+        return []
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    inputs = result["inputs"]
+    produced = []
+    for name in ("per_run", "matrix", "table"):
+        out_csv = out_dir / f"comparison_{name}.csv"
+        write_csv_atomic(result[name], out_csv, inputs=inputs)
+        produced.append(out_csv)
+
+    curves = result["curves"]
+    if not curves.empty:
+        curves_dir = out_dir / "curves"
+        curves_dir.mkdir(parents=True, exist_ok=True)
+        with output_inputs(inputs):
+            for quantity in CURVE_QUANTITIES:
+                for scenario in SCENARIOS:
+                    sub = curves[(curves["quantity"] == quantity) & (curves["scenario"] == scenario)]
+                    if sub.empty:
+                        continue
+                    out_csv = curves_dir / f"{quantity}_{scenario}.csv"
+                    write_csv_atomic(sub.drop(columns=["quantity"]), out_csv, inputs=inputs)
+                    plot_overlay(curves, quantity, scenario, curves_dir / f"{quantity}_{scenario}.png")
+                    produced.append(out_csv)
+    return produced
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description="Compare PTP, NTPsec and chrony campaigns on a shared set of metrics from parsed per-run CSVs."
+    )
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Multi-run root holding the campaign directories (ptp, ntpsec, chrony_*), "
+        "e.g. .../analysis/raw_logs/T3_multiplerun",
+    )
+    ap.add_argument(
+        "--out",
+        type=Path,
+        default=None,
+        help="Output directory (default: <root>/_comparison)",
+    )
+    args = ap.parse_args()
+
+    root = args.root.resolve()
+    out_dir = args.out.resolve() if args.out else root / "_comparison"
+
+    with campaign_outputs(root, producer="protocol_comparison"):
+        produced = write_comparison(root, out_dir)
+
+    if not produced:
+        raise RuntimeError("Nessun CSV parsed per-run trovato. Esegui prima i driver *_analysis_v3.py.")
+
+    print("[OK] File di confronto creati:")
+    for p in produced:
+        print(f" - {p}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from async_io import save_current_figure  # noqa: E402
+from atomic_output import campaign_outputs, output_inputs, write_csv_atomic  # noqa: E402
+from cross_run import mean_ci  # noqa: E402
+from run_series import KEY, SCENARIOS, SERIES, SeriesSpec, load_series, run_times, value_rows  # noqa: E402
+from spectral import DEFAULT_NPERSEG, batched_welch, psd_long, resample_uniform  # noqa: E402
+from stability import sampling_interval  # noqa: E402
+
+
+# PSD di Welch di offset e path delay dopo l'aggancio, per cercare righe spettrali del
+# limitatore tbf e dell'intervallo del servo negli scenari netem. Per ogni scenario tutte le
+# run passano da una sola FFT; gli spettri per run vengono mediati con CI95 per frequenza.
+
+DEFAULT_CAMPAIGNS = ["ptp"]
+
+
+def series_metrics(spec: SeriesSpec) -> List[str]:
+    return [
+        *([] if spec.offset_is_rms else [spec.offset_col]),
+        *([spec.delay_col] if spec.delay_col else []),
+    ]
+
+
+def scenario_psd(
+    spec: SeriesSpec, post: pd.DataFrame, metric: str, dt: float, nperseg: int
+) -> pd.DataFrame:
+    s = post.dropna(subset=[metric]).sort_values([*KEY, spec.time_col], kind="mergesort")
+    if s.empty:
+        return pd.DataFrame()
+    codes = s.groupby(KEY, sort=True, observed=True).ngroup().to_numpy()
+    keys = s[KEY].drop_duplicates().reset_index(drop=True)
+
+    y, grid_runs = resample_uniform(s[spec.time_col].to_numpy(), s[metric].to_numpy(), codes, dt)
+    freqs, psd, _ = batched_welch(y, grid_runs, 1.0 / dt, nperseg)
+    long = psd_long(freqs, psd, keys)
+    if long.empty:
+        return pd.DataFrame()
+    return mean_ci(long, ["freq_hz"], "psd")
+
+
+def plot_psd(df: pd.DataFrame, title: str, unit: str, outpath: Path) -> None:
+    # DC escluso: la media per segmento e' tolta
+    c = df[df["freq_hz"] > 0]
+    if c.empty:
+        return
+
+    plt.figure()
+    plt.plot(c["freq_hz"], c["mean"], label="mean")
+    plt.fill_between(
+        c["freq_hz"], c["ci95_low"].where(c["ci95_low"] > 0), c["ci95_high"], alpha=0.25, label="95% CI"
+    )
+    plt.xscale("log")
+    plt.yscale("log")
+    plt.xlabel("frequency (Hz)")
+    plt.ylabel(f"PSD ({unit}^2/Hz)")
+    plt.title(f"{title} - Welch PSD, mean across runs")
+    plt.legend()
+    plt.tight_layout()
+    save_current_figure(outpath)
+
+
+def write_series_psd(root: Path, spec: SeriesSpec, nperseg: int) -> List[Path]:
+    inputs: List[Path] = []
+    samples, events = load_series(root, spec, inputs)
+    if samples.empty:
+        return []
+
+    s = value_rows(spec, samples).join(run_times(spec, samples, events), on=KEY)
+    post = s[s[spec.time_col] >= s["t_lock"]]
+    codes = post.groupby(KEY, sort=False, observed=True).ngroup()
+    dt = sampling_interval(post[spec.time_col], codes)
+    if not np.isfinite(dt):
+        return []
+
+    produced = []
+    with output_inputs(inputs):
+        for scenario in SCENARIOS:
+            sub = post[post["scenario"] == scenario]
+            out_dir = root / spec.campaign / "_aggregated" / spec.role / scenario
+            for metric in series_metrics(spec):
+                agg = scenario_psd(spec, sub, metric, dt, nperseg)
+                if agg.empty:
+                    continue
+                out_dir.mkdir(parents=True, exist_ok=True)
+                out_csv = out_dir / f"{metric}_psd_aggregated.csv"
+                write_csv_atomic(agg, out_csv, inputs=inputs)
+                plot_psd(
+                    agg, f"{spec.protocol} - {scenario} - {metric}",
+                    metric.rsplit("_", 1)[-1], out_dir / f"{metric}_psd.png",
+                )
+                produced.append(out_csv)
+    return produced
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description="Compute Welch power spectral densities of offset and path delay across runs "
+        "from parsed per-run CSVs."
+    )
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Multi-run root holding the campaign directories (ptp, ntpsec, chrony_*), "
+        "e.g. .../analysis/raw_logs/T3_multiplerun",
+    )
+    ap.add_argument(
+        "--campaign",
+        action="append",
+        default=None,
+        help="Campaign directories to analyse (repeatable; default: ptp)",
+    )
+    ap.add_argument(
+        "--nperseg",
+        type=int,
+        default=DEFAULT_NPERSEG,
+        help=f"Welch segment length in resampled samples, 50%% overlap (default: {DEFAULT_NPERSEG})",
+    )
+    args = ap.parse_args()
+
+    root = args.root.resolve()
+    campaigns = args.campaign or DEFAULT_CAMPAIGNS
+    produced: List[Path] = []
+    for spec in SERIES:
+        if spec.campaign not in campaigns or not (root / spec.campaign).is_dir():
+            continue
+        with campaign_outputs(root / spec.campaign, producer="psd_aggregated"):
+            produced.extend(write_series_psd(root, spec, args.nperseg))
+
+    if not produced:
+        raise RuntimeError("Nessuno spettro prodotto. Esegui prima i driver *_analysis_v3.py.")
+
+    print("[OK] File PSD creati:")
+    for p in produced:
+        print(f" - {p}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,19 @@
 from __future__ import annotations
 
 import argparse
+import sys
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from atomic_output import campaign_outputs, write_csv_atomic  # noqa: E402
+from outlier_filter import filtered_name  # noqa: E402
+from profiling import add_profile_args, profile_session, span, stage  # noqa: E402
+
 
 SCENARIOS = ["low", "medium", "high"]
 
@@ -72,7 +79,8 @@ def compute_abs_stats(series: pd.Series, prefix: str) -> Dict[str, float]:
 
 
 def summarize_aggregated_file(csv_path: Path, role: str, scenario: str, metric: str) -> Dict[str, object]:
-    df = pd.read_csv(csv_path)
+    with span("stats.load", scenario=scenario, role=role, metric=metric):
+        df = pd.read_csv(csv_path)
 
     out: Dict[str, object] = {
         "role": role,
@@ -85,11 +93,11 @@ def summarize_aggregated_file(csv_path: Path, role: str, scenario: str, metric:
     # curva centrale
     if "mean" in df.columns:
         out.update(compute_basic_stats(df["mean"], "central"))
-        if metric == "offset_ns":
+        if metric in ("offset_ns", filtered_name("offset_ns")):
             out.update(compute_abs_stats(df["mean"], "central"))
     else:
         out.update(compute_basic_stats(pd.Series(dtype=float), "central"))
-        if metric == "offset_ns":
+        if metric in ("offset_ns", filtered_name("offset_ns")):
             out.update(compute_abs_stats(pd.Series(dtype=float), "central"))
 
     # banda IQR
@@ -131,7 +139,8 @@ def build_scenario_stats(root: Path, scenario: str) -> pd.DataFrame:
         if not role_dir.exists():
             continue
 
-        for metric in metrics:
+        # curve filtered_<metrica> solo se i driver hanno girato con --outlier-filter
+        for metric in [*metrics, *(filtered_name(m) for m in metrics)]:
             csv_path = role_dir / f"{metric}_aggregated.csv"
             if not csv_path.exists():
                 continue
@@ -149,6 +158,7 @@ def build_scenario_stats(root: Path, scenario: str) -> pd.DataFrame:
         "offset_ns": 1,
         "path_delay_ns": 2,
     }
+    metric_order.update({filtered_name(m): i + len(metric_order) for m, i in metric_order.items()})
 
     out["_role_ord"] = out["role"].map(role_order)
     out["_metric_ord"] = out["metric"].map(metric_order)
@@ -161,6 +171,26 @@ def build_scenario_stats(root: Path, scenario: str) -> pd.DataFrame:
     return out
 
 
+def _stats_inputs(root: Path, scenario: str) -> List[Path]:
+    return sorted((root / "_aggregated").glob(f"*/{scenario}/*_aggregated.csv"))
+
+
+def write_scenario_stats(root: Path, scenario: str) -> Optional[Path]:
+    inputs = _stats_inputs(root, scenario)
+    scenario_dir = root / "_aggregated" / "stats" / scenario
+    scenario_dir.mkdir(parents=True, exist_ok=True)
+
+    with span("stats.compute", scenario=scenario):
+        df = build_scenario_stats(root, scenario)
+    if df.empty:
+        return None
+
+    out_csv = scenario_dir / f"ptp_stats_{scenario}.csv"
+    with span("stats.write", scenario=scenario):
+        write_csv_atomic(df, out_csv, inputs=inputs)
+    return out_csv
+
+
 def main() -> None:
     ap = argparse.ArgumentParser(description="Build PTP statistics tables from already aggregated multi-run CSVs.")
     ap.add_argument(
@@ -169,6 +199,7 @@ def main() -> None:
         required=True,
         help="PTP root directory, e.g. .../analysis/raw_logs/T3_multiplerun/ptp",
     )
+    add_profile_args(ap)
     args = ap.parse_args()
 
     root = args.root.resolve()
@@ -181,17 +212,13 @@ def main() -> None:
 
     produced = []
 
-    for scenario in SCENARIOS:
-        scenario_dir = stats_root / scenario
-        scenario_dir.mkdir(parents=True, exist_ok=True)
-
-        df = build_scenario_stats(root, scenario)
-        if df.empty:
-            continue
-
-        out_csv = scenario_dir / f"ptp_stats_{scenario}.csv"
-        df.to_csv(out_csv, index=False)
-        produced.append(out_csv)
+    with profile_session(args, "ptp_stats_aggregated"):
+        with campaign_outputs(root, producer="ptp_stats_aggregated"):
+            stage("stats")
+            for scenario in SCENARIOS:
+                out_csv = write_scenario_stats(root, scenario)
+                if out_csv is not None:
+                    produced.append(out_csv)
 
     if not produced:
         raise RuntimeError("Nessun file statistico prodotto. Controlla che i CSV aggregati esistano.")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from async_io import save_current_figure  # noqa: E402
+from atomic_output import campaign_outputs, output_inputs, write_csv_atomic  # noqa: E402
+from cross_run import mean_ci  # noqa: E402
+from rolling_stats import DEFAULT_WINDOW_S, ROLLING_STATS, rolling_stats  # noqa: E402
+from run_series import KEY, SCENARIOS, SERIES, SeriesSpec, load_series, run_times, value_rows  # noqa: E402
+
+
+# Statistiche mobili nel tempo (finestre di --window-s secondi) delle serie di offset/rms e
+# ritardo di ogni run, invece del solo riassunto globale post-lock:
+# - per run: <run>/rolling_<role>_<metric>.csv, una riga per campione con sample_idx e t_rel_s
+#   come i CSV parsed, quindi aggregabile per sample_idx come le altre curve per-run
+# - per scenario: media tra le run (CI95) di ogni statistica su bin di --window-s secondi,
+#   <metric>_rolling_aggregated.csv in _aggregated/<role>/<scenario>/, con grafico di std e MAD
+
+PLOT_STATS = ["std", "mad"]
+
+
+def run_rolling(spec: SeriesSpec, s: pd.DataFrame, metric: str, window_s: float) -> pd.DataFrame:
+    """Statistiche mobili di una run (righe ordinate per tempo, senza NaN in metric)."""
+    out = rolling_stats(s[spec.time_col].to_numpy(), s[metric].to_numpy(), window_s)
+    out.insert(0, "t_rel_s", (s[spec.time_col] - s["t0"]).to_numpy())
+    out.insert(0, "sample_idx", range(len(out)))
+    out.insert(0, spec.time_col, s[spec.time_col].to_numpy())
+    return out
+
+
+def aggregate_rolling(per_run: pd.DataFrame, bin_s: float) -> pd.DataFrame:
+    """Media per run in bin di bin_s secondi, poi media tra le run con CI95, per statistica."""
+    df = per_run.assign(t_bin_s=(per_run["t_rel_s"] // bin_s) * bin_s)
+    binned = df.groupby([*KEY, "t_bin_s"], observed=True)[ROLLING_STATS].mean().reset_index()
+    long = binned.melt(id_vars=[*KEY, "t_bin_s"], value_vars=ROLLING_STATS, var_name="stat").dropna(subset=["value"])
+    return mean_ci(long, ["scenario", "stat", "t_bin_s"], "value")
+
+
+def plot_rolling(df: pd.DataFrame, title: str, window_s: float, outpath: Path) -> None:
+    sub = df[df["stat"].isin(PLOT_STATS)]
+    if sub.empty:
+        return
+
+    plt.figure(figsize=(9, 5))
+    for stat in PLOT_STATS:
+        c = sub[sub["stat"] == stat]
+        if c.empty:
+            continue
+        line, = plt.plot(c["t_bin_s"], c["mean"], label=f"rolling {stat}")
+        plt.fill_between(c["t_bin_s"], c["ci95_low"], c["ci95_high"], alpha=0.2, color=line.get_color())
+    plt.xlabel("time since run start (s)")
+    plt.ylabel("ns")
+    plt.title(f"{title} - {window_s:g} s window, mean across runs + 95% CI")
+    plt.legend()
+    plt.tight_layout()
+    save_current_figure(outpath)
+
+
+def write_series_rolling(root: Path, spec: SeriesSpec, window_s: float) -> List[Path]:
+    inputs: List[Path] = []
+    samples, events = load_series(root, spec, inputs)
+    if samples.empty:
+        return []
+
+    s = value_rows(spec, samples).join(run_times(spec, samples, events)["t0"], on=KEY)
+    s = s.sort_values([*KEY, spec.time_col], kind="mergesort")
+    metrics = [spec.offset_col, *([spec.delay_col] if spec.delay_col else [])]
+
+    produced = []
+    with output_inputs(inputs):
+        for metric in metrics:
+            frames = []
+            for (scenario, run_id), g in s.dropna(subset=[metric]).groupby(KEY, sort=True, observed=True):
+                out = run_rolling(spec, g, metric, window_s)
+                out_csv = root / spec.campaign / scenario / run_id / f"rolling_{spec.role}_{metric}.csv"
+                write_csv_atomic(out, out_csv, inputs=inputs)
+                produced.append(out_csv)
+                frames.append(out.assign(scenario=scenario, run_id=run_id))
+            if not frames:
+                continue
+
+            agg = aggregate_rolling(pd.concat(frames, ignore_index=True), window_s)
+            for scenario in SCENARIOS:
+                sub = agg[agg["scenario"] == scenario].drop(columns=["scenario"])
+                if sub.empty:
+                    continue
+                out_dir = root / spec.campaign / "_aggregated" / spec.role / scenario
+                out_dir.mkdir(parents=True, exist_ok=True)
+                out_csv = out_dir / f"{metric}_rolling_aggregated.csv"
+                write_csv_atomic(sub, out_csv, inputs=inputs)
+                plot_rolling(
+                    sub, f"{spec.protocol} - {scenario} - {metric}", window_s,
+                    out_dir / f"{metric}_rolling.png",
+                )
+                produced.append(out_csv)
+    return produced
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description="Compute rolling time-window statistics (mean, std, min/max, median, MAD, quantiles) "
+        "of per-run series and aggregate them across runs."
+    )
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Multi-run root holding the campaign directories (ptp, ntpsec, chrony_*), "
+        "e.g. .../analysis/raw_logs/T3_multiplerun",
+    )
+    ap.add_argument(
+        "--campaign",
+        action="append",
+        default=None,
+        help="Only these campaign directories (repeatable; default: all present)",
+    )
+    ap.add_argument(
+        "--window-s",
+        type=float,
+        default=DEFAULT_WINDOW_S,
+        help=f"Rolling window length in seconds; also the bin width of the aggregated curves "
+        f"(default: {DEFAULT_WINDOW_S:g})",
+    )
+    args = ap.parse_args()
+
+    root = args.root.resolve()
+    produced: List[Path] = []
+    for spec in SERIES:
+        if not (root / spec.campaign).is_dir():
+            continue
+        if args.campaign and spec.campaign not in args.campaign:
+            continue
+        with campaign_outputs(root / spec.campaign, producer="rolling_aggregated"):
+            produced.extend(write_series_rolling(root, spec, args.window_s))
+
+    if not produced:
+        raise RuntimeError("Nessuna statistica mobile prodotta. Esegui prima i driver *_analysis_v3.py.")
+
+    print(f"[OK] File di statistiche mobili creati: {len(produced)}")
+    for p in produced:
+        if "_aggregated" in p.parts:
+            print(f" - {p}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from async_io import save_current_figure  # noqa: E402
+from atomic_output import campaign_outputs, output_inputs, write_csv_atomic  # noqa: E402
+from cross_run import mean_ci  # noqa: E402
+from run_series import KEY, SCENARIOS, SERIES, SeriesSpec, load_series, run_times, value_rows  # noqa: E402
+from spectral import resample_uniform  # noqa: E402
+from stability import STATS, batched_stability, sampling_interval, tau_grid  # noqa: E402
+
+
+# ADEV/MDEV/TDEV/MTIE per run delle serie di offset con segno (boundary PTP, peer ntpq
+# selezionato, System time di chrony) dopo l'aggancio, con lo stesso taglio delle PSD
+# (t >= t_lock di run_times), aggregate tra le run di ogni scenario per tau come le curve per
+# sample_idx. Le statistiche richiedono campioni equispaziati: ogni run e' ricampionata sulla
+# griglia t_lock + k * tau0, con tau0 = mediana degli intervalli della serie (1 s PTP, 15 s
+# ntpq, ~60 s chrony), interpolando linearmente sui buchi (messaggi persi, righe NaN di
+# --reindex-cadence) invece di accostare i campioni ai lati del buco.
+
+STAT_LABELS = {
+    "adev": "ADEV",
+    "mdev": "MDEV",
+    "tdev": "TDEV (ns)",
+    "mtie": "MTIE (ns)",
+}
+
+
+def series_stability(spec: SeriesSpec, samples: pd.DataFrame, events: pd.DataFrame) -> pd.DataFrame:
+    """Statistiche per run (scenario, run_id, m, tau_s, adev..mtie), tutte le run in un solo passo per m."""
+    s = value_rows(spec, samples).join(run_times(spec, samples, events), on=KEY)
+    s = s[s[spec.time_col] >= s["t_lock"]].dropna(subset=[spec.offset_col])
+    if s.empty:
+        return pd.DataFrame()
+    s = s.sort_values([*KEY, spec.time_col], kind="mergesort")
+
+    # s e' ordinato per run: codici 0..R-1 nello stesso ordine delle chiavi distinte
+    codes = s.groupby(KEY, sort=True, observed=True).ngroup().to_numpy()
+    keys = s[KEY].drop_duplicates().reset_index(drop=True)
+    tau0 = sampling_interval(s[spec.time_col], pd.Series(codes, index=s.index))
+    if not np.isfinite(tau0):
+        return pd.DataFrame()
+    y, grid_runs = resample_uniform(s[spec.time_col].to_numpy(), s[spec.offset_col].to_numpy(), codes, tau0)
+    # stessa griglia di tau per tutti gli scenari della serie
+    ms = tau_grid(int(np.bincount(grid_runs).max()))
+
+    out = batched_stability(y, grid_runs, tau0, ms)
+    return keys.iloc[out["run"]].reset_index(drop=True).join(out.drop(columns=["run"]))
+
+
+def aggregate_stability(per_run: pd.DataFrame) -> pd.DataFrame:
+    long = per_run.melt(id_vars=[*KEY, "m", "tau_s"], value_vars=STATS, var_name="stat")
+    out = mean_ci(long, ["scenario", "stat", "m", "tau_s"], "value")
+    out["_ord"] = out["stat"].map({s: i for i, s in enumerate(STATS)})
+    return out.sort_values(["scenario", "_ord", "m"]).drop(columns=["_ord"]).reset_index(drop=True)
+
+
+def plot_stability(df: pd.DataFrame, title: str, outpath: Path) -> None:
+    if df.empty:
+        return
+
+    fig, axes = plt.subplots(1, 2, figsize=(11, 4.5))
+    for ax, stats in zip(axes, (["adev", "mdev"], ["tdev", "mtie"])):
+        for stat in stats:
+            c = df[df["stat"] == stat]
+            if c.empty:
+                continue
+            line, = ax.plot(c["tau_s"], c["mean"], marker=".", label=STAT_LABELS[stat])
+            ax.fill_between(
+                c["tau_s"], c["ci95_low"].where(c["ci95_low"] > 0), c["ci95_high"],
+                alpha=0.2, color=line.get_color(),
+            )
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.set_xlabel("tau (s)")
+        ax.legend()
+    axes[0].set_ylabel("deviation")
+    axes[1].set_ylabel("time error (ns)")
+    fig.suptitle(f"{title} - mean across runs + 95% CI")
+    fig.tight_layout()
+    save_current_figure(outpath)
+
+
+def write_series_stability(root: Path, spec: SeriesSpec) -> List[Path]:
+    inputs: List[Path] = []
+    samples, events = load_series(root, spec, inputs)
+    per_run = series_stability(spec, samples, events)
+    if per_run.empty:
+        return []
+
+    agg = aggregate_stability(per_run)
+    produced = []
+    with output_inputs(inputs):
+        for scenario in SCENARIOS:
+            sub = agg[agg["scenario"] == scenario].drop(columns=["scenario"])
+            if sub.empty:
+                continue
+            out_dir = root / spec.campaign / "_aggregated" / spec.role / scenario
+            out_dir.mkdir(parents=True, exist_ok=True)
+            out_csv = out_dir / f"{spec.offset_col}_stability_aggregated.csv"
+            write_csv_atomic(sub, out_csv, inputs=inputs)
+            plot_stability(
+                sub, f"{spec.protocol} - {scenario} - {spec.offset_col}",
+                out_dir / f"{spec.offset_col}_stability.png",
+            )
+            produced.append(out_csv)
+    return produced
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description="Compute ADEV, MDEV, TDEV and MTIE of offset series across runs from parsed per-run CSVs."
+    )
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Multi-run root holding the campaign directories (ptp, ntpsec, chrony_*), "
+        "e.g. .../analysis/raw_logs/T3_multiplerun",
+    )
+    ap.add_argument(
+        "--campaign",
+        action="append",
+        default=None,
+        help="Only these campaign directories (repeatable; default: all present)",
+    )
+    args = ap.parse_args()
+
+    root = args.root.resolve()
+    produced: List[Path] = []
+    for spec in SERIES:
+        if spec.offset_is_rms or not (root / spec.campaign).is_dir():
+            continue
+        if args.campaign and spec.campaign not in args.campaign:
+            continue
+        with campaign_outputs(root / spec.campaign, producer="stability_aggregated"):
+            produced.extend(write_series_stability(root, spec))
+
+    if not produced:
+        raise RuntimeError("Nessun file di stabilita' prodotto. Esegui prima i driver *_analysis_v3.py.")
+
+    print("[OK] File di stabilita' creati:")
+    for p in produced:
+        print(f" - {p}")
+
+
+if __name__ == "__main__":
+    main()
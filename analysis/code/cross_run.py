@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+
+# Statistiche tra run in forma vettoriale: un groupby per tutte le celle (scenario, protocollo,
+# grandezza, ...) invece di un agg_fn per gruppo. Stesso CI95 dei driver: t di Student con
+# tabella fino a 30 gradi di liberta', poi 1.96.
+
+T_CRITICAL_95 = np.array([
+    np.nan,
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+])
+
+
+def t_critical_95(n) -> np.ndarray:
+    """Quantile 97.5% della t di Student con n-1 gradi di liberta' (NaN per n <= 1)."""
+    df = np.asarray(n, dtype=np.int64) - 1
+    out = np.where(df < len(T_CRITICAL_95), T_CRITICAL_95[np.clip(df, 0, len(T_CRITICAL_95) - 1)], 1.96)
+    return np.where(df >= 1, out, np.nan)
+
+
+def mean_ci(df: pd.DataFrame, by: Sequence[str], value: str) -> pd.DataFrame:
+    """
+    n_runs, mean, std, ci95_low/high, q50 di `value` per gruppo `by` (NaN esclusi); con una
+    sola run std e semiampiezza valgono 0 come nelle curve aggregate.
+    """
+    vals = pd.to_numeric(df[value], errors="coerce")
+    g = vals.groupby([df[c] for c in by], sort=True, observed=True)
+    out = pd.DataFrame({
+        "n_runs": g.count(),
+        "mean": g.mean(),
+        "std": g.std(ddof=1),
+        "q50": g.median(),
+    })
+    n = out["n_runs"].to_numpy()
+    std = np.where(n > 1, out["std"].to_numpy(dtype=float), 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        half = np.where(n > 1, t_critical_95(n) * std / np.sqrt(np.maximum(n, 1)), 0.0)
+    out["std"] = np.where(n > 0, std, np.nan)
+    out["ci95_low"] = out["mean"] - half
+    out["ci95_high"] = out["mean"] + half
+    out = out[out["n_runs"] > 0]
+    return out[["n_runs", "mean", "std", "ci95_low", "ci95_high", "q50"]].reset_index()
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from async_io import write_csv, write_npz
+from frame_schema import disk_frame
+from time_base import UTC_COLUMN, seconds_to_ns
+
+
+# Compattazione run-length degli eventi parsati. ntpq ripete `selected_peer` (e spesso `init`)
+# ad ogni snapshot, ptp4l ripete `selected best master clock` e `foreign master not using PTP
+# timescale`, sempre in coppia e intercalati alle transizioni della porta che fa flapping: un
+# tratto raccoglie gli eventi identici consecutivi nella sequenza del proprio tipo (gli eventi
+# di altri tipi in mezzo non lo interrompono), con l'intervallo [t_start, t_end] e il
+# conteggio. Identici = stessi valori in tutte le colonne che non variano da riga a riga (type,
+# detail/port/from/to/reason, chiavi della run); NaN uguale a NaN. Le transizioni di stato non
+# si ripetono mai uguali nella sequenza delle transizioni e restano una riga per evento.
+# La riga compattata e' quella del primo evento del tratto: la colonna del tempo (t / t_s),
+# t_rel_s, sample_idx e raw restano quelli dell'inizio, quindi i filtri esistenti sugli eventi
+# (prima transizione verso SLAVE, minimo di t per run) danno lo stesso risultato; i conteggi
+# vanno fatti con event_count().
+# Gli eventi dopo il primo di ogni tratto stanno in memoria nella colonna `following` (per
+# tratto: tempo e distanza in sample_idx dall'evento precedente del tratto). Nei CSV per-run la
+# colonna non c'e': write_run_events() la scrive a parte, codificata a differenze intere (ns e
+# posizioni) in un .npz compresso accanto al CSV, e read_run_events() ne ricorda il percorso
+# (attrs) senza caricarlo. expand_events() ricostruisce la forma per evento, nell'ordine del
+# log, con i tempi reali (t, t_rel_s, t_bin_s, t_utc_ns) e sample_idx originali; le colonne di
+# solo testo (raw, raw_line, hhmmss) restano quelle del primo evento.
+
+T_END_COLUMN = "t_end"
+COUNT_COLUMN = "count"
+FOLLOWING_COLUMN = "following"
+
+# colonne che cambiano ad ogni evento e non entrano nel confronto
+VARYING_COLUMNS = frozenset({
+    "t", "t_s", "t_rel_s", "t_bin_s", "sample_idx", "hhmmss", "raw", "raw_line", "raw_offset", "t_utc_ns",
+    T_END_COLUMN, COUNT_COLUMN, FOLLOWING_COLUMN,
+})
+
+FOLLOWING_SUFFIX = ".following.npz"
+
+# attrs del frame letto da CSV: percorso del .npz con gli eventi dopo il primo di ogni tratto
+FOLLOWING_ATTR = "following_file"
+
+NS = 1_000_000_000
+
+_RUN_KEYS = ("scenario", "run_id", "role")
+
+
+def is_compacted(events: pd.DataFrame) -> bool:
+    return COUNT_COLUMN in events.columns
+
+
+def _positions(events: pd.DataFrame) -> np.ndarray:
+    # posizione nel log della run: sample_idx dei parser, altrimenti la riga del frame
+    if "sample_idx" in events.columns:
+        return events["sample_idx"].to_numpy(dtype=np.int64)
+    return np.arange(len(events), dtype=np.int64)
+
+
+def compact_events(events: pd.DataFrame, t_col: str = "t") -> pd.DataFrame:
+    """Un tratto per ogni sequenza di eventi identici consecutivi nel proprio tipo, con t_end e count."""
+    if events.empty or is_compacted(events):
+        return events
+
+    n = len(events)
+    ident = [c for c in events.columns if c not in VARYING_COLUMNS]
+    key = events[ident].reset_index(drop=True)
+    # identita' e tipo di ogni evento (NaN raggruppati insieme)
+    same_as = key.groupby(ident, sort=False, dropna=False, observed=True).ngroup() if ident else pd.Series(np.zeros(n, dtype=np.int64))
+    kind = key.groupby("type", sort=False, dropna=False, observed=True).ngroup().to_numpy() if "type" in ident else np.zeros(n, dtype=np.int64)
+
+    # nuovo tratto: l'evento precedente dello stesso tipo ha un'altra identita' (o non esiste)
+    prev = same_as.groupby(kind).shift().to_numpy()
+    new = ~(prev == same_as.to_numpy())
+    starts = np.flatnonzero(new)
+    first = pd.Series(np.where(new, np.arange(n), np.nan)).groupby(kind).ffill().to_numpy(dtype=np.int64)
+    tract = np.searchsorted(starts, first)
+    counts = np.bincount(tract, minlength=len(starts))
+
+    # eventi di ogni tratto in ordine di log
+    order = np.argsort(tract, kind="stable")
+    t = events[t_col].to_numpy(dtype=float)[order]
+    pos = _positions(events)[order]
+    bounds = np.r_[0, np.cumsum(counts)]
+
+    out = events.iloc[starts].reset_index(drop=True)
+    out[T_END_COLUMN] = t[bounds[1:] - 1]
+    out[COUNT_COLUMN] = counts
+    # per tratto: (tempo, distanza in posizioni dal precedente) degli eventi dopo il primo
+    out[FOLLOWING_COLUMN] = pd.Series(
+        [np.column_stack([t[b + 1:e], np.diff(pos[b:e])]) for b, e in zip(bounds[:-1].tolist(), bounds[1:].tolist())],
+        dtype=object,
+    )
+    return out
+
+
+# ----------------------------
+# Following events on disk
+# ----------------------------
+
+def following_path(csv_path: Path) -> Path:
+    return Path(csv_path).with_suffix(FOLLOWING_SUFFIX)
+
+
+def split_following(events: pd.DataFrame, t_col: str) -> Tuple[pd.DataFrame, Optional[Dict[str, np.ndarray]]]:
+    """
+    Frame senza `following` e contenuto del .npz: un solo array int64 (un membro dello zip per
+    file) [righe, offset per riga (righe + 1), differenze di tempo in ns, distanze in posizioni].
+    """
+    if FOLLOWING_COLUMN not in events.columns:
+        return events, None
+    frame = events.drop(columns=[FOLLOWING_COLUMN])
+    following = events[FOLLOWING_COLUMN].tolist()
+    lengths = np.array([len(f) for f in following], dtype=np.int64)
+    if not lengths.any():
+        return frame, None
+
+    t0 = events[t_col].to_numpy(dtype=float)
+    delta_ns: List[np.ndarray] = []
+    gap: List[np.ndarray] = []
+    for base, f in zip(t0.tolist(), following):
+        if len(f):
+            delta_ns.append(np.diff(seconds_to_ns(np.r_[base, f[:, 0]])))
+            gap.append(f[:, 1].astype(np.int64))
+    packed = np.concatenate([[len(events)], np.r_[0, np.cumsum(lengths)], *delta_ns, *gap]).astype(np.int64)
+    return frame, {FOLLOWING_COLUMN: packed}
+
+
+def write_run_events(events: pd.DataFrame, path: Path, t_col: str, inputs: Optional[Iterable[Path]] = None) -> None:
+    """CSV per-run degli eventi e, se ci sono tratti con piu' eventi, il .npz degli eventi successivi."""
+    frame, following = split_following(events, t_col)
+    write_csv(disk_frame(frame), path, inputs=inputs)
+    sidecar = following_path(path)
+    if following is not None:
+        write_npz(following, sidecar, inputs=inputs)
+    else:
+        # nessun tratto ripetuto: un .npz di una scrittura precedente non corrisponde piu' al CSV
+        sidecar.unlink(missing_ok=True)
+
+
+def read_run_events(path: Path, **kwargs) -> pd.DataFrame:
+    """CSV per-run degli eventi; il .npz resta su disco finche' expand_events() non serve."""
+    events = pd.read_csv(path, **kwargs)
+    sidecar = following_path(path)
+    if sidecar.exists():
+        events.attrs[FOLLOWING_ATTR] = str(sidecar)
+    return events
+
+
+def _following(events: pd.DataFrame, t_col: str) -> List[np.ndarray]:
+    """Per riga: (tempo, distanza in posizioni) degli eventi del tratto dopo il primo."""
+    if FOLLOWING_COLUMN in events.columns:
+        return events[FOLLOWING_COLUMN].tolist()
+
+    counts = events[COUNT_COLUMN].to_numpy(dtype=np.int64)
+    sidecar = events.attrs.get(FOLLOWING_ATTR)
+    if sidecar is None:
+        if (counts > 1).any():
+            raise ValueError("compacted events without their following events (column or .npz sidecar)")
+        return [np.empty((0, 2)) for _ in range(len(events))]
+
+    # righe del frame letto da read_run_events(): l'indice e' la riga nel CSV, anche dopo i filtri
+    with np.load(sidecar) as z:
+        packed = z[FOLLOWING_COLUMN]
+    n = int(packed[0])
+    start = packed[1:n + 2]
+    delta_ns = packed[n + 2:n + 2 + start[-1]]
+    gap = packed[n + 2 + start[-1]:]
+    t0_ns = seconds_to_ns(events[t_col].to_numpy(dtype=float))
+    out = []
+    for row, base in zip(events.index.to_numpy(dtype=np.int64).tolist(), t0_ns.tolist()):
+        lo, hi = start[row], start[row + 1]
+        out.append(np.column_stack([(base + np.cumsum(delta_ns[lo:hi])) / NS, gap[lo:hi]]))
+    return out
+
+
+def expand_events(events: pd.DataFrame, t_col: str = "t") -> pd.DataFrame:
+    """Forma per evento di un frame compattato nell'ordine del log (o lo stesso frame se gia' per evento)."""
+    if events.empty or not is_compacted(events):
+        return events
+
+    counts = events[COUNT_COLUMN].to_numpy(dtype=np.int64)
+    following = _following(events, t_col)
+    if [len(f) for f in following] != (counts - 1).tolist():
+        raise ValueError(f"following events do not match {COUNT_COLUMN}")
+    rows = np.repeat(np.arange(len(events)), counts)
+
+    t_start = events[t_col].to_numpy(dtype=float)
+    pos_start = _positions(events)
+    t = np.concatenate([np.r_[t0, f[:, 0]] for t0, f in zip(t_start.tolist(), following)])
+    pos = np.concatenate([p0 + np.r_[0, np.cumsum(f[:, 1])].astype(np.int64) for p0, f in zip(pos_start.tolist(), following)])
+    shift = t - t_start[rows]
+
+    out = events.iloc[rows].drop(columns=[T_END_COLUMN, COUNT_COLUMN, FOLLOWING_COLUMN], errors="ignore")
+    out = out.reset_index(drop=True)
+    out[t_col] = t
+    if "t_rel_s" in out.columns:
+        out["t_rel_s"] = out["t_rel_s"].to_numpy(dtype=float) + shift
+    if UTC_COLUMN in out.columns:
+        out[UTC_COLUMN] = out[UTC_COLUMN].to_numpy(dtype=np.int64) + seconds_to_ns(t) - seconds_to_ns(t_start[rows])
+    if "t_bin_s" in out.columns:
+        out["t_bin_s"] = out["t_rel_s"].round().astype(int)
+    if "sample_idx" in out.columns:
+        out["sample_idx"] = pos
+    else:
+        # senza sample_idx le posizioni del frame compattato non sono quelle del log: ordine per tempo
+        pos = np.argsort(t, kind="stable")
+
+    # ordine del log: run nell'ordine di comparsa, poi posizione nella run
+    keys = [c for c in _RUN_KEYS if c in out.columns]
+    run = out.groupby(keys, sort=False, observed=True).ngroup().to_numpy() if keys else np.zeros(len(out), dtype=np.int64)
+    return out.iloc[np.lexsort((pos, run))].reset_index(drop=True)
+
+
+def event_count(events: pd.DataFrame, mask=None) -> int:
+    """Numero di eventi (righe selezionate da `mask`), compattati o no."""
+    if events.empty:
+        return 0
+    sel = events if mask is None else events[mask]
+    if is_compacted(sel):
+        return int(sel[COUNT_COLUMN].sum())
+    return int(len(sel))
+
+
+def event_times(events: pd.DataFrame, mask=None, t_col: str = "t") -> np.ndarray:
+    """Tempi dei singoli eventi selezionati, ordinati (espansi se il frame e' compattato)."""
+    if events.empty:
+        return np.zeros(0)
+    sel = events if mask is None else events[mask]
+    return np.sort(expand_events(sel, t_col)[t_col].to_numpy(dtype=float))
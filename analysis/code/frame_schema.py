@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import re
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from run_config import run_config, update_run_config
+
+
+# Tipi compatti per i frame parsati, applicati da ogni parser al momento della costruzione:
+# - etichette ripetute su ogni riga -> category
+# - interi -> int32 se il range lo permette (con margine: differenze e abs restano in int32)
+# - float -> float32 solo se il valore e il testo scritto nei CSV non cambiano e la colonna non
+#   entra nelle statistiche (pandas accumula medie e varianze di float32 in float32)
+# - `raw` opzionalmente come riferimento (raw_file, raw_offset) alla riga nel log originale
+# Le statistiche restano identiche; cambia solo l'occupazione in memoria.
+# Su disco i tipi non contano (il CSV e' testo): i CSV per-run omettono le colonne ridondanti,
+# le chiavi della run (scenario, run_id, role: gia' nel percorso e nel nome del file) e t_bin_s
+# (round di t_rel_s). I lettori dei CSV per-run ricavano le chiavi dal percorso (run_series,
+# *_stats_aggregated).
+
+LABEL_COLUMNS = frozenset({
+    "scenario", "run_id", "role", "type", "from", "to", "reason", "remote", "refid",
+    "source", "hhmmss", "assoc_type", "sel_char", "reach_raw", "detail",
+})
+
+# tempi e misure: sempre float64 (offset, delay, jitter, stddev sono interi *_ns, vedi units.py)
+FLOAT64_COLUMNS = frozenset({"t", "t_s", "t_rel_s", "freq_raw", "freq_pm_raw"})
+
+# una category conviene se le etichette distinte sono al piu' questa frazione delle righe
+CATEGORY_MAX_UNIQUE_FRACTION = 0.5
+
+# |x| < 2^30: somme e differenze di due valori non escono da int32
+INT32_LIMIT = 2 ** 30
+
+RAW_LINE_COLUMN = "raw_line"
+
+# colonne dei frame per-run ricavabili dal percorso del CSV o dalle altre colonne
+RUN_KEY_COLUMNS = ("scenario", "run_id", "role")
+DERIVED_COLUMNS = {"t_bin_s": "t_rel_s"}
+
+# differenze di tempi scritte al ns: senza la coda dell'errore float (1.0010000000002037 -> 1.001)
+DISK_DECIMALS = {"t_rel_s": 9}
+
+RE_LINE_BREAK = re.compile(rb"\r\n|\r|\n")
+
+
+def set_raw_ref(enabled: bool) -> None:
+    """Con --raw-ref i parser salvano `raw` come (raw_file, raw_offset)."""
+    update_run_config(raw_ref=enabled)
+
+
+# ----------------------------
+# Downcasting
+# ----------------------------
+
+def _float32_exact(values: np.ndarray) -> bool:
+    f32 = values.astype(np.float32)
+    if not np.array_equal(f32.astype(np.float64), values, equal_nan=True):
+        return False
+    # il testo scritto nei CSV deve restare lo stesso (repr piu' corta del float32 != del float64)
+    finite = np.isfinite(values)
+    return np.array_equal(f32[finite].astype(str), values[finite].astype(str))
+
+
+def compact_column(name: str, s: pd.Series) -> pd.Series:
+    n = len(s)
+    if n == 0:
+        return s
+
+    if name in LABEL_COLUMNS and (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)):
+        n_unique = s.nunique(dropna=True)
+        if n_unique <= CATEGORY_MAX_UNIQUE_FRACTION * n or n_unique == 1:
+            return s.astype("category")
+        return s
+
+    if pd.api.types.is_bool_dtype(s):
+        return s
+
+    if pd.api.types.is_integer_dtype(s) and s.dtype.itemsize > 4:
+        lo, hi = s.min(), s.max()
+        if pd.isna(lo) or (-INT32_LIMIT < lo and hi < INT32_LIMIT):
+            # Int64 nullable (ns con campi mancanti) resta nullable
+            return s.astype("Int32" if isinstance(s.dtype, pd.api.extensions.ExtensionDtype) else np.int32)
+        return s
+
+    if pd.api.types.is_float_dtype(s) and s.dtype.itemsize > 4 and name not in FLOAT64_COLUMNS and not name.endswith("_ns"):
+        if _float32_exact(s.to_numpy()):
+            return s.astype(np.float32)
+    return s
+
+
+def compact_frame(df: pd.DataFrame, source: Optional[Path] = None) -> pd.DataFrame:
+    """Tipi compatti per tutte le colonne; con --raw-ref `raw` diventa (raw_file, raw_offset)."""
+    if df.empty:
+        return df.drop(columns=[RAW_LINE_COLUMN], errors="ignore")
+
+    if RAW_LINE_COLUMN in df.columns:
+        lines = df[RAW_LINE_COLUMN]
+        df = df.drop(columns=[RAW_LINE_COLUMN])
+        if run_config().raw_ref and source is not None and "raw" in df.columns:
+            offsets = line_offsets(source)
+            if offsets is not None and int(lines.max()) < len(offsets):
+                pos = df.columns.get_loc("raw")
+                df = df.drop(columns=["raw"])
+                df.insert(pos, "raw_offset", offsets[lines.to_numpy()])
+                # percorso relativo alla run dir, dove stanno sia il log sia i CSV per-run
+                df.insert(pos, "raw_file", pd.Categorical([Path(source).name] * len(df)))
+
+    return pd.DataFrame({col: compact_column(col, df[col]) for col in df.columns}, index=df.index)
+
+
+def disk_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Frame per-run da scrivere su CSV: senza chiavi della run ne' colonne derivate."""
+    drop = [c for c in RUN_KEY_COLUMNS if c in df.columns]
+    drop += [c for c, source in DERIVED_COLUMNS.items() if c in df.columns and source in df.columns]
+    out = df.drop(columns=drop)
+    rounded = {c: out[c].round(n) for c, n in DISK_DECIMALS.items() if c in out.columns}
+    return out.assign(**rounded) if rounded else out
+
+
+# ----------------------------
+# Raw references
+# ----------------------------
+
+def line_offsets(path: Path) -> Optional[np.ndarray]:
+    """Offset in byte dell'inizio di ogni riga, con le stesse interruzioni di str.splitlines sui log ASCII."""
+    try:
+        data = Path(path).read_bytes()
+    except OSError:
+        return None
+    ends = [m.end() for m in RE_LINE_BREAK.finditer(data)]
+    starts = np.array([0] + ends, dtype=np.int64)
+    if ends and ends[-1] == len(data):
+        starts = starts[:-1]
+    return starts
+
+
+def expand_raw(df: pd.DataFrame, base_dir: Path) -> pd.Series:
+    """Ricostruisce la colonna `raw` (righe strip()) da raw_file/raw_offset, leggendo ogni log una volta."""
+    if "raw" in df.columns:
+        return df["raw"]
+    out = pd.Series([None] * len(df), index=df.index, dtype=object)
+    if df.empty or "raw_file" not in df.columns:
+        return out
+
+    for name, idx in df.groupby("raw_file", observed=True).groups.items():
+        data = (Path(base_dir) / str(name)).read_bytes()
+        lines: List[str] = []
+        for off in df.loc[idx, "raw_offset"].to_numpy():
+            m = RE_LINE_BREAK.search(data, int(off))
+            end = m.start() if m else len(data)
+            lines.append(data[int(off):end].decode("utf-8", errors="replace").strip())
+        out.loc[idx] = lines
+    return out
+
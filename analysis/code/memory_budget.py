@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from atomic_output import write_json_atomic
+from chunked_aggregate import OUT_OF_CORE_MODES
+from profiling import add_stage_hook, remove_stage_hook
+
+
+# --memory-budget: picco di allocazioni per fase (tracemalloc) e RSS campionato da un thread.
+# Se la stima del picco supera il budget, o l'RSS lo supera durante il parsing, i driver
+# passano al percorso a memoria limitata: parsing per scenario, niente colonne `raw`,
+# aggregazione a blocchi da colonne su disco (chunked_aggregate.py) o in streaming con
+# quantili da sketch (streaming_aggregate.py).
+
+MEMORY_REPORT_NAME = "memory_profile.json"
+
+# byte in memoria per byte di log: frame trattenuti (misurati ~5x con `raw`) e picco
+# transitorio del parsing di un singolo file (righe come dict prima del DataFrame)
+RETAINED_PER_LOG_BYTE = 6.0
+PARSE_PEAK_PER_LOG_BYTE = 12.0
+
+# oltre questa frazione del budget l'RSS fa scattare il passaggio a bassa memoria
+SWITCH_FRACTION = 0.85
+
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+RE_SIZE = re.compile(r"^\s*(?P<num>\d+(?:\.\d+)?)\s*(?P<unit>[kmgt]?)(?:i?b)?\s*$", re.IGNORECASE)
+
+_ACTIVE: Optional["MemoryTracker"] = None
+
+
+def parse_size(text: str) -> int:
+    """'512M', '2G', '1.5GiB', '800mb' -> byte (unita' binarie)."""
+    m = RE_SIZE.match(str(text))
+    if not m:
+        raise argparse.ArgumentTypeError(f"Invalid size: {text!r} (use e.g. 512M, 2G)")
+    return int(float(m.group("num")) * _SIZE_UNITS[m.group("unit").lower()])
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # senza /proc solo il picco del processo e' disponibile
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _mb(n: Optional[float]) -> Optional[float]:
+    return None if n is None else round(n / (1024 * 1024), 2)
+
+
+@dataclass
+class MemoryPlan:
+    low_memory: bool
+    estimate_bytes: int
+    budget_bytes: Optional[int]
+    reason: str
+
+
+# ----------------------------
+# Tracker
+# ----------------------------
+
+class MemoryTracker:
+    def __init__(self, budget_bytes: Optional[int], sample_interval_s: float = 0.02) -> None:
+        self.budget_bytes = budget_bytes
+        self.sample_interval_s = sample_interval_s
+        self.stages: List[Dict[str, object]] = []
+        self.events: List[Dict[str, object]] = []
+        self.plan: Optional[MemoryPlan] = None
+        self._stage: Optional[Dict[str, object]] = None
+        self._rss_peak = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        tracemalloc.start()
+        self._sampler = threading.Thread(target=self._sample_loop, name="rss-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self.stage(None)
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        tracemalloc.stop()
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.sample_interval_s):
+            rss = current_rss()
+            with self._lock:
+                self._rss_peak = max(self._rss_peak, rss)
+
+    def stage(self, name: Optional[str]) -> None:
+        # chiamata dagli stessi punti di profiling.stage(): chiude la fase corrente e ne apre un'altra
+        rss = current_rss()
+        with self._lock:
+            if self._stage is not None:
+                _, traced_peak = tracemalloc.get_traced_memory()
+                self._stage.update({
+                    "duration_s": round(time.perf_counter() - self._stage.pop("_t0"), 4),
+                    "traced_peak_mb": _mb(traced_peak),
+                    "rss_end_mb": _mb(rss),
+                    "rss_peak_mb": _mb(max(self._rss_peak, rss)),
+                })
+                self.stages.append(self._stage)
+                self._stage = None
+            if name is None:
+                return
+            tracemalloc.reset_peak()
+            self._rss_peak = rss
+            self._stage = {"stage": name, "_t0": time.perf_counter(), "rss_start_mb": _mb(rss)}
+
+    def over_budget(self, fraction: float = SWITCH_FRACTION) -> bool:
+        if self.budget_bytes is None:
+            return False
+        return current_rss() > fraction * self.budget_bytes
+
+    def note(self, message: str) -> None:
+        stage = self._stage["stage"] if self._stage is not None else None
+        self.events.append({"stage": stage, "rss_mb": _mb(current_rss()), "message": message})
+        print(f"[MEM] {message}")
+
+    def report(self) -> Dict[str, object]:
+        plan = self.plan
+        return {
+            "budget_mb": _mb(self.budget_bytes),
+            "estimate_mb": _mb(plan.estimate_bytes) if plan else None,
+            "low_memory": plan.low_memory if plan else False,
+            "reason": plan.reason if plan else None,
+            "peak_rss_mb": _mb(peak_rss()),
+            "stages": self.stages,
+            "events": self.events,
+        }
+
+
+# ----------------------------
+# Planning
+# ----------------------------
+
+def plan_for_logs(logs: Iterable[Path], force_low_memory: bool = False) -> MemoryPlan:
+    """Decide il percorso (completo o a bassa memoria) dalla dimensione dei log da parsare."""
+    sizes = [p.stat().st_size for p in logs if p.exists()]
+    base = current_rss()
+    estimate = int(base + RETAINED_PER_LOG_BYTE * sum(sizes) + PARSE_PEAK_PER_LOG_BYTE * max(sizes, default=0))
+    budget = _ACTIVE.budget_bytes if _ACTIVE is not None else None
+
+    if force_low_memory:
+        plan = MemoryPlan(True, estimate, budget, "--low-memory")
+    elif budget is None:
+        plan = MemoryPlan(False, estimate, None, "no budget")
+    elif estimate > budget:
+        plan = MemoryPlan(True, estimate, budget, f"estimated peak {_mb(estimate)} MB > budget {_mb(budget)} MB")
+    else:
+        plan = MemoryPlan(False, estimate, budget, f"estimated peak {_mb(estimate)} MB <= budget {_mb(budget)} MB")
+
+    if _ACTIVE is not None:
+        _ACTIVE.plan = plan
+    if plan.low_memory:
+        note(f"percorso a bassa memoria: {plan.reason}")
+    return plan
+
+
+def should_switch() -> bool:
+    """True se durante il percorso completo l'RSS si avvicina al budget."""
+    return _ACTIVE is not None and _ACTIVE.over_budget()
+
+
+def note(message: str) -> None:
+    if _ACTIVE is not None:
+        _ACTIVE.note(message)
+    else:
+        print(f"[MEM] {message}")
+
+
+def switched_to_low_memory(reason: str) -> None:
+    if _ACTIVE is not None and _ACTIVE.plan is not None:
+        _ACTIVE.plan.low_memory = True
+        _ACTIVE.plan.reason = reason
+    note(f"passaggio al percorso a bassa memoria: {reason}")
+
+
+# ----------------------------
+# CLI / session
+# ----------------------------
+
+def add_memory_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument(
+        "--memory-budget",
+        type=parse_size,
+        default=None,
+        metavar="SIZE",
+        help="Peak memory budget (e.g. 512M, 2G): record per-stage allocations and switch to "
+        "per-scenario out-of-core aggregation when the budget would be exceeded",
+    )
+    ap.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="Always use the per-scenario out-of-core path (no raw columns)",
+    )
+    ap.add_argument(
+        "--out-of-core",
+        choices=OUT_OF_CORE_MODES,
+        default="chunked",
+        help="Aggregation on the low-memory path: 'chunked' spools per-run metric columns to disk "
+        "($TMPDIR) and aggregates sample_idx ranges, with curves identical to the in-memory path; "
+        "'sketch' streams running moments with reservoir quantiles (default: chunked)",
+    )
+
+
+@contextmanager
+def memory_session(args: argparse.Namespace, root: Path) -> Iterator[Optional[MemoryTracker]]:
+    """Con --memory-budget attiva il tracker e scrive <root>/_aggregated/memory_profile.json."""
+    global _ACTIVE
+    if args.memory_budget is None:
+        yield None
+        return
+
+    tracker = MemoryTracker(args.memory_budget)
+    tracker.start()
+    _ACTIVE = tracker
+    add_stage_hook(tracker.stage)
+    try:
+        yield tracker
+    finally:
+        remove_stage_hook(tracker.stage)
+        _ACTIVE = None
+        tracker.stop()
+        out = Path(root) / "_aggregated" / MEMORY_REPORT_NAME
+        out.parent.mkdir(parents=True, exist_ok=True)
+        report = tracker.report()
+        write_json_atomic(report, out, inputs=[])
+        print(f"[OK] Profilo di memoria salvato in: {out} (peak RSS {report['peak_rss_mb']} MB)")
+        for st in tracker.stages:
+            print(
+                f"  {st['stage']:<10} traced peak {st['traced_peak_mb']:>8.1f} MB  "
+                f"RSS {st['rss_start_mb']:>8.1f} -> {st['rss_end_mb']:>8.1f} MB (peak {st['rss_peak_mb']:.1f})"
+            )
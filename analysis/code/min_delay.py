@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+
+from sliding_window import segment_windows, sliding_argmin
+
+
+# Stimatore "lucky packet": in una finestra scorrevole di w campioni il campione con il path
+# delay minimo e' quello meno toccato dalle code di netem (jitter di 20 ms in high.conf), quindi
+# il suo offset e' la stima piu' affidabile della finestra. La finestra [i, i+w) produce un
+# valore riferito al suo ultimo campione (stima causale, allineata per sample_idx alle curve
+# grezze). Le run sono concatenate: un solo sliding_argmin, finestre a cavallo scartate.
+
+DEFAULT_WINDOW = 16
+
+
+def min_delay_picks(delay: np.ndarray, runs: np.ndarray, window: int = DEFAULT_WINDOW) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (indice dell'ultimo campione della finestra, indice del campione a delay minimo) per ogni
+    finestra interamente dentro una run; `runs` contiguo, delay senza NaN.
+    """
+    delay = np.asarray(delay, dtype=float)
+    pick = sliding_argmin(delay, window)
+    valid = segment_windows(np.asarray(runs), window)
+    end = np.arange(len(pick)) + window - 1
+    return end[valid], pick[valid]
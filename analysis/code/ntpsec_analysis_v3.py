@@ -5,13 +5,42 @@ from __future__ import annotations
 import argparse
 import math
 import re
-from dataclasses import dataclass
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import matplotlib.pyplot as plt
 import pandas as pd
 
+from async_io import background_writer, prefetch_logs, read_text, save_current_figure, write_csv
+from atomic_output import campaign_outputs, output_inputs
+from chunked_aggregate import OutOfCoreAggregator, make_aggregator
+from event_runs import compact_events, write_run_events
+from frame_schema import compact_frame, disk_frame, set_raw_ref
+from memory_budget import (
+    SWITCH_FRACTION,
+    add_memory_args,
+    memory_session,
+    plan_for_logs,
+    should_switch,
+    switched_to_low_memory,
+)
+from outlier_filter import (
+    add_outlier_args,
+    add_outlier_masks,
+    configure_outlier_filter,
+    has_metric,
+    metric_frame,
+    outlier_filter_enabled,
+    with_filtered,
+)
+from parse_stats import ParseStats, write_parse_stats
+from profiling import add_profile_args, profile_session, profiled, span, stage
+from shm_frames import iter_shared
+from time_base import add_time_base_args, set_time_base, time_base_enabled, with_utc
+from units import ns_to, parse_ns, present_aggregate, storage_column
+
 
 # ----------------------------
 # Regex patterns
@@ -35,6 +64,18 @@ RE_PEER_LINE = re.compile(
 HEADER_PREFIXES = ("remote", "refid", "====", "==============================================================================", "=====")
 
 
+# ----------------------------
+# Metric specs: metric -> (ylabel, ylim simmetrico)
+# (unita' di presentazione; i frame hanno <grandezza>_ns interi)
+# ----------------------------
+
+METRIC_SPECS = {
+    "offset_ms": ("offset (ms)", True),
+    "jitter_ms": ("jitter (ms)", False),
+    "delay_ms": ("delay (ms)", False),
+}
+
+
 # ----------------------------
 # Data containers
 # ----------------------------
@@ -47,6 +88,7 @@ class ParsedRun:
     source_file: Path
     samples: pd.DataFrame
     events: pd.DataFrame
+    parse_stats: List[Dict[str, object]] = field(default_factory=list)
 
 
 # ----------------------------
@@ -54,7 +96,7 @@ class ParsedRun:
 # ----------------------------
 
 def _read_lines(path: Path) -> List[str]:
-    return path.read_text(encoding="utf-8", errors="replace").splitlines()
+    return read_text(path).splitlines()
 
 
 def _hhmmss_to_seconds(h: int, m: int, s: int) -> int:
@@ -100,23 +142,27 @@ def _compute_global_ylim(
     symmetric: bool,
     pad: float = 0.05,
 ) -> Optional[Tuple[float, float]]:
-    vals = []
+    # solo min e max correnti: niente liste Python con tutti i valori delle curve
+    lo: Optional[float] = None
+    hi: Optional[float] = None
     for df in aggregated_tables:
         if df.empty or lower_col not in df.columns or upper_col not in df.columns:
             continue
-        vals.extend(pd.to_numeric(df[lower_col], errors="coerce").dropna().tolist())
-        vals.extend(pd.to_numeric(df[upper_col], errors="coerce").dropna().tolist())
-
-    if not vals:
+        for col in (lower_col, upper_col):
+            vals = pd.to_numeric(df[col], errors="coerce").dropna()
+            if vals.empty:
+                continue
+            lo = float(vals.min()) if lo is None else min(lo, float(vals.min()))
+            hi = float(vals.max()) if hi is None else max(hi, float(vals.max()))
+
+    if lo is None:
         return None
 
     if symmetric:
-        m = max(abs(v) for v in vals)
+        m = max(abs(lo), abs(hi))
         m *= (1.0 + pad)
         return (-m, m)
 
-    lo = min(vals)
-    hi = max(vals)
     if lo > 0:
         lo = 0.0
     span = hi - lo
@@ -129,7 +175,9 @@ def _compute_global_ylim(
 # Parsing
 # ----------------------------
 
+@profiled("parse.ntpq", args=("role", "scenario", "run_id"))
 def parse_ntpq_snapshots(path: Path, role: str, scenario: str, run_id: str) -> ParsedRun:
+    stats = ParseStats(f"ntpq.{role}", path, patterns=("snapshot", "peer"), required=("snapshot", "peer"))
     lines = _read_lines(path)
 
     sample_rows: List[Dict] = []
@@ -169,10 +217,11 @@ def parse_ntpq_snapshots(path: Path, role: str, scenario: str, run_id: str) -> P
             "reach_oct": chosen["reach_oct"],
             "sel_char": chosen["sel_char"],
             "selected": chosen["selected"],
-            "delay_ms": chosen["delay_ms"],
-            "offset_ms": chosen["offset_ms"],
-            "jitter_ms": chosen["jitter_ms"],
+            "delay_ns": chosen["delay_ns"],
+            "offset_ns": chosen["offset_ns"],
+            "jitter_ns": chosen["jitter_ns"],
             "raw": chosen["raw"],
+            "raw_line": chosen["raw_line"],
         })
 
         if chosen["refid"] == ".INIT.":
@@ -182,6 +231,7 @@ def parse_ntpq_snapshots(path: Path, role: str, scenario: str, run_id: str) -> P
                 "type": "init",
                 "detail": "refid=.INIT.",
                 "raw": chosen["raw"],
+                "raw_line": chosen["raw_line"],
             })
 
         if chosen["selected"]:
@@ -191,15 +241,17 @@ def parse_ntpq_snapshots(path: Path, role: str, scenario: str, run_id: str) -> P
                 "type": "selected_peer",
                 "detail": chosen["remote"],
                 "raw": chosen["raw"],
+                "raw_line": chosen["raw_line"],
             })
 
         snapshot_peers = []
 
-    for line in lines:
+    for line_no, line in enumerate(lines):
         line_stripped = line.strip()
 
         m_ts = RE_SNAPSHOT_TS.match(line_stripped)
         if m_ts:
+            stats.hit("snapshot")
             flush_snapshot()
 
             h = int(m_ts.group("h"))
@@ -217,17 +269,22 @@ def parse_ntpq_snapshots(path: Path, role: str, scenario: str, run_id: str) -> P
             continue
 
         if not line_stripped:
+            stats.skip("blank")
             continue
 
         if any(line_stripped.startswith(p) for p in HEADER_PREFIXES) or line_stripped.startswith("="):
+            stats.skip("header")
             continue
 
         if current_ts_s is None:
+            stats.skip("before_snapshot")
             continue
 
         m_peer = RE_PEER_LINE.match(line_stripped)
         if not m_peer:
+            stats.miss(line_stripped)
             continue
+        stats.hit("peer")
 
         remote_tok = m_peer.group("remote_tok")
 
@@ -269,29 +326,47 @@ def parse_ntpq_snapshots(path: Path, role: str, scenario: str, run_id: str) -> P
             "poll_s": int(m_peer.group("poll")),
             "reach_raw": reach_raw,
             "reach_oct": reach_oct,
-            "delay_ms": float(m_peer.group("delay")),
-            "offset_ms": float(m_peer.group("offset")),
-            "jitter_ms": float(m_peer.group("jitter")),
+            "delay_ns": parse_ns(m_peer.group("delay"), "ms"),
+            "offset_ns": parse_ns(m_peer.group("offset"), "ms"),
+            "jitter_ns": parse_ns(m_peer.group("jitter"), "ms"),
             "raw": line_stripped,
+            "raw_line": line_no,
         }
         snapshot_peers.append(peer_row)
 
     flush_snapshot()
 
-    samples = pd.DataFrame(sample_rows)
-    events = pd.DataFrame(event_rows)
-
-    if not samples.empty:
-        samples = _normalize_time(samples, "t_s")
-        samples["scenario"] = scenario
-        samples["run_id"] = run_id
-        samples["role"] = role
-
-    if not events.empty:
-        events = _normalize_time(events, "t_s")
-        events["scenario"] = scenario
-        events["run_id"] = run_id
-        events["role"] = role
+    stats.finish(len(lines))
+
+    # un figlio per passo: il tempo dopo il parsing non finisce tutto in build.frames
+    with span("build.frames", role=role):
+        with span("build.tables"):
+            samples = pd.DataFrame(sample_rows)
+            events = pd.DataFrame(event_rows)
+
+            if not samples.empty:
+                samples = _normalize_time(samples, "t_s")
+                samples["scenario"] = scenario
+                samples["run_id"] = run_id
+                samples["role"] = role
+
+            if not events.empty:
+                events = _normalize_time(events, "t_s")
+                events["scenario"] = scenario
+                events["run_id"] = run_id
+                events["role"] = role
+
+        with span("build.compact"):
+            samples = compact_frame(samples, path)
+            events = compact_frame(events, path)
+        if time_base_enabled():
+            with span("build.utc"):
+                samples, events = with_utc("ntpsec", role, path, samples, events)
+        with span("build.events"):
+            events = compact_events(events, "t_s")
+        if outlier_filter_enabled():
+            with span("build.outliers"):
+                samples = add_outlier_masks(samples, [storage_column(m)[0] for m in METRIC_SPECS], scenario, run_id)
 
     return ParsedRun(
         role=role,
@@ -300,6 +375,7 @@ def parse_ntpq_snapshots(path: Path, role: str, scenario: str, run_id: str) -> P
         source_file=path,
         samples=samples,
         events=events,
+        parse_stats=[stats.as_dict()],
     )
 
 
@@ -307,6 +383,7 @@ def parse_ntpq_snapshots(path: Path, role: str, scenario: str, run_id: str) -> P
 # Summaries
 # ----------------------------
 
+@profiled("summarize")
 def summarize_run(run: ParsedRun) -> pd.DataFrame:
     s = run.samples
 
@@ -328,16 +405,16 @@ def summarize_run(run: ParsedRun) -> pd.DataFrame:
         "source_file": str(run.source_file),
         "t_first_selected_s": t_first_selected,
 
-        "offset_mean_ms_post": safe(lambda x: float(x.mean()), post.get("offset_ms")),
-        "offset_std_ms_post": safe(lambda x: float(x.std(ddof=1)), post.get("offset_ms")),
-        "offset_p95_ms_post": safe(lambda x: float(x.quantile(0.95)), post.get("offset_ms")),
-        "offset_maxabs_ms_post": safe(lambda x: float(x.abs().max()), post.get("offset_ms")),
+        "offset_mean_ms_post": safe(lambda x: ns_to(float(x.mean()), "ms"), post.get("offset_ns")),
+        "offset_std_ms_post": safe(lambda x: ns_to(float(x.std(ddof=1)), "ms"), post.get("offset_ns")),
+        "offset_p95_ms_post": safe(lambda x: ns_to(float(x.quantile(0.95)), "ms"), post.get("offset_ns")),
+        "offset_maxabs_ms_post": safe(lambda x: ns_to(float(x.abs().max()), "ms"), post.get("offset_ns")),
 
-        "jitter_mean_ms_post": safe(lambda x: float(x.mean()), post.get("jitter_ms")),
-        "jitter_p95_ms_post": safe(lambda x: float(x.quantile(0.95)), post.get("jitter_ms")),
+        "jitter_mean_ms_post": safe(lambda x: ns_to(float(x.mean()), "ms"), post.get("jitter_ns")),
+        "jitter_p95_ms_post": safe(lambda x: ns_to(float(x.quantile(0.95)), "ms"), post.get("jitter_ns")),
 
-        "delay_mean_ms_post": safe(lambda x: float(x.mean()), post.get("delay_ms")),
-        "delay_p95_ms_post": safe(lambda x: float(x.quantile(0.95)), post.get("delay_ms")),
+        "delay_mean_ms_post": safe(lambda x: ns_to(float(x.mean()), "ms"), post.get("delay_ns")),
+        "delay_p95_ms_post": safe(lambda x: ns_to(float(x.quantile(0.95)), "ms"), post.get("delay_ns")),
 
         "reach_final_raw": None if s.empty else str(s.iloc[-1].get("reach_raw")),
         "reach_final_oct": None if s.empty else s.iloc[-1].get("reach_oct"),
@@ -349,23 +426,8 @@ def summarize_run(run: ParsedRun) -> pd.DataFrame:
 # Aggregation
 # ----------------------------
 
-def aggregate_metric(runs: List[ParsedRun], role: str, scenario: str, metric: str) -> pd.DataFrame:
-    pieces = []
-    for run in runs:
-        if run.role != role or run.scenario != scenario or run.samples.empty:
-            continue
-        if metric not in run.samples.columns:
-            continue
-
-        df = run.samples[["sample_idx", metric, "run_id"]].copy()
-        df = df.dropna(subset=[metric])
-        pieces.append(df)
-
-    if not pieces:
-        return pd.DataFrame()
-
-    long_df = pd.concat(pieces, ignore_index=True)
-
+def aggregate_long(long_df: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """Statistiche per sample_idx su un frame long (sample_idx, metric, run_id); usata anche a blocchi."""
     def agg_fn(g: pd.DataFrame) -> pd.Series:
         vals = pd.to_numeric(g[metric], errors="coerce").dropna()
         n = len(vals)
@@ -401,10 +463,32 @@ def aggregate_metric(runs: List[ParsedRun], role: str, scenario: str, metric: st
     return out
 
 
+@profiled("aggregate", args=("role", "scenario", "metric"))
+def aggregate_metric(runs: List[ParsedRun], role: str, scenario: str, metric: str) -> pd.DataFrame:
+    column, unit = storage_column(metric)
+    pieces = []
+    for run in runs:
+        if run.role != role or run.scenario != scenario or run.samples.empty:
+            continue
+        if not has_metric(run.samples, column):
+            continue
+
+        df = metric_frame(run.samples, column)
+        df = df.dropna(subset=[column])
+        pieces.append(df)
+
+    if not pieces:
+        return pd.DataFrame()
+
+    # statistiche sui ns interi, unita' della metrica solo sul risultato
+    return present_aggregate(aggregate_long(pd.concat(pieces, ignore_index=True), column), unit)
+
+
 # ----------------------------
 # Plotting
 # ----------------------------
 
+@profiled("plot.render", args=("role", "scenario", "metric"))
 def plot_mean_ci(
     df: pd.DataFrame,
     scenario: str,
@@ -427,10 +511,10 @@ def plot_mean_ci(
         plt.ylim(*ylim)
     plt.legend()
     plt.tight_layout()
-    plt.savefig(outpath, dpi=200)
-    plt.close()
+    save_current_figure(outpath)
 
 
+@profiled("plot.render", args=("role", "scenario", "metric"))
 def plot_mean_iqr_p10p90(
     df: pd.DataFrame,
     scenario: str,
@@ -454,30 +538,55 @@ def plot_mean_iqr_p10p90(
         plt.ylim(*ylim)
     plt.legend()
     plt.tight_layout()
-    plt.savefig(outpath, dpi=200)
-    plt.close()
+    save_current_figure(outpath)
 
 
 # ----------------------------
-# Main
+# Per-run processing
 # ----------------------------
 
-def main() -> None:
-    ap = argparse.ArgumentParser(description="Parse and aggregate NTPsec multi-run logs.")
-    ap.add_argument(
-        "--root",
-        type=Path,
-        required=True,
-        help="Root directory of NTPsec multi-run logs, e.g. .../analysis/raw_logs/T3_multiplerun/ntpsec",
-    )
-    args = ap.parse_args()
+@profiled("run", args=("role", "scenario", "run_id"))
+def process_run_log(
+    path: Path, role: str, scenario: str, run_id: str, run_dir: Path
+) -> Tuple[ParsedRun, pd.DataFrame]:
+    run = parse_ntpq_snapshots(path, role=role, scenario=scenario, run_id=run_id)
+    if not run.samples.empty:
+        write_csv(disk_frame(run.samples), run_dir / f"parsed_{role}_samples.csv", inputs=[path])
+    if not run.events.empty:
+        write_run_events(run.events, run_dir / f"parsed_{role}_events.csv", "t_s", inputs=[path])
+    return run, summarize_run(run)
+
+
+def _out_of_core(args: argparse.Namespace, budget_bytes: Optional[int]) -> OutOfCoreAggregator:
+    return make_aggregator(args.out_of_core, aggregate_long, _t_critical_95, budget_bytes)
+
+
+def _stream_run(streaming: OutOfCoreAggregator, run: ParsedRun) -> None:
+    for metric in with_filtered(METRIC_SPECS):
+        column = storage_column(metric)[0]
+        if has_metric(run.samples, column):
+            streaming.add_frame((run.role, run.scenario, metric), metric_frame(run.samples, column), column)
+
 
+def _drop_raw(run: ParsedRun) -> None:
+    # `raw` serve solo ai CSV per-run, gia' scritti
+    run.samples = run.samples.drop(columns=["raw"], errors="ignore")
+    run.events = run.events.drop(columns=["raw"], errors="ignore")
+
+
+# ----------------------------
+# Main
+# ----------------------------
+
+def run_campaign(args: argparse.Namespace) -> None:
     root = args.root
     scenarios = ["low", "medium", "high"]
+    stage("discover")
 
     runs: List[ParsedRun] = []
     summaries: List[pd.DataFrame] = []
 
+    tasks = []
     for scenario in scenarios:
         scenario_dir = root / scenario
         if not scenario_dir.exists():
@@ -490,39 +599,62 @@ def main() -> None:
             boundary_log = run_dir / "ntp_boundary_live.log"
 
             if client_log.exists():
-                run = parse_ntpq_snapshots(client_log, role="client", scenario=scenario, run_id=run_id)
-                runs.append(run)
-                if not run.samples.empty:
-                    run.samples.to_csv(run_dir / "parsed_client_samples.csv", index=False)
-                if not run.events.empty:
-                    run.events.to_csv(run_dir / "parsed_client_events.csv", index=False)
-                summaries.append(summarize_run(run))
-
+                tasks.append((client_log, "client", scenario, run_id, run_dir))
             if boundary_log.exists():
-                run = parse_ntpq_snapshots(boundary_log, role="boundary", scenario=scenario, run_id=run_id)
-                runs.append(run)
-                if not run.samples.empty:
-                    run.samples.to_csv(run_dir / "parsed_boundary_samples.csv", index=False)
-                if not run.events.empty:
-                    run.events.to_csv(run_dir / "parsed_boundary_events.csv", index=False)
-                summaries.append(summarize_run(run))
-
+                tasks.append((boundary_log, "boundary", scenario, run_id, run_dir))
+
+    scenario_logs: Dict[str, List[Path]] = {}
+    for path, _, scenario, _, _ in tasks:
+        scenario_logs.setdefault(scenario, []).append(path)
+    all_logs = [t[0] for t in tasks]
+
+    # oltre il budget di memoria: uno scenario alla volta e curve aggregate fuori memoria
+    # (a blocchi di sample_idx da colonne su disco, o in streaming con --out-of-core sketch)
+    plan = plan_for_logs(all_logs, force_low_memory=args.low_memory)
+    streaming: Optional[OutOfCoreAggregator] = _out_of_core(args, plan.budget_bytes) if plan.low_memory else None
+    groups = [[t for t in tasks if t[2] == scenario] for scenario in scenarios] if plan.low_memory else [tasks]
+
+    stage("parse")
+    run_parse_stats: Dict[Path, List[Dict[str, object]]] = {}
+    for group in groups:
+        # prefetch dei log solo nel percorso seriale: con --jobs ogni worker legge i propri
+        prefetch = [t[0] for t in group] if args.jobs <= 1 and args.io_threads > 0 else []
+        with prefetch_logs(prefetch):
+            for task, (run, summary) in zip(group, iter_shared(process_run_log, group, jobs=args.jobs)):
+                run_parse_stats.setdefault(task[4], []).extend(run.parse_stats)
+                summaries.append(summary)
+
+                if streaming is None and should_switch():
+                    switched_to_low_memory(f"RSS oltre il {SWITCH_FRACTION:.0%} del budget durante il parsing")
+                    streaming = _out_of_core(args, plan.budget_bytes)
+                    for kept in runs:
+                        _stream_run(streaming, kept)
+                    runs.clear()
+
+                if streaming is not None:
+                    _stream_run(streaming, run)
+                else:
+                    if plan.budget_bytes is not None:
+                        _drop_raw(run)
+                    runs.append(run)
+
+    stage("summaries")
     agg_root = root / "_aggregated"
     client_dir = agg_root / "client"
     boundary_dir = agg_root / "boundary"
     client_dir.mkdir(parents=True, exist_ok=True)
     boundary_dir.mkdir(parents=True, exist_ok=True)
 
+    write_parse_stats(root, run_parse_stats)
+
     if summaries:
-        pd.concat(summaries, ignore_index=True).to_csv(
-            agg_root / "summary_all_runs.csv", index=False
+        write_csv(
+            pd.concat(summaries, ignore_index=True),
+            agg_root / "summary_all_runs.csv",
+            inputs=all_logs,
         )
 
-    metric_specs = {
-        "offset_ms": ("offset (ms)", True),
-        "jitter_ms": ("jitter (ms)", False),
-        "delay_ms": ("delay (ms)", False),
-    }
+    metric_specs = with_filtered(METRIC_SPECS)
 
     scenario_metric_tables: Dict[Tuple[str, str, str], pd.DataFrame] = {}
 
@@ -531,20 +663,32 @@ def main() -> None:
     boundary_ci_tables = {m: [] for m in metric_specs}
     boundary_iqr_tables = {m: [] for m in metric_specs}
 
+    stage("aggregate")
     for scenario in scenarios:
         for metric in metric_specs:
-            df = aggregate_metric(runs, role="client", scenario=scenario, metric=metric)
+            if streaming is not None:
+                df = present_aggregate(streaming.result(("client", scenario, metric)), storage_column(metric)[1])
+            else:
+                df = aggregate_metric(runs, role="client", scenario=scenario, metric=metric)
             scenario_metric_tables[("client", scenario, metric)] = df
             if not df.empty:
                 client_ci_tables[metric].append(df)
                 client_iqr_tables[metric].append(df)
 
-            df = aggregate_metric(runs, role="boundary", scenario=scenario, metric=metric)
+            if streaming is not None:
+                df = present_aggregate(streaming.result(("boundary", scenario, metric)), storage_column(metric)[1])
+            else:
+                df = aggregate_metric(runs, role="boundary", scenario=scenario, metric=metric)
             scenario_metric_tables[("boundary", scenario, metric)] = df
             if not df.empty:
                 boundary_ci_tables[metric].append(df)
                 boundary_iqr_tables[metric].append(df)
 
+    if streaming is not None:
+        if streaming.note():
+            print(f"[INFO] {streaming.note()}")
+        streaming.close()
+
     client_ylims_ci = {
         metric: _compute_global_ylim(tbls, "ci95_low", "ci95_high", symmetric=sym)
         for metric, (_, sym) in metric_specs.items()
@@ -567,63 +711,109 @@ def main() -> None:
         for tbls in [boundary_iqr_tables[metric]]
     }
 
+    stage("plot")
     for scenario in scenarios:
-        scenario_client_dir = client_dir / scenario
-        scenario_boundary_dir = boundary_dir / scenario
-        scenario_client_dir.mkdir(parents=True, exist_ok=True)
-        scenario_boundary_dir.mkdir(parents=True, exist_ok=True)
-
-        for metric, (ylabel, _) in metric_specs.items():
-            df = scenario_metric_tables.get(("client", scenario, metric), pd.DataFrame())
-            if not df.empty:
-                df.to_csv(scenario_client_dir / f"{metric}_aggregated.csv", index=False)
-
-                plot_mean_ci(
-                    df=df,
-                    scenario=scenario,
-                    role="client",
-                    metric=metric,
-                    ylabel=ylabel,
-                    outpath=scenario_client_dir / f"{metric}_mean_ci95.png",
-                    ylim=client_ylims_ci[metric],
-                )
-
-                plot_mean_iqr_p10p90(
-                    df=df,
-                    scenario=scenario,
-                    role="client",
-                    metric=metric,
-                    ylabel=ylabel,
-                    outpath=scenario_client_dir / f"{metric}_mean_iqr_p10_p90.png",
-                    ylim=client_ylims_iqr[metric],
-                )
-
-            df = scenario_metric_tables.get(("boundary", scenario, metric), pd.DataFrame())
-            if not df.empty:
-                df.to_csv(scenario_boundary_dir / f"{metric}_aggregated.csv", index=False)
-
-                plot_mean_ci(
-                    df=df,
-                    scenario=scenario,
-                    role="boundary",
-                    metric=metric,
-                    ylabel=ylabel,
-                    outpath=scenario_boundary_dir / f"{metric}_mean_ci95.png",
-                    ylim=boundary_ylims_ci[metric],
-                )
-
-                plot_mean_iqr_p10p90(
-                    df=df,
-                    scenario=scenario,
-                    role="boundary",
-                    metric=metric,
-                    ylabel=ylabel,
-                    outpath=scenario_boundary_dir / f"{metric}_mean_iqr_p10_p90.png",
-                    ylim=boundary_ylims_iqr[metric],
-                )
+        with output_inputs(scenario_logs.get(scenario, [])):
+            scenario_client_dir = client_dir / scenario
+            scenario_boundary_dir = boundary_dir / scenario
+            scenario_client_dir.mkdir(parents=True, exist_ok=True)
+            scenario_boundary_dir.mkdir(parents=True, exist_ok=True)
+
+            for metric, (ylabel, _) in metric_specs.items():
+                df = scenario_metric_tables.get(("client", scenario, metric), pd.DataFrame())
+                if not df.empty:
+                    write_csv(df, scenario_client_dir / f"{metric}_aggregated.csv")
+
+                    plot_mean_ci(
+                        df=df,
+                        scenario=scenario,
+                        role="client",
+                        metric=metric,
+                        ylabel=ylabel,
+                        outpath=scenario_client_dir / f"{metric}_mean_ci95.png",
+                        ylim=client_ylims_ci[metric],
+                    )
+
+                    plot_mean_iqr_p10p90(
+                        df=df,
+                        scenario=scenario,
+                        role="client",
+                        metric=metric,
+                        ylabel=ylabel,
+                        outpath=scenario_client_dir / f"{metric}_mean_iqr_p10_p90.png",
+                        ylim=client_ylims_iqr[metric],
+                    )
+
+                df = scenario_metric_tables.get(("boundary", scenario, metric), pd.DataFrame())
+                if not df.empty:
+                    write_csv(df, scenario_boundary_dir / f"{metric}_aggregated.csv")
+
+                    plot_mean_ci(
+                        df=df,
+                        scenario=scenario,
+                        role="boundary",
+                        metric=metric,
+                        ylabel=ylabel,
+                        outpath=scenario_boundary_dir / f"{metric}_mean_ci95.png",
+                        ylim=boundary_ylims_ci[metric],
+                    )
+
+                    plot_mean_iqr_p10p90(
+                        df=df,
+                        scenario=scenario,
+                        role="boundary",
+                        metric=metric,
+                        ylabel=ylabel,
+                        outpath=scenario_boundary_dir / f"{metric}_mean_iqr_p10_p90.png",
+                        ylim=boundary_ylims_iqr[metric],
+                    )
 
     print(f"[OK] Parsing per-run completato e aggregazione salvata in: {agg_root}")
 
 
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Parse and aggregate NTPsec multi-run logs.")
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Root directory of NTPsec multi-run logs, e.g. .../analysis/raw_logs/T3_multiplerun/ntpsec",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Parse runs in N worker processes (parsed arrays come back via shared memory)",
+    )
+    ap.add_argument(
+        "--io-threads",
+        type=int,
+        default=2,
+        help="Background threads for log prefetch and CSV/PNG writes (0 = synchronous I/O)",
+    )
+    ap.add_argument(
+        "--raw-ref",
+        action="store_true",
+        help="Store the raw log line as a (raw_file, raw_offset) reference into the run's log "
+        "instead of a text column in parsed frames and per-run CSVs",
+    )
+    add_profile_args(ap)
+    add_memory_args(ap)
+    add_time_base_args(ap)
+    add_outlier_args(ap)
+    args = ap.parse_args()
+    set_raw_ref(args.raw_ref)
+    set_time_base(args.utc, args.utc_anchor)
+    configure_outlier_filter(args)
+
+    # il writer si svuota prima che il manifest venga salvato e il lock rilasciato
+    with profile_session(args, "ntpsec_analysis_v3"):
+        with campaign_outputs(args.root, producer="ntpsec_analysis_v3"):
+            with memory_session(args, args.root):
+                with background_writer(workers=args.io_threads) if args.io_threads > 0 else nullcontext():
+                    run_campaign(args)
+                    stage("flush")
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
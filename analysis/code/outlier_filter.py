@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import argparse
+import warnings
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from run_config import run_config, update_run_config
+
+
+# Filtro robusto degli outlier tra parsing e aggregazione (--outlier-filter). I campioni non
+# vengono cancellati: per ogni grandezza filtrata il frame parsed riceve una colonna booleana
+# <colonna>_outlier, scritta anche nei CSV per-run. A valle la variante filtrata di una
+# metrica si chiama filtered_<metrica> e si ricava dal valore grezzo mascherato (NaN dove
+# outlier), quindi curve aggregate e statistiche grezze e filtrate escono dallo stesso giro.
+# - hampel: finestra centrata di `window` campioni, outlier se |x - mediana| > n_sigma * MAD
+#   scalata (1.4826); picchi isolati come `rms 268261` subito dopo UNCALIBRATED -> SLAVE
+# - rolling_mad: stessa regola su una finestra causale dei `window` campioni precedenti,
+#   che segue l'inizio di un burst di perdite senza guardare avanti
+# Finestre a conteggio di campioni (sliding_window_view + nanmedian per riga): O(n w log w)
+# senza cicli Python. Con MAD nulla (valori ripetuti, es. snapshot ntpq non ancora aggiornati)
+# la finestra non marca nulla.
+
+OUTLIER_METHODS = ("hampel", "rolling_mad")
+
+MASK_SUFFIX = "_outlier"
+
+FILTERED_PREFIX = "filtered_"
+
+DEFAULT_WINDOW = 7
+DEFAULT_N_SIGMA = 3.0
+
+# MAD -> deviazione standard per dati gaussiani
+MAD_SCALE = 1.4826
+
+# valori validi minimi nella finestra perche' la mediana abbia senso
+MIN_WINDOW_VALUES = 3
+
+
+@dataclass(frozen=True)
+class FilterParams:
+    method: str = "hampel"
+    window: int = DEFAULT_WINDOW
+    n_sigma: float = DEFAULT_N_SIGMA
+
+
+
+
+def set_outlier_filter(params: Optional[FilterParams], overrides: Optional[Mapping[Tuple[str, str], FilterParams]] = None) -> None:
+    """Con --outlier-filter i parser aggiungono le maschere."""
+    if params is not None and params.method not in OUTLIER_METHODS:
+        raise ValueError(f"unknown outlier filter: {params.method}")
+    update_run_config(outlier_filter=params, outlier_overrides=dict(overrides or {}))
+
+
+def outlier_filter_enabled() -> bool:
+    return run_config().outlier_filter is not None
+
+
+def run_params(scenario: str, run_id: str) -> FilterParams:
+    config = run_config()
+    if config.outlier_filter is None:
+        raise RuntimeError("outlier filter not enabled")
+    overrides = config.outlier_overrides
+    return overrides.get((scenario, run_id), overrides.get((scenario, ""), config.outlier_filter))
+
+
+def load_run_params(path: Path, default: FilterParams) -> Dict[Tuple[str, str], FilterParams]:
+    """
+    CSV scenario,run_id[,method][,window][,n_sigma]: le colonne assenti o vuote restano quelle
+    di default; run_id vuoto vale per tutte le run dello scenario.
+    """
+    table = pd.read_csv(path, dtype=str).fillna("")
+    if "scenario" not in table.columns:
+        raise ValueError(f"{path}: colonna 'scenario' mancante")
+
+    out: Dict[Tuple[str, str], FilterParams] = {}
+    for row in table.to_dict("records"):
+        changes = {}
+        if row.get("method"):
+            changes["method"] = row["method"]
+        if row.get("window"):
+            changes["window"] = int(row["window"])
+        if row.get("n_sigma"):
+            changes["n_sigma"] = float(row["n_sigma"])
+        params = replace(default, **changes)
+        if params.method not in OUTLIER_METHODS:
+            raise ValueError(f"{path}: unknown outlier filter {params.method!r}")
+        out[(row["scenario"], row.get("run_id", ""))] = params
+    return out
+
+
+def add_outlier_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument(
+        "--outlier-filter",
+        choices=["none", *OUTLIER_METHODS],
+        default="none",
+        help="Flag outliers with a Hampel (centred) or rolling-MAD (trailing) filter: parsed frames get "
+        "<column>_outlier mask columns and filtered_<metric> curves are aggregated next to the raw ones",
+    )
+    ap.add_argument(
+        "--outlier-window",
+        type=int,
+        default=DEFAULT_WINDOW,
+        help=f"Outlier filter window in samples (default: {DEFAULT_WINDOW})",
+    )
+    ap.add_argument(
+        "--outlier-sigma",
+        type=float,
+        default=DEFAULT_N_SIGMA,
+        help=f"Reject samples farther than N scaled MADs from the window median (default: {DEFAULT_N_SIGMA:g})",
+    )
+    ap.add_argument(
+        "--outlier-params",
+        type=Path,
+        default=None,
+        help="CSV of per-run parameters (scenario, run_id, method, window, n_sigma); empty run_id "
+        "applies to the whole scenario, missing fields fall back to the command-line values",
+    )
+
+
+def configure_outlier_filter(args: argparse.Namespace) -> None:
+    if args.outlier_filter == "none":
+        set_outlier_filter(None)
+        return
+    params = FilterParams(args.outlier_filter, args.outlier_window, args.outlier_sigma)
+    overrides = load_run_params(args.outlier_params, params) if args.outlier_params else {}
+    set_outlier_filter(params, overrides)
+
+
+# ----------------------------
+# Masks
+# ----------------------------
+
+def _window_matrix(x: np.ndarray, window: int, centered: bool) -> np.ndarray:
+    """Riga i = finestra del campione i (centrata, o dei `window` precedenti); bordi a NaN."""
+    if centered:
+        half = window // 2
+        padded = np.concatenate([np.full(half, np.nan), x, np.full(window - 1 - half, np.nan)])
+        return sliding_window_view(padded, window)
+    padded = np.concatenate([np.full(window, np.nan), x])
+    return sliding_window_view(padded[:-1], window)
+
+
+def outlier_mask(x: np.ndarray, params: FilterParams) -> np.ndarray:
+    x = np.asarray(x, dtype=float)
+    if len(x) == 0:
+        return np.zeros(0, dtype=bool)
+
+    w = _window_matrix(x, max(1, params.window), centered=params.method == "hampel")
+    with warnings.catch_warnings():
+        # finestre tutte NaN (bordi, run corte): mediana NaN, nessun outlier
+        warnings.simplefilter("ignore", RuntimeWarning)
+        med = np.nanmedian(w, axis=1)
+        mad = MAD_SCALE * np.nanmedian(np.abs(w - med[:, None]), axis=1)
+    enough = np.sum(~np.isnan(w), axis=1) >= MIN_WINDOW_VALUES
+    with np.errstate(invalid="ignore"):
+        return enough & (mad > 0) & (np.abs(x - med) > params.n_sigma * mad)
+
+
+def mask_column(column: str) -> str:
+    return f"{column}{MASK_SUFFIX}"
+
+
+def add_outlier_masks(
+    df: pd.DataFrame,
+    columns: Sequence[str],
+    scenario: str,
+    run_id: str,
+    by: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Aggiunge <colonna>_outlier per le colonne presenti, con i parametri della run. `by`: serie
+    indipendenti nello stesso frame (es. le source di chrony sourcestats), in ordine di riga.
+    """
+    cols = [c for c in columns if c in df.columns]
+    if df.empty or not cols:
+        return df
+
+    params = run_params(scenario, run_id)
+    out = df.copy()
+    groups = [np.arange(len(df))] if by is None or by not in df.columns else [
+        np.asarray(idx) for idx in df.groupby(by, sort=False, observed=True).indices.values()
+    ]
+    for col in cols:
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        mask = np.zeros(len(df), dtype=bool)
+        for idx in groups:
+            mask[idx] = outlier_mask(values[idx], params)
+        out[mask_column(col)] = mask
+    return out
+
+
+# ----------------------------
+# Filtered variants
+# ----------------------------
+
+SpecT = TypeVar("SpecT")
+
+
+def filtered_name(metric: str) -> str:
+    return f"{FILTERED_PREFIX}{metric}"
+
+
+def with_filtered(specs: Mapping[str, Tuple[str, SpecT]]) -> Dict[str, Tuple[str, SpecT]]:
+    """Metriche dei driver (nome -> (ylabel, ...)) piu' le varianti filtered_ se il filtro e' attivo."""
+    out = dict(specs)
+    if outlier_filter_enabled():
+        for metric, (ylabel, *rest) in specs.items():
+            out[filtered_name(metric)] = (f"{ylabel}, outliers removed", *rest)
+    return out
+
+
+def _source_column(column: str) -> str:
+    return column[len(FILTERED_PREFIX):] if column.startswith(FILTERED_PREFIX) else column
+
+
+def has_metric(df: pd.DataFrame, column: str) -> bool:
+    if column.startswith(FILTERED_PREFIX):
+        return mask_column(_source_column(column)) in df.columns
+    return column in df.columns
+
+
+def metric_values(df: pd.DataFrame, column: str) -> pd.Series:
+    """Colonna grezza, o per filtered_<colonna> la grezza con NaN sugli outlier."""
+    if not column.startswith(FILTERED_PREFIX):
+        return df[column]
+    source = _source_column(column)
+    values = pd.to_numeric(df[source], errors="coerce").astype(float)
+    return values.mask(df[mask_column(source)].astype(bool)).rename(column)
+
+
+def metric_frame(df: pd.DataFrame, column: str, keys: Sequence[str] = ("sample_idx", "run_id")) -> pd.DataFrame:
+    """Frame long (chiavi, colonna) per l'aggregazione, anche per le varianti filtrate."""
+    if not column.startswith(FILTERED_PREFIX):
+        return df[[*keys, column]].copy()
+    out = df[list(keys)].copy()
+    out[column] = metric_values(df, column)
+    return out
+
+
+def add_filtered_columns(df: pd.DataFrame, columns: Sequence[str]) -> pd.DataFrame:
+    """filtered_<colonna> per le colonne con maschera (script di statistica sui parsed per-run)."""
+    out = df
+    for col in columns:
+        if col not in df.columns or mask_column(col) not in df.columns:
+            continue
+        if out is df:
+            out = df.copy()
+        out[filtered_name(col)] = metric_values(df, filtered_name(col))
+    return out
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+from async_io import write_json
+
+
+# Contatori per parser: righe lette, match per pattern, righe saltate (vuote, header, campi
+# non usati) e righe non riconosciute con un campione limitato. Se una nuova versione di
+# linuxptp/ntpq/chronyc cambia formato lo si vede qui, non dai grafici vuoti.
+
+UNMATCHED_SAMPLE_SIZE = 20
+PARSE_STATS_NAME = "parse_stats.json"
+
+# token con cifre (timestamp, clock id, valori) -> "N": righe con lo stesso formato hanno la stessa forma
+RE_SHAPE_TOKEN = re.compile(r"\S*\d\S*")
+
+
+class ParseStats:
+    def __init__(
+        self,
+        parser: str,
+        path: Path,
+        patterns: Iterable[str] = (),
+        required: Sequence[str] = (),
+        sample_size: int = UNMATCHED_SAMPLE_SIZE,
+    ) -> None:
+        self.parser = parser
+        self.path = Path(path)
+        # i pattern dichiarati compaiono anche con zero match
+        self.matched: Dict[str, int] = dict.fromkeys(patterns, 0)
+        self.skipped: Dict[str, int] = {}
+        self.required = tuple(required)
+        self.unmatched = 0
+        self.lines_read = 0
+        self._sample_size = sample_size
+        self._sample: List[str] = []
+        self._shapes: set = set()
+        self._t0 = time.perf_counter()
+        self._elapsed_s: Optional[float] = None
+
+    def hit(self, pattern: str) -> None:
+        self.matched[pattern] = self.matched.get(pattern, 0) + 1
+
+    def skip(self, reason: str) -> None:
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def miss(self, line: str) -> None:
+        self.unmatched += 1
+        if len(self._sample) >= self._sample_size:
+            return
+        # una riga per forma: il campione mostra formati diversi, non 20 copie della stessa riga
+        line = line.strip()
+        shape = RE_SHAPE_TOKEN.sub("N", line)
+        if shape not in self._shapes:
+            self._shapes.add(shape)
+            self._sample.append(line[:300])
+
+    def finish(self, lines_read: int) -> "ParseStats":
+        self.lines_read = lines_read
+        self._elapsed_s = time.perf_counter() - self._t0
+        return self
+
+    def as_dict(self) -> Dict[str, object]:
+        elapsed = self._elapsed_s if self._elapsed_s is not None else time.perf_counter() - self._t0
+        try:
+            size = self.path.stat().st_size
+        except OSError:
+            size = None
+        n_matched = sum(self.matched.values())
+        n_skipped = sum(self.skipped.values())
+        return {
+            "parser": self.parser,
+            "file": str(self.path),
+            "lines_read": self.lines_read,
+            "bytes_read": size,
+            "lines_matched": n_matched,
+            "lines_skipped": n_skipped,
+            "lines_unmatched": self.unmatched,
+            "coverage": (n_matched + n_skipped) / self.lines_read if self.lines_read else None,
+            "matched": dict(self.matched),
+            "skipped": dict(self.skipped),
+            "missing_required": [p for p in self.required if not self.matched.get(p)],
+            "unmatched_sample": list(self._sample),
+            "elapsed_s": round(elapsed, 6),
+            "lines_per_s": self.lines_read / elapsed if elapsed > 0 else None,
+            "bytes_per_s": size / elapsed if size is not None and elapsed > 0 else None,
+        }
+
+
+# ----------------------------
+# Rollup
+# ----------------------------
+
+def _rel(path: str, root: Path) -> str:
+    try:
+        return str(Path(path).resolve().relative_to(root.resolve()))
+    except ValueError:
+        return path
+
+
+def rollup(stats: Iterable[Mapping[str, object]], root: Path, sample_size: int = UNMATCHED_SAMPLE_SIZE) -> Dict[str, object]:
+    """Somma i contatori per parser; il throughput e' righe (byte) totali su tempo di parsing totale."""
+    parsers: Dict[str, Dict[str, object]] = {}
+    shapes: Dict[str, set] = {}
+    for st in stats:
+        agg = parsers.setdefault(st["parser"], {
+            "files": 0,
+            "lines_read": 0,
+            "bytes_read": 0,
+            "lines_matched": 0,
+            "lines_skipped": 0,
+            "lines_unmatched": 0,
+            "elapsed_s": 0.0,
+            "matched": {},
+            "skipped": {},
+            "min_coverage": None,
+            "files_missing_required": {},
+            "unmatched_sample": [],
+        })
+        agg["files"] += 1
+        for key in ("lines_read", "lines_matched", "lines_skipped", "lines_unmatched", "elapsed_s"):
+            agg[key] += st[key]
+        agg["bytes_read"] += st["bytes_read"] or 0
+        for group in ("matched", "skipped"):
+            for name, n in st[group].items():
+                agg[group][name] = agg[group].get(name, 0) + n
+        if st["coverage"] is not None:
+            agg["min_coverage"] = st["coverage"] if agg["min_coverage"] is None else min(agg["min_coverage"], st["coverage"])
+        if st["missing_required"]:
+            agg["files_missing_required"][_rel(st["file"], root)] = st["missing_required"]
+        for line in st["unmatched_sample"]:
+            shape = RE_SHAPE_TOKEN.sub("N", line)
+            if len(agg["unmatched_sample"]) < sample_size and shape not in shapes.setdefault(st["parser"], set()):
+                shapes[st["parser"]].add(shape)
+                agg["unmatched_sample"].append(line)
+
+    for agg in parsers.values():
+        agg["coverage"] = (agg["lines_matched"] + agg["lines_skipped"]) / agg["lines_read"] if agg["lines_read"] else None
+        agg["lines_per_s"] = agg["lines_read"] / agg["elapsed_s"] if agg["elapsed_s"] > 0 else None
+        agg["bytes_per_s"] = agg["bytes_read"] / agg["elapsed_s"] if agg["elapsed_s"] > 0 else None
+        agg["elapsed_s"] = round(agg["elapsed_s"], 6)
+
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parsers": dict(sorted(parsers.items())),
+    }
+
+
+def write_parse_stats(root: Path, per_run: Mapping[Path, List[Mapping[str, object]]]) -> Dict[str, object]:
+    """parse_stats.json in ogni run dir e il rollup in <root>/_aggregated/parse_stats.json."""
+    all_stats: List[Mapping[str, object]] = []
+    for run_dir, stats in per_run.items():
+        if not stats:
+            continue
+        write_json(
+            {"run_dir": _rel(str(run_dir), root), "files": [{**st, "file": _rel(st["file"], root)} for st in stats]},
+            Path(run_dir) / PARSE_STATS_NAME,
+            inputs=[Path(st["file"]) for st in stats],
+        )
+        all_stats.extend(stats)
+
+    summary = rollup(all_stats, root)
+    out = root / "_aggregated" / PARSE_STATS_NAME
+    out.parent.mkdir(parents=True, exist_ok=True)
+    write_json(summary, out, inputs=[Path(st["file"]) for st in all_stats])
+
+    for parser, agg in summary["parsers"].items():
+        missing = agg["files_missing_required"]
+        if missing:
+            patterns = sorted({p for ps in missing.values() for p in ps})
+            print(
+                f"[WARN] {parser}: nessun match per {', '.join(patterns)} in {len(missing)}/{agg['files']} file "
+                f"(es. {next(iter(missing))}); formato del log cambiato o run senza dati?"
+            )
+    return summary
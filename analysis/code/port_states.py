@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from event_runs import event_times
+
+
+# Indice a intervalli degli stati di porta di ptp4l, ricostruito dagli eventi `port N: A to B`.
+# Per ogni porta gli intervalli sono contigui e ordinati: [t_begin, primo evento) nello stato
+# `from` del primo evento, poi [evento k, evento k+1) nello stato `to` dell'evento k, fino a
+# t_end della run. "Stato al tempo t" e' un searchsorted sugli inizi della porta (O(log n) per
+# campione, tutti i campioni in una chiamata). La porta seguita e' quella verso il master
+# (l'unica che passa da UNCALIBRATED/SLAVE); le altre restano nell'indice per le frazioni.
+# Perdita di aggancio: ogni tratto fuori da SLAVE dopo il primo ingresso in SLAVE.
+
+LOCKED_STATE = "SLAVE"
+
+# stati riportati come frazioni di tempo nei summary (quelli osservati nei log di T3)
+SUMMARY_STATES = ["LISTENING", "UNCALIBRATED", "SLAVE", "MASTER", "FAULTY"]
+
+INTERVAL_COLUMNS = ["port", "state", "t_start", "t_end", "duration_s"]
+
+
+def state_intervals(events: pd.DataFrame, t_begin: float, t_end: float, t_col: str = "t") -> pd.DataFrame:
+    """Intervalli (port, state, t_start, t_end, duration_s) di tutte le porte, ordinati per porta e tempo."""
+    if events.empty or "type" not in events.columns:
+        return pd.DataFrame(columns=INTERVAL_COLUMNS)
+    st = events[events["type"] == "state"]
+    if st.empty:
+        return pd.DataFrame(columns=INTERVAL_COLUMNS)
+
+    st = pd.DataFrame({
+        "port": pd.to_numeric(st["port"], errors="coerce").astype("int64").to_numpy(),
+        "t": st[t_col].to_numpy(dtype=float),
+        "from": st["from"].astype(str).to_numpy(),
+        "to": st["to"].astype(str).to_numpy(),
+    }).sort_values(["port", "t"], kind="mergesort")
+
+    first = st.drop_duplicates("port")
+    head = pd.DataFrame({"port": first["port"], "state": first["from"], "t_start": t_begin})
+    body = pd.DataFrame({"port": st["port"], "state": st["to"], "t_start": st["t"]})
+    out = pd.concat([head, body], ignore_index=True).sort_values(["port", "t_start"], kind="mergesort")
+    out["t_start"] = out["t_start"].clip(upper=t_end)
+    out["t_end"] = out.groupby("port")["t_start"].shift(-1).fillna(t_end)
+    out["duration_s"] = out["t_end"] - out["t_start"]
+    return out.reset_index(drop=True)[INTERVAL_COLUMNS]
+
+
+def tracked_port(intervals: pd.DataFrame) -> Optional[int]:
+    """Porta verso il master: quella che entra in UNCALIBRATED o SLAVE; altrimenti la prima non UDS (> 0)."""
+    if intervals.empty:
+        return None
+    upstream = intervals.loc[intervals["state"].isin(["UNCALIBRATED", LOCKED_STATE]), "port"]
+    if not upstream.empty:
+        return int(upstream.min())
+    ports = intervals.loc[intervals["port"] > 0, "port"]
+    return int(ports.min()) if not ports.empty else int(intervals["port"].min())
+
+
+def state_at(intervals: pd.DataFrame, port: Optional[int], t) -> np.ndarray:
+    """Stato della porta ai tempi t (None prima del primo intervallo o senza porta)."""
+    t = np.asarray(t, dtype=float)
+    out = np.full(len(t), None, dtype=object)
+    if port is None or intervals.empty:
+        return out
+    iv = intervals[intervals["port"] == port]
+    starts = iv["t_start"].to_numpy(dtype=float)
+    idx = np.searchsorted(starts, t, side="right") - 1
+    inside = idx >= 0
+    out[inside] = iv["state"].to_numpy(dtype=object)[idx[inside]]
+    return out
+
+
+def loss_of_lock_episodes(intervals: pd.DataFrame, port: Optional[int]) -> pd.DataFrame:
+    """Tratti (t_start, t_end, duration_s) fuori da SLAVE dopo il primo aggancio della porta."""
+    cols = ["t_start", "t_end", "duration_s"]
+    if port is None or intervals.empty:
+        return pd.DataFrame(columns=cols)
+    iv = intervals[(intervals["port"] == port) & (intervals["duration_s"] > 0)]
+    locked = (iv["state"] == LOCKED_STATE).to_numpy()
+    if not locked.any():
+        return pd.DataFrame(columns=cols)
+
+    after = np.arange(len(iv)) > np.argmax(locked)
+    # un episodio = intervalli consecutivi non SLAVE: stesso conteggio di ingressi in SLAVE
+    episode = np.cumsum(locked)
+    sel = after & ~locked
+    g = iv[sel].groupby(episode[sel], sort=True)
+    out = pd.DataFrame({"t_start": g["t_start"].min(), "t_end": g["t_end"].max()}).reset_index(drop=True)
+    out["duration_s"] = out["t_end"] - out["t_start"]
+    return out
+
+
+def port_state_summary(intervals: pd.DataFrame, events: pd.DataFrame, t_col: str = "t") -> Dict[str, object]:
+    """Frazioni di tempo per stato della porta seguita, perdite di aggancio, MTBF e intervallo tra riselezioni."""
+    port = tracked_port(intervals)
+    out: Dict[str, object] = {"tracked_port": port}
+
+    iv = intervals[intervals["port"] == port] if port is not None else intervals.iloc[0:0]
+    total = float(iv["duration_s"].sum()) if not iv.empty else 0.0
+    per_state = iv.groupby("state")["duration_s"].sum() if not iv.empty else pd.Series(dtype=float)
+    for state in SUMMARY_STATES:
+        out[f"time_in_{state.lower()}_frac"] = float(per_state.get(state, 0.0)) / total if total > 0 else None
+
+    episodes = loss_of_lock_episodes(intervals, port)
+    slave_s = float(per_state.get(LOCKED_STATE, 0.0))
+    out["loss_of_lock_count"] = int(len(episodes))
+    out["loss_of_lock_total_s"] = float(episodes["duration_s"].sum()) if len(episodes) else 0.0
+    out["loss_of_lock_mean_s"] = float(episodes["duration_s"].mean()) if len(episodes) else None
+    # MTBF: tempo in SLAVE per perdita di aggancio (nessuna perdita: non definito)
+    out["mtbf_s"] = slave_s / len(episodes) if len(episodes) else None
+
+    reselections = (
+        event_times(events, events["type"] == "best_master", t_col)
+        if not events.empty and "type" in events.columns else np.zeros(0)
+    )
+    out["best_master_mean_interval_s"] = float(np.diff(reselections).mean()) if len(reselections) > 1 else None
+    return out
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import argparse
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+# Span timer leggero per --profile: ogni span e' un evento "X" del formato Chrome trace
+# (chrome://tracing, Perfetto). Senza una sessione attiva span() e @profiled non fanno nulla.
+
+_ACTIVE: Optional["Profiler"] = None
+
+# altri osservatori delle fasi (es. memory_budget): ricevono lo stesso nome di stage()
+_STAGE_HOOKS: List[Callable[[Optional[str]], None]] = []
+
+
+class Profiler:
+    def __init__(self, out_dir: Path, name: str, cprofile_stages: Sequence[str] = ()) -> None:
+        self.out_dir = Path(out_dir)
+        self.name = name
+        self._events: List[Dict[str, object]] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._t0_ns = time.perf_counter_ns()
+        self._stage: Optional[tuple] = None
+        self._cprofile_stages = set(cprofile_stages)
+        self._cprofiles: Dict[str, cProfile.Profile] = {}
+
+    # ----------------------------
+    # Recording
+    # ----------------------------
+
+    def _now_us(self) -> float:
+        return (time.perf_counter_ns() - self._t0_ns) / 1000.0
+
+    def record(self, name: str, cat: str, start_us: float, end_us: float, args: Dict[str, object]) -> None:
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            # valori esatti: l'annidamento in summary() confronta fine e inizio di span contigui,
+            # l'arrotondamento a 3 decimali si applica solo al trace scritto su disco
+            "ts": start_us,
+            "dur": end_us - start_us,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        if os.getpid() != self._pid:
+            # worker (fork) di --jobs: eventi su un journal per processo, uniti da save()
+            with open(self.out_dir / f".events.{os.getpid()}.jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps(event) + "\n")
+            return
+        with self._lock:
+            self._events.append(event)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "span", **args) -> Iterator[None]:
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            self.record(name, cat, start, self._now_us(), {k: str(v) for k, v in args.items()})
+
+    def stage(self, name: Optional[str]) -> None:
+        # chiude la fase corrente e ne apre un'altra (None = nessuna): evita di reindentare i driver
+        now = self._now_us()
+        if self._stage is not None:
+            prev_name, prev_start = self._stage
+            prof = self._cprofiles.get(prev_name)
+            if prof is not None:
+                prof.disable()
+            self.record(f"stage:{prev_name}", "stage", prev_start, now, {})
+        self._stage = None
+        if name is None:
+            return
+        self._stage = (name, now)
+        if name in self._cprofile_stages:
+            prof = self._cprofiles.setdefault(name, cProfile.Profile())
+            prof.enable()
+
+    # ----------------------------
+    # Output
+    # ----------------------------
+
+    def _collect_journals(self) -> None:
+        for journal in sorted(self.out_dir.glob(".events.*.jsonl")):
+            for line in journal.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    self._events.append(json.loads(line))
+            journal.unlink()
+
+    def summary(self) -> pd.DataFrame:
+        """Per nome di span: count, total, self (senza i figli), mean, p95, max in secondi."""
+        if not self._events:
+            return pd.DataFrame()
+        df = pd.DataFrame(self._events)
+        df["end"] = df["ts"] + df["dur"]
+
+        # tempo dei figli diretti per thread: stack sugli span ordinati per inizio
+        df = df.sort_values(["pid", "tid", "ts", "dur"], ascending=[True, True, True, False]).reset_index(drop=True)
+        child = np.zeros(len(df))
+        for _, g in df.groupby(["pid", "tid"], sort=False):
+            stack: List[int] = []
+            for i, ts, end in zip(g.index, g["ts"].to_numpy(), g["end"].to_numpy()):
+                while stack and df.at[stack[-1], "end"] <= ts:
+                    stack.pop()
+                if stack:
+                    child[stack[-1]] += end - ts
+                stack.append(i)
+        df["self"] = df["dur"] - child
+
+        out = df.groupby("name").agg(
+            count=("dur", "size"),
+            total_s=("dur", "sum"),
+            self_s=("self", "sum"),
+            mean_s=("dur", "mean"),
+            p95_s=("dur", lambda s: float(np.percentile(s, 95))),
+            max_s=("dur", "max"),
+        )
+        for col in ("total_s", "self_s", "mean_s", "p95_s", "max_s"):
+            out[col] = out[col] / 1e6
+        return out.sort_values("total_s", ascending=False).reset_index()
+
+    def save(self) -> pd.DataFrame:
+        self.stage(None)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._collect_journals()
+
+        trace = {
+            "traceEvents": [
+                {**e, "ts": round(e["ts"], 3), "dur": round(e["dur"], 3)}
+                for e in sorted(self._events, key=lambda e: e["ts"])
+            ],
+            "displayTimeUnit": "ms",
+            "otherData": {"tool": self.name},
+        }
+        (self.out_dir / "trace.json").write_text(json.dumps(trace), encoding="utf-8")
+
+        summary = self.summary()
+        summary.round(6).to_csv(self.out_dir / "summary.csv", index=False)
+
+        for stage_name, prof in self._cprofiles.items():
+            safe = stage_name.replace("/", "_")
+            prof.dump_stats(self.out_dir / f"cprofile_{safe}.pstats")
+            buf = io.StringIO()
+            pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(40)
+            (self.out_dir / f"cprofile_{safe}.txt").write_text(buf.getvalue(), encoding="utf-8")
+        return summary
+
+
+# ----------------------------
+# Module-level API
+# ----------------------------
+
+def span(name: str, cat: str = "span", **args):
+    if _ACTIVE is None:
+        return nullcontext()
+    return _ACTIVE.span(name, cat, **args)
+
+
+def stage(name: Optional[str]) -> None:
+    if _ACTIVE is not None:
+        _ACTIVE.stage(name)
+    for hook in _STAGE_HOOKS:
+        hook(name)
+
+
+def add_stage_hook(hook: Callable[[Optional[str]], None]) -> None:
+    _STAGE_HOOKS.append(hook)
+
+
+def remove_stage_hook(hook: Callable[[Optional[str]], None]) -> None:
+    if hook in _STAGE_HOOKS:
+        _STAGE_HOOKS.remove(hook)
+
+
+def profiled(name: str, args: Iterable[str] = ()) -> Callable:
+    """Decoratore: la chiamata diventa uno span `name`; `args` sono i parametri da riportare nel trace."""
+    arg_names = tuple(args)
+
+    def deco(fn: Callable) -> Callable:
+        sig = inspect.signature(fn) if arg_names else None
+
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            if _ACTIVE is None:
+                return fn(*a, **kw)
+            span_args = {}
+            if sig is not None:
+                bound = sig.bind_partial(*a, **kw).arguments
+                span_args = {k: bound[k] for k in arg_names if k in bound}
+            with _ACTIVE.span(name, "call", **span_args):
+                return fn(*a, **kw)
+
+        return wrapper
+
+    return deco
+
+
+def add_profile_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument(
+        "--profile",
+        type=Path,
+        nargs="?",
+        const=Path("profile"),
+        default=None,
+        metavar="DIR",
+        help="Write a Chrome trace (trace.json) and per-stage timings (summary.csv) to DIR (default: ./profile)",
+    )
+    ap.add_argument(
+        "--cprofile",
+        nargs="+",
+        default=[],
+        metavar="STAGE",
+        help="Also run cProfile during these stages (e.g. parse aggregate plot); implies --profile",
+    )
+
+
+@contextmanager
+def profile_session(args: argparse.Namespace, name: str) -> Iterator[Optional[Profiler]]:
+    global _ACTIVE
+    out_dir = args.profile
+    if out_dir is None and args.cprofile:
+        out_dir = Path("profile")
+    if out_dir is None:
+        yield None
+        return
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    profiler = Profiler(out_dir, name, cprofile_stages=args.cprofile)
+    _ACTIVE = profiler
+    try:
+        with profiler.span(name, "session"):
+            try:
+                yield profiler
+            finally:
+                profiler.stage(None)
+    finally:
+        _ACTIVE = None
+        summary = profiler.save()
+        print(f"[OK] Profilo salvato in: {out_dir} (trace.json, summary.csv)")
+        if not summary.empty:
+            print(summary.head(15).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
@@ -5,13 +5,53 @@ from __future__ import annotations
 import argparse
 import math
 import re
-from dataclasses import dataclass
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import matplotlib.pyplot as plt
 import pandas as pd
 
+from async_io import background_writer, prefetch_logs, read_text, save_current_figure, write_csv
+from atomic_output import campaign_outputs, output_inputs
+from chunked_aggregate import OutOfCoreAggregator, make_aggregator
+from event_runs import compact_events, event_count, write_run_events
+from frame_schema import compact_frame, disk_frame, set_raw_ref
+from memory_budget import (
+    SWITCH_FRACTION,
+    add_memory_args,
+    memory_session,
+    plan_for_logs,
+    should_switch,
+    switched_to_low_memory,
+)
+from outlier_filter import (
+    add_outlier_args,
+    add_outlier_masks,
+    configure_outlier_filter,
+    has_metric,
+    metric_frame,
+    outlier_filter_enabled,
+    with_filtered,
+)
+from parse_stats import ParseStats, write_parse_stats
+from port_states import LOCKED_STATE, port_state_summary, state_at, state_intervals, tracked_port
+from profiling import add_profile_args, profile_session, profiled, span, stage
+from sample_gaps import (
+    add_cadence_args,
+    configure_cadence,
+    expected_interval,
+    find_gaps,
+    gap_summary,
+    reindex_enabled,
+    reindex_to_cadence,
+)
+from servo_states import aggregate_servo, servo_runs, servo_summary
+from shm_frames import iter_shared
+from time_base import add_time_base_args, set_time_base, time_base_enabled, with_utc
+from units import canonical_ns
+
 
 # ----------------------------
 # Regex patterns
@@ -47,6 +87,21 @@ RE_NEW_FOREIGN = re.compile(
 )
 
 
+# ----------------------------
+# Metric specs: metric -> (ylabel, ylim simmetrico)
+# ----------------------------
+
+BOUNDARY_METRICS = {
+    "offset_ns": ("offset (ns)", True),
+    "path_delay_ns": ("path delay (ns)", False),
+}
+
+CLIENT_METRICS = {
+    "rms_ns": ("RMS offset (ns)", False),
+    "path_delay_ns": ("path delay (ns)", False),
+}
+
+
 # ----------------------------
 # Data containers
 # ----------------------------
@@ -59,6 +114,11 @@ class ParsedRun:
     source_file: Path
     samples: pd.DataFrame
     events: pd.DataFrame
+    parse_stats: List[Dict[str, object]] = field(default_factory=list)
+    # intervalli degli stati di porta (port_states.state_intervals)
+    states: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # campioni mancanti rispetto alla cadenza dei config ptp4l (sample_gaps.find_gaps)
+    gaps: pd.DataFrame = field(default_factory=pd.DataFrame)
 
 
 # ----------------------------
@@ -66,7 +126,7 @@ class ParsedRun:
 # ----------------------------
 
 def _read_lines(path: Path) -> List[str]:
-    return path.read_text(encoding="utf-8", errors="replace").splitlines()
+    return read_text(path).splitlines()
 
 
 def _normalize_time(df: pd.DataFrame, t_col: str = "t") -> pd.DataFrame:
@@ -104,23 +164,27 @@ def _compute_global_ylim(
     symmetric: bool,
     pad: float = 0.05,
 ) -> Optional[Tuple[float, float]]:
-    vals = []
+    # solo min e max correnti: niente liste Python con tutti i valori delle curve
+    lo: Optional[float] = None
+    hi: Optional[float] = None
     for df in aggregated_tables:
         if df.empty or lower_col not in df.columns or upper_col not in df.columns:
             continue
-        vals.extend(pd.to_numeric(df[lower_col], errors="coerce").dropna().tolist())
-        vals.extend(pd.to_numeric(df[upper_col], errors="coerce").dropna().tolist())
+        for col in (lower_col, upper_col):
+            vals = pd.to_numeric(df[col], errors="coerce").dropna()
+            if vals.empty:
+                continue
+            lo = float(vals.min()) if lo is None else min(lo, float(vals.min()))
+            hi = float(vals.max()) if hi is None else max(hi, float(vals.max()))
 
-    if not vals:
+    if lo is None:
         return None
 
     if symmetric:
-        m = max(abs(v) for v in vals)
+        m = max(abs(lo), abs(hi))
         m *= (1.0 + pad)
         return (-m, m)
 
-    lo = min(vals)
-    hi = max(vals)
     if lo > 0:
         lo = 0.0
     span = hi - lo
@@ -133,15 +197,28 @@ def _compute_global_ylim(
 # Parsing
 # ----------------------------
 
+@profiled("parse.ptp4l", args=("role", "scenario", "run_id"))
 def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> ParsedRun:
+    sample_pattern = f"{role}_sample"
+    stats = ParseStats(
+        f"ptp4l.{role}",
+        path,
+        patterns=("state", "fault", "best_master", "foreign_not_ptp_timescale", "new_foreign_master", sample_pattern),
+        required=(sample_pattern,),
+    )
     lines = _read_lines(path)
 
     sample_rows: List[Dict] = []
     event_rows: List[Dict] = []
 
-    for line in lines:
+    for line_no, line in enumerate(lines):
+        if not line.strip():
+            stats.skip("blank")
+            continue
+
         m = RE_STATE.search(line)
         if m:
+            stats.hit("state")
             event_rows.append({
                 "t": float(m.group("t")),
                 "type": "state",
@@ -150,10 +227,12 @@ def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> Parsed
                 "to": m.group("to"),
                 "reason": m.group("reason"),
                 "raw": line.strip(),
+                "raw_line": line_no,
             })
             continue
 
         if RE_FAULT.search(line) or RE_FAULT_DETECTED.search(line):
+            stats.hit("fault")
             mt = re.search(RE_TS, line)
             if mt:
                 event_rows.append({
@@ -164,11 +243,13 @@ def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> Parsed
                     "to": None,
                     "reason": None,
                     "raw": line.strip(),
+                    "raw_line": line_no,
                 })
             continue
 
         m = RE_BEST_MASTER.search(line)
         if m:
+            stats.hit("best_master")
             event_rows.append({
                 "t": float(re.search(RE_TS, line).group("t")),
                 "type": "best_master",
@@ -177,10 +258,12 @@ def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> Parsed
                 "to": None,
                 "reason": m.group("gm"),
                 "raw": line.strip(),
+                "raw_line": line_no,
             })
             continue
 
         if RE_FOREIGN_NOT_PTP_TIMESCALE.search(line):
+            stats.hit("foreign_not_ptp_timescale")
             mt = re.search(RE_TS, line)
             if mt:
                 event_rows.append({
@@ -191,11 +274,13 @@ def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> Parsed
                     "to": None,
                     "reason": None,
                     "raw": line.strip(),
+                    "raw_line": line_no,
                 })
             continue
 
         m = RE_NEW_FOREIGN.search(line)
         if m:
+            stats.hit("new_foreign_master")
             event_rows.append({
                 "t": float(re.search(RE_TS, line).group("t")),
                 "type": "new_foreign_master",
@@ -204,12 +289,14 @@ def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> Parsed
                 "to": None,
                 "reason": m.group("fm"),
                 "raw": line.strip(),
+                "raw_line": line_no,
             })
             continue
 
         if role == "boundary":
             m = RE_BOUNDARY_SAMPLE.search(line)
             if m:
+                stats.hit(sample_pattern)
                 sample_rows.append({
                     "t": float(m.group("t")),
                     "offset_ns": int(m.group("offset")),
@@ -217,12 +304,14 @@ def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> Parsed
                     "freq_raw": int(m.group("freq")),
                     "path_delay_ns": int(m.group("delay")),
                     "raw": line.strip(),
+                    "raw_line": line_no,
                 })
                 continue
 
         elif role == "client":
             m = RE_CLIENT_SAMPLE.search(line)
             if m:
+                stats.hit(sample_pattern)
                 sample_rows.append({
                     "t": float(m.group("t")),
                     "rms_ns": int(m.group("rms")),
@@ -232,25 +321,63 @@ def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> Parsed
                     "path_delay_ns": int(m.group("delay")) if m.group("delay") else None,
                     "path_delay_pm_ns": int(m.group("delay_pm")) if m.group("delay_pm") else None,
                     "raw": line.strip(),
+                    "raw_line": line_no,
                 })
                 continue
         else:
             raise ValueError(f"Unknown role: {role}")
 
-    samples = pd.DataFrame(sample_rows)
-    events = pd.DataFrame(event_rows)
-
-    if not samples.empty:
-        samples = _normalize_time(samples, "t")
-        samples["scenario"] = scenario
-        samples["run_id"] = run_id
-        samples["role"] = role
-
-    if not events.empty:
-        events = _normalize_time(events, "t")
-        events["scenario"] = scenario
-        events["run_id"] = run_id
-        events["role"] = role
+        stats.miss(line)
+
+    stats.finish(len(lines))
+
+    # un figlio per passo: il tempo dopo il parsing non finisce tutto in build.frames
+    with span("build.frames", role=role):
+        with span("build.tables"):
+            samples = pd.DataFrame(sample_rows)
+            events = pd.DataFrame(event_rows)
+
+            if not samples.empty:
+                samples = _normalize_time(samples, "t")
+                samples["scenario"] = scenario
+                samples["run_id"] = run_id
+                samples["role"] = role
+
+            if not events.empty:
+                events = _normalize_time(events, "t")
+                events["scenario"] = scenario
+                events["run_id"] = run_id
+                events["role"] = role
+
+        # stato della porta verso il master per ogni campione, dagli intervalli degli eventi
+        with span("build.states"):
+            times = [f["t"] for f in (samples, events) if not f.empty]
+            states = (
+                state_intervals(events, min(float(x.min()) for x in times), max(float(x.max()) for x in times))
+                if times else pd.DataFrame()
+            )
+            if not samples.empty:
+                samples["port_state"] = state_at(states, tracked_port(states), samples["t"])
+
+        with span("build.gaps"):
+            interval = expected_interval(role)
+            gaps = find_gaps(samples["t"], interval) if interval and not samples.empty else pd.DataFrame()
+            if interval and reindex_enabled() and not samples.empty:
+                samples = reindex_to_cadence(samples, interval)
+
+        # campi opzionali (delay, +/-) mancanti: ns interi nullable invece di float con NaN
+        with span("build.compact"):
+            samples = compact_frame(canonical_ns(samples), path)
+            events = compact_frame(events, path)
+        if time_base_enabled():
+            with span("build.utc"):
+                samples, events = with_utc("ptp", role, path, samples, events)
+        with span("build.events"):
+            events = compact_events(events, "t")
+        if outlier_filter_enabled():
+            with span("build.outliers"):
+                metrics = BOUNDARY_METRICS if role == "boundary" else CLIENT_METRICS
+                samples = add_outlier_masks(samples, list(metrics), scenario, run_id)
 
     return ParsedRun(
         role=role,
@@ -259,6 +386,9 @@ def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> Parsed
         source_file=path,
         samples=samples,
         events=events,
+        parse_stats=[stats.as_dict()],
+        states=states,
+        gaps=gaps,
     )
 
 
@@ -266,6 +396,13 @@ def parse_ptp4l_log(path: Path, role: str, scenario: str, run_id: str) -> Parsed
 # Summaries
 # ----------------------------
 
+def _cadence_summary(run: ParsedRun) -> Dict[str, object]:
+    s = run.samples
+    if "filled" in s.columns:
+        s = s[~s["filled"].astype(bool)]
+    return gap_summary(s["t"] if not s.empty else [], expected_interval(run.role), run.gaps)
+
+
 def _find_first_time(events: pd.DataFrame, predicate) -> Optional[float]:
     if events.empty:
         return None
@@ -283,12 +420,14 @@ def compute_convergence_time_client(events: pd.DataFrame) -> Optional[float]:
     return _find_first_time(events, lambda df: (df["type"] == "state") & (df["to"] == "SLAVE"))
 
 
+@profiled("summarize")
 def summarize_boundary(run: ParsedRun) -> pd.DataFrame:
     s = run.samples
     e = run.events
     conv_s = compute_convergence_time_boundary(e)
-    fault_count = int((e["type"] == "fault").sum()) if not e.empty else 0
+    fault_count = event_count(e, e["type"] == "fault") if not e.empty else 0
     post = s[s["servo_state"] == 2].copy() if not s.empty and "servo_state" in s.columns else pd.DataFrame()
+    slave = s[s["port_state"] == LOCKED_STATE] if "port_state" in s.columns else pd.DataFrame()
 
     def safe_stat(series: pd.Series, fn):
         return fn(series) if series is not None and not series.empty else None
@@ -308,21 +447,28 @@ def summarize_boundary(run: ParsedRun) -> pd.DataFrame:
         "offset_maxabs_ns_s2": safe_stat(post.get("offset_ns"), lambda x: float(x.abs().max())),
         "path_delay_mean_ns_s2": safe_stat(post.get("path_delay_ns"), lambda x: float(x.mean())),
         "path_delay_std_ns_s2": safe_stat(post.get("path_delay_ns"), lambda x: float(x.std(ddof=1))),
+        "offset_mean_ns_slave": safe_stat(slave.get("offset_ns"), lambda x: float(x.mean())),
+        "offset_std_ns_slave": safe_stat(slave.get("offset_ns"), lambda x: float(x.std(ddof=1))),
+        **port_state_summary(run.states, e),
+        **servo_summary(servo_runs(s), s),
+        **_cadence_summary(run),
     }
     return pd.DataFrame([out])
 
 
+@profiled("summarize")
 def summarize_client(run: ParsedRun) -> pd.DataFrame:
     s = run.samples
     e = run.events
     conv_s = compute_convergence_time_client(e)
     locked = conv_s is not None
     post = s[s["t_rel_s"] >= conv_s].copy() if locked and not s.empty else pd.DataFrame()
+    slave = s[s["port_state"] == LOCKED_STATE] if "port_state" in s.columns else pd.DataFrame()
 
     def safe_stat(series: pd.Series, fn):
         return fn(series) if series is not None and not series.empty else None
 
-    reselection_count = int((e["type"] == "best_master").sum()) if not e.empty else 0
+    reselection_count = event_count(e, e["type"] == "best_master") if not e.empty else 0
 
     out = {
         "role": run.role,
@@ -346,6 +492,10 @@ def summarize_client(run: ParsedRun) -> pd.DataFrame:
             post.get("path_delay_ns").dropna() if "path_delay_ns" in post else None,
             lambda x: float(x.std(ddof=1)),
         ),
+        "rms_mean_ns_slave": safe_stat(slave.get("rms_ns"), lambda x: float(x.mean())),
+        "rms_p95_ns_slave": safe_stat(slave.get("rms_ns"), lambda x: float(x.quantile(0.95))),
+        **port_state_summary(run.states, e),
+        **_cadence_summary(run),
     }
     return pd.DataFrame([out])
 
@@ -354,24 +504,8 @@ def summarize_client(run: ParsedRun) -> pd.DataFrame:
 # Aggregation
 # ----------------------------
 
-def aggregate_metric(runs: List[ParsedRun], role: str, scenario: str, metric: str) -> pd.DataFrame:
-    pieces = []
-    for run in runs:
-        if run.role != role or run.scenario != scenario or run.samples.empty:
-            continue
-        if metric not in run.samples.columns:
-            continue
-
-        # allineamento per indice di campione, non per tempo
-        df = run.samples[["sample_idx", metric, "run_id"]].copy()
-        df = df.dropna(subset=[metric])
-        pieces.append(df)
-
-    if not pieces:
-        return pd.DataFrame()
-
-    long_df = pd.concat(pieces, ignore_index=True)
-
+def aggregate_long(long_df: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """Statistiche per sample_idx su un frame long (sample_idx, metric, run_id); usata anche a blocchi."""
     def agg_fn(g: pd.DataFrame) -> pd.Series:
         vals = pd.to_numeric(g[metric], errors="coerce").dropna()
         n = len(vals)
@@ -407,10 +541,31 @@ def aggregate_metric(runs: List[ParsedRun], role: str, scenario: str, metric: st
     return out
 
 
+@profiled("aggregate", args=("role", "scenario", "metric"))
+def aggregate_metric(runs: List[ParsedRun], role: str, scenario: str, metric: str) -> pd.DataFrame:
+    pieces = []
+    for run in runs:
+        if run.role != role or run.scenario != scenario or run.samples.empty:
+            continue
+        if not has_metric(run.samples, metric):
+            continue
+
+        # allineamento per indice di campione, non per tempo
+        df = metric_frame(run.samples, metric)
+        df = df.dropna(subset=[metric])
+        pieces.append(df)
+
+    if not pieces:
+        return pd.DataFrame()
+
+    return aggregate_long(pd.concat(pieces, ignore_index=True), metric)
+
+
 # ----------------------------
 # Plotting
 # ----------------------------
 
+@profiled("plot.render", args=("role", "scenario", "metric"))
 def plot_mean_ci(
     df: pd.DataFrame,
     scenario: str,
@@ -433,10 +588,10 @@ def plot_mean_ci(
         plt.ylim(*ylim)
     plt.legend()
     plt.tight_layout()
-    plt.savefig(outpath, dpi=200)
-    plt.close()
+    save_current_figure(outpath)
 
 
+@profiled("plot.render", args=("role", "scenario", "metric"))
 def plot_mean_iqr_p10p90(
     df: pd.DataFrame,
     scenario: str,
@@ -460,31 +615,63 @@ def plot_mean_iqr_p10p90(
         plt.ylim(*ylim)
     plt.legend()
     plt.tight_layout()
-    plt.savefig(outpath, dpi=200)
-    plt.close()
+    save_current_figure(outpath)
 
 
 # ----------------------------
-# Main
+# Per-run processing
 # ----------------------------
 
-def main() -> None:
-    ap = argparse.ArgumentParser(description="Parse and aggregate PTP multi-run logs.")
-    ap.add_argument(
-        "--root",
-        type=Path,
-        required=True,
-        help="Root directory of PTP multi-run logs, e.g. .../analysis/raw_logs/T3_multiplerun/ptp",
-    )
-    args = ap.parse_args()
+@profiled("run", args=("role", "scenario", "run_id"))
+def process_run_log(
+    path: Path, role: str, scenario: str, run_id: str, run_dir: Path
+) -> Tuple[ParsedRun, pd.DataFrame]:
+    run = parse_ptp4l_log(path, role=role, scenario=scenario, run_id=run_id)
+    if not run.samples.empty:
+        write_csv(disk_frame(run.samples), run_dir / f"parsed_{role}_samples.csv", inputs=[path])
+    if not run.events.empty:
+        write_run_events(run.events, run_dir / f"parsed_{role}_events.csv", "t", inputs=[path])
+    if not run.states.empty:
+        write_csv(disk_frame(run.states), run_dir / f"parsed_{role}_states.csv", inputs=[path])
+    if not run.gaps.empty:
+        write_csv(disk_frame(run.gaps), run_dir / f"parsed_{role}_gaps.csv", inputs=[path])
+    if role == "boundary" and not run.samples.empty:
+        write_csv(servo_runs(run.samples), run_dir / f"parsed_{role}_servo_runs.csv", inputs=[path])
+    summary = summarize_boundary(run) if role == "boundary" else summarize_client(run)
+    return run, summary
+
 
+def _out_of_core(args: argparse.Namespace, budget_bytes: Optional[int]) -> OutOfCoreAggregator:
+    return make_aggregator(args.out_of_core, aggregate_long, _t_critical_95, budget_bytes)
+
+
+def _stream_run(streaming: OutOfCoreAggregator, run: ParsedRun) -> None:
+    metrics = BOUNDARY_METRICS if run.role == "boundary" else CLIENT_METRICS
+    for metric in with_filtered(metrics):
+        if has_metric(run.samples, metric):
+            streaming.add_frame((run.role, run.scenario, metric), metric_frame(run.samples, metric), metric)
+
+
+def _drop_raw(run: ParsedRun) -> None:
+    # `raw` serve solo ai CSV per-run, gia' scritti
+    run.samples = run.samples.drop(columns=["raw"], errors="ignore")
+    run.events = run.events.drop(columns=["raw"], errors="ignore")
+
+
+# ----------------------------
+# Main
+# ----------------------------
+
+def run_campaign(args: argparse.Namespace) -> None:
     root = args.root
     scenarios = ["low", "medium", "high"]
+    stage("discover")
 
     runs: List[ParsedRun] = []
     boundary_summaries: List[pd.DataFrame] = []
     client_summaries: List[pd.DataFrame] = []
 
+    tasks = []
     for scenario in scenarios:
         scenario_dir = root / scenario
         if not scenario_dir.exists():
@@ -497,48 +684,80 @@ def main() -> None:
             client_log = run_dir / "ptp_client.log"
 
             if boundary_log.exists():
-                run = parse_ptp4l_log(boundary_log, role="boundary", scenario=scenario, run_id=run_id)
-                runs.append(run)
-                if not run.samples.empty:
-                    run.samples.to_csv(run_dir / "parsed_boundary_samples.csv", index=False)
-                if not run.events.empty:
-                    run.events.to_csv(run_dir / "parsed_boundary_events.csv", index=False)
-                boundary_summaries.append(summarize_boundary(run))
-
+                tasks.append((boundary_log, "boundary", scenario, run_id, run_dir))
             if client_log.exists():
-                run = parse_ptp4l_log(client_log, role="client", scenario=scenario, run_id=run_id)
-                runs.append(run)
-                if not run.samples.empty:
-                    run.samples.to_csv(run_dir / "parsed_client_samples.csv", index=False)
-                if not run.events.empty:
-                    run.events.to_csv(run_dir / "parsed_client_events.csv", index=False)
-                client_summaries.append(summarize_client(run))
-
+                tasks.append((client_log, "client", scenario, run_id, run_dir))
+
+    scenario_logs: Dict[str, List[Path]] = {}
+    for path, _, scenario, _, _ in tasks:
+        scenario_logs.setdefault(scenario, []).append(path)
+    all_logs = [t[0] for t in tasks]
+
+    # oltre il budget di memoria: uno scenario alla volta e curve aggregate fuori memoria
+    # (a blocchi di sample_idx da colonne su disco, o in streaming con --out-of-core sketch)
+    plan = plan_for_logs(all_logs, force_low_memory=args.low_memory)
+    streaming: Optional[OutOfCoreAggregator] = _out_of_core(args, plan.budget_bytes) if plan.low_memory else None
+    groups = [[t for t in tasks if t[2] == scenario] for scenario in scenarios] if plan.low_memory else [tasks]
+
+    stage("parse")
+    run_parse_stats: Dict[Path, List[Dict[str, object]]] = {}
+    for group in groups:
+        # prefetch dei log solo nel percorso seriale: con --jobs ogni worker legge i propri
+        prefetch = [t[0] for t in group] if args.jobs <= 1 and args.io_threads > 0 else []
+        with prefetch_logs(prefetch):
+            for task, (run, summary) in zip(group, iter_shared(process_run_log, group, jobs=args.jobs)):
+                run_parse_stats.setdefault(task[4], []).extend(run.parse_stats)
+                if run.role == "boundary":
+                    boundary_summaries.append(summary)
+                else:
+                    client_summaries.append(summary)
+
+                if streaming is None and should_switch():
+                    switched_to_low_memory(f"RSS oltre il {SWITCH_FRACTION:.0%} del budget durante il parsing")
+                    streaming = _out_of_core(args, plan.budget_bytes)
+                    for kept in runs:
+                        _stream_run(streaming, kept)
+                    runs.clear()
+
+                if streaming is not None:
+                    _stream_run(streaming, run)
+                else:
+                    if plan.budget_bytes is not None:
+                        _drop_raw(run)
+                    runs.append(run)
+
+    stage("summaries")
     agg_root = root / "_aggregated"
     boundary_dir = agg_root / "boundary"
     client_dir = agg_root / "client"
     boundary_dir.mkdir(parents=True, exist_ok=True)
     client_dir.mkdir(parents=True, exist_ok=True)
 
+    write_parse_stats(root, run_parse_stats)
+
     if boundary_summaries:
-        pd.concat(boundary_summaries, ignore_index=True).to_csv(
-            boundary_dir / "boundary_summary_all_runs.csv", index=False
-        )
+        boundary_summary = pd.concat(boundary_summaries, ignore_index=True)
+        write_csv(boundary_summary, boundary_dir / "boundary_summary_all_runs.csv", inputs=all_logs)
+
+        # run-length del servo: media tra le run + CI95 per scenario
+        servo = aggregate_servo(boundary_summary)
+        for scenario, df in (servo.groupby("scenario", sort=False) if not servo.empty else []):
+            (boundary_dir / scenario).mkdir(parents=True, exist_ok=True)
+            write_csv(
+                df.drop(columns=["scenario"]),
+                boundary_dir / scenario / "servo_states_aggregated.csv",
+                inputs=scenario_logs.get(scenario, all_logs),
+            )
 
     if client_summaries:
-        pd.concat(client_summaries, ignore_index=True).to_csv(
-            client_dir / "client_summary_all_runs.csv", index=False
+        write_csv(
+            pd.concat(client_summaries, ignore_index=True),
+            client_dir / "client_summary_all_runs.csv",
+            inputs=all_logs,
         )
 
-    boundary_metrics = {
-        "offset_ns": ("offset (ns)", True),
-        "path_delay_ns": ("path delay (ns)", False),
-    }
-
-    client_metrics = {
-        "rms_ns": ("RMS offset (ns)", False),
-        "path_delay_ns": ("path delay (ns)", False),
-    }
+    boundary_metrics = with_filtered(BOUNDARY_METRICS)
+    client_metrics = with_filtered(CLIENT_METRICS)
 
     boundary_ci_tables = {m: [] for m in boundary_metrics}
     boundary_iqr_tables = {m: [] for m in boundary_metrics}
@@ -547,21 +766,33 @@ def main() -> None:
 
     scenario_metric_tables: Dict[Tuple[str, str, str], pd.DataFrame] = {}
 
+    stage("aggregate")
     for scenario in scenarios:
         for metric in boundary_metrics:
-            df = aggregate_metric(runs, role="boundary", scenario=scenario, metric=metric)
+            if streaming is not None:
+                df = streaming.result(("boundary", scenario, metric))
+            else:
+                df = aggregate_metric(runs, role="boundary", scenario=scenario, metric=metric)
             scenario_metric_tables[("boundary", scenario, metric)] = df
             if not df.empty:
                 boundary_ci_tables[metric].append(df)
                 boundary_iqr_tables[metric].append(df)
 
         for metric in client_metrics:
-            df = aggregate_metric(runs, role="client", scenario=scenario, metric=metric)
+            if streaming is not None:
+                df = streaming.result(("client", scenario, metric))
+            else:
+                df = aggregate_metric(runs, role="client", scenario=scenario, metric=metric)
             scenario_metric_tables[("client", scenario, metric)] = df
             if not df.empty:
                 client_ci_tables[metric].append(df)
                 client_iqr_tables[metric].append(df)
 
+    if streaming is not None:
+        if streaming.note():
+            print(f"[INFO] {streaming.note()}")
+        streaming.close()
+
     boundary_ylims_ci = {
         metric: _compute_global_ylim(tbls, "ci95_low", "ci95_high", symmetric=sym)
         for metric, (_, sym) in boundary_metrics.items()
@@ -584,67 +815,115 @@ def main() -> None:
         for tbls in [client_iqr_tables[metric]]
     }
 
+    stage("plot")
     for scenario in scenarios:
-        scenario_boundary_dir = boundary_dir / scenario
-        scenario_client_dir = client_dir / scenario
-        scenario_boundary_dir.mkdir(parents=True, exist_ok=True)
-        scenario_client_dir.mkdir(parents=True, exist_ok=True)
-
-        for metric, (ylabel, _) in boundary_metrics.items():
-            df = scenario_metric_tables.get(("boundary", scenario, metric), pd.DataFrame())
-            if df.empty:
-                continue
+        with output_inputs(scenario_logs.get(scenario, [])):
+            scenario_boundary_dir = boundary_dir / scenario
+            scenario_client_dir = client_dir / scenario
+            scenario_boundary_dir.mkdir(parents=True, exist_ok=True)
+            scenario_client_dir.mkdir(parents=True, exist_ok=True)
+
+            for metric, (ylabel, _) in boundary_metrics.items():
+                df = scenario_metric_tables.get(("boundary", scenario, metric), pd.DataFrame())
+                if df.empty:
+                    continue
+
+                write_csv(df, scenario_boundary_dir / f"{metric}_aggregated.csv")
+
+                plot_mean_ci(
+                    df=df,
+                    scenario=scenario,
+                    role="boundary",
+                    metric=metric,
+                    ylabel=ylabel,
+                    outpath=scenario_boundary_dir / f"{metric}_mean_ci95.png",
+                    ylim=boundary_ylims_ci[metric],
+                )
+
+                plot_mean_iqr_p10p90(
+                    df=df,
+                    scenario=scenario,
+                    role="boundary",
+                    metric=metric,
+                    ylabel=ylabel,
+                    outpath=scenario_boundary_dir / f"{metric}_mean_iqr_p10_p90.png",
+                    ylim=boundary_ylims_iqr[metric],
+                )
+
+            for metric, (ylabel, _) in client_metrics.items():
+                df = scenario_metric_tables.get(("client", scenario, metric), pd.DataFrame())
+                if df.empty:
+                    continue
+
+                write_csv(df, scenario_client_dir / f"{metric}_aggregated.csv")
+
+                plot_mean_ci(
+                    df=df,
+                    scenario=scenario,
+                    role="client",
+                    metric=metric,
+                    ylabel=ylabel,
+                    outpath=scenario_client_dir / f"{metric}_mean_ci95.png",
+                    ylim=client_ylims_ci[metric],
+                )
+
+                plot_mean_iqr_p10p90(
+                    df=df,
+                    scenario=scenario,
+                    role="client",
+                    metric=metric,
+                    ylabel=ylabel,
+                    outpath=scenario_client_dir / f"{metric}_mean_iqr_p10_p90.png",
+                    ylim=client_ylims_iqr[metric],
+                )
 
-            df.to_csv(scenario_boundary_dir / f"{metric}_aggregated.csv", index=False)
-
-            plot_mean_ci(
-                df=df,
-                scenario=scenario,
-                role="boundary",
-                metric=metric,
-                ylabel=ylabel,
-                outpath=scenario_boundary_dir / f"{metric}_mean_ci95.png",
-                ylim=boundary_ylims_ci[metric],
-            )
-
-            plot_mean_iqr_p10p90(
-                df=df,
-                scenario=scenario,
-                role="boundary",
-                metric=metric,
-                ylabel=ylabel,
-                outpath=scenario_boundary_dir / f"{metric}_mean_iqr_p10_p90.png",
-                ylim=boundary_ylims_iqr[metric],
-            )
-
-        for metric, (ylabel, _) in client_metrics.items():
-            df = scenario_metric_tables.get(("client", scenario, metric), pd.DataFrame())
-            if df.empty:
-                continue
-
-            df.to_csv(scenario_client_dir / f"{metric}_aggregated.csv", index=False)
-
-            plot_mean_ci(
-                df=df,
-                scenario=scenario,
-                role="client",
-                metric=metric,
-                ylabel=ylabel,
-                outpath=scenario_client_dir / f"{metric}_mean_ci95.png",
-                ylim=client_ylims_ci[metric],
-            )
+    print(f"[OK] Parsing per-run completato e aggregazione salvata in: {agg_root}")
 
-            plot_mean_iqr_p10p90(
-                df=df,
-                scenario=scenario,
-                role="client",
-                metric=metric,
-                ylabel=ylabel,
-                outpath=scenario_client_dir / f"{metric}_mean_iqr_p10_p90.png",
-                ylim=client_ylims_iqr[metric],
-            )
 
-    print(f"[OK] Parsing per-run completato e aggregazione salvata in: {agg_root}")
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Parse and aggregate PTP multi-run logs.")
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Root directory of PTP multi-run logs, e.g. .../analysis/raw_logs/T3_multiplerun/ptp",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Parse runs in N worker processes (parsed arrays come back via shared memory)",
+    )
+    ap.add_argument(
+        "--io-threads",
+        type=int,
+        default=2,
+        help="Background threads for log prefetch and CSV/PNG writes (0 = synchronous I/O)",
+    )
+    ap.add_argument(
+        "--raw-ref",
+        action="store_true",
+        help="Store the raw log line as a (raw_file, raw_offset) reference into the run's log "
+        "instead of a text column in parsed frames and per-run CSVs",
+    )
+    add_profile_args(ap)
+    add_memory_args(ap)
+    add_time_base_args(ap)
+    add_outlier_args(ap)
+    add_cadence_args(ap)
+    args = ap.parse_args()
+    set_raw_ref(args.raw_ref)
+    set_time_base(args.utc, args.utc_anchor)
+    configure_outlier_filter(args)
+    configure_cadence(args)
+
+    # il writer si svuota prima che il manifest venga salvato e il lock rilasciato
+    with profile_session(args, "ptp_analysis_v3"):
+        with campaign_outputs(args.root, producer="ptp_analysis_v3"):
+            with memory_session(args, args.root):
+                with background_writer(workers=args.io_threads) if args.io_threads > 0 else nullcontext():
+                    run_campaign(args)
+                    stage("flush")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Statistiche su finestre mobili di durata fissa (secondi, non campioni: ptp4l salta righe
+# attorno ai cambi di stato e chrony/ntpq campionano a passo diverso). Finestra causale
+# (t - window_s, t]. I kernel rolling di pandas su indice temporale sono incrementali:
+# media/std con somme aggiornate in ingresso/uscita, min/max con deque monotone, mediana e
+# quantili con uno skiplist ordinato della finestra (O(log w) per campione), quindi una
+# finestra di un'ora su un milione di campioni resta O(n log w).
+# MAD della finestra: mediana di |x_i - m| su tutti i campioni della finestra, con m la mediana
+# della finestra stessa. La finestra e' tenuta ordinata in blocchi (_SortedWindow: liste ordinate
+# di al piu' 2 * WINDOW_BLOCK valori, con un albero di Fenwick sulle lunghezze dei blocchi):
+# inserimento e rimozione costano O(log w) confronti piu' un memmove dentro un solo blocco, di
+# dimensione limitata; l'accesso per posizione costa O(log(w / WINDOW_BLOCK)) e finche' la finestra
+# sta in un blocco e' un indice di lista. Attorno a m gli scarti sono due sequenze gia' ordinate
+# (m - valori a sinistra, valori a destra - m), quindi la MAD e' il k-esimo elemento della loro
+# fusione: la suddivisione si cerca partendo da quella del campione precedente (ricerca
+# esponenziale, poi bisezione), O(log w) accessi nel caso peggiore e pochi quando la finestra
+# scorre su dati stazionari. Totale O(n log w log(w / WINDOW_BLOCK)) nel caso peggiore.
+
+DEFAULT_WINDOW_S = 60.0
+
+ROLLING_QUANTILES = (0.05, 0.95)
+
+# campioni minimi in finestra perche' la statistica sia definita
+MIN_PERIODS = 2
+
+ROLLING_STATS = ["mean", "std", "min", "max", "median", "mad", *(f"q{round(q * 100):02d}" for q in ROLLING_QUANTILES)]
+
+
+# blocchi della finestra ordinata: oltre 2 * WINDOW_BLOCK valori un blocco si divide a meta'
+WINDOW_BLOCK = 1024
+
+
+class _SortedWindow:
+    """Multinsieme ordinato di float con inserimento, rimozione e accesso per posizione."""
+
+    def __init__(self) -> None:
+        self._blocks: List[List[float]] = []
+        # ultimo (massimo) valore di ogni blocco, per trovare il blocco con bisect
+        self._maxes: List[float] = []
+        # albero di Fenwick (da 1) sulle lunghezze dei blocchi
+        self._tree: List[int] = [0]
+        self._top = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _reindex(self) -> None:
+        nb = len(self._blocks)
+        tree = [0] + [len(b) for b in self._blocks]
+        for i in range(1, nb + 1):
+            j = i + (i & -i)
+            if j <= nb:
+                tree[j] += tree[i]
+        self._tree = tree
+        self._top = 1 << (nb.bit_length() - 1) if nb else 0
+
+    def _resize(self, b: int, delta: int) -> None:
+        tree, nb = self._tree, len(self._blocks)
+        b += 1
+        while b <= nb:
+            tree[b] += delta
+            b += b & -b
+
+    def add(self, v: float) -> None:
+        self._len += 1
+        if not self._blocks:
+            self._blocks.append([v])
+            self._maxes.append(v)
+            self._reindex()
+            return
+        b = bisect_left(self._maxes, v)
+        if b == len(self._blocks):
+            b -= 1
+        block = self._blocks[b]
+        insort(block, v)
+        self._maxes[b] = block[-1]
+        if len(block) > 2 * WINDOW_BLOCK:
+            self._blocks[b:b + 1] = [block[:WINDOW_BLOCK], block[WINDOW_BLOCK:]]
+            self._maxes[b:b + 1] = [block[WINDOW_BLOCK - 1], block[-1]]
+            self._reindex()
+        else:
+            self._resize(b, 1)
+
+    def remove(self, v: float) -> None:
+        """Toglie un'occorrenza di v, che deve essere presente."""
+        self._len -= 1
+        # primo blocco con massimo >= v: i blocchi precedenti hanno solo valori < v
+        b = bisect_left(self._maxes, v)
+        block = self._blocks[b]
+        del block[bisect_left(block, v)]
+        if block:
+            self._maxes[b] = block[-1]
+            self._resize(b, -1)
+        else:
+            del self._blocks[b]
+            del self._maxes[b]
+            self._reindex()
+
+    def __getitem__(self, i: int) -> float:
+        blocks = self._blocks
+        if len(blocks) == 1:
+            return blocks[0][i]
+        tree, nb = self._tree, len(blocks)
+        pos, step = 0, self._top
+        while step:
+            nxt = pos + step
+            if nxt <= nb and tree[nxt] <= i:
+                pos = nxt
+                i -= tree[nxt]
+            step >>= 1
+        return blocks[pos][i]
+
+
+def _kth_deviations(window: _SortedWindow, m: float, k: int, guess: int) -> Tuple[float, float, int]:
+    """
+    k-esimo e (k+1)-esimo (da 0) scarto |v - m| piu' piccolo della finestra, con m tra i due valori
+    centrali; restituisce anche quanti dei primi k + 1 scarti vengono da sinistra di m, da passare
+    come `guess` al campione successivo.
+    """
+    n = len(window)
+    p = n // 2
+    na, nb = p, n - p
+
+    # a[i] = m - window[p - 1 - i], b[j] = window[p + j] - m: entrambe crescenti
+    def a(i: int) -> float:
+        return m - window[p - 1 - i]
+
+    def b(j: int) -> float:
+        return window[p + j] - m
+
+    # i scarti presi da a e k + 1 - i da b: il primo i con a[i] >= b[k - i], cercato a passi
+    # raddoppiati dal valore del campione precedente e poi per bisezione
+    lo, hi = max(0, k + 1 - nb), min(k + 1, na)
+    g = min(max(guess, lo), hi)
+    step = 1
+    if g < hi and a(g) < b(k - g):
+        lo = g + 1
+        while lo + step - 1 < hi:
+            i = lo + step - 1
+            if a(i) < b(k - i):
+                lo = i + 1
+                step *= 2
+            else:
+                hi = i
+                break
+    else:
+        hi = g
+        while hi - step >= lo:
+            i = hi - step
+            if a(i) < b(k - i):
+                lo = i + 1
+                break
+            hi = i
+            step *= 2
+    while lo < hi:
+        i = (lo + hi) // 2
+        if a(i) < b(k - i):
+            lo = i + 1
+        else:
+            hi = i
+    i = lo
+    kth = max(a(i - 1) if i > 0 else -np.inf, b(k - i) if k - i >= 0 else -np.inf)
+    # scarto successivo nella fusione
+    after = min(a(i) if i < na else np.inf, b(k + 1 - i) if k + 1 - i < nb else np.inf)
+    return kth, after, i
+
+
+def window_mad(t_s: np.ndarray, x: np.ndarray, window_s: float, min_periods: int = MIN_PERIODS) -> np.ndarray:
+    """MAD di ogni finestra causale (t - window_s, t]; NaN esclusi come nei kernel di pandas."""
+    t = np.asarray(t_s, dtype=float)
+    first = np.searchsorted(t, t - window_s, side="right").tolist()
+    # float Python: nel ciclo gli scalari NumPy costano piu' del bisect
+    values = np.asarray(x, dtype=float).tolist()
+    out = np.full(len(values), np.nan)
+    need = max(min_periods, 1)
+
+    window = _SortedWindow()
+    guess = 0
+    j = 0
+    for i, v in enumerate(values):
+        if v == v:
+            window.add(v)
+        while j < first[i]:
+            old = values[j]
+            if old == old:
+                window.remove(old)
+            j += 1
+        n = len(window)
+        if n < need:
+            continue
+        m = 0.5 * (window[(n - 1) // 2] + window[n // 2])
+        kth, after, guess = _kth_deviations(window, m, (n - 1) // 2, guess)
+        out[i] = kth if n % 2 else 0.5 * (kth + after)
+    return out
+
+
+def rolling_stats(
+    t_s: np.ndarray,
+    x: np.ndarray,
+    window_s: float = DEFAULT_WINDOW_S,
+    quantiles: Sequence[float] = ROLLING_QUANTILES,
+    min_periods: int = MIN_PERIODS,
+) -> pd.DataFrame:
+    """Una riga per campione (t crescente) con le statistiche della finestra che vi termina."""
+    x = pd.Series(
+        np.asarray(x, dtype=float),
+        index=pd.to_timedelta(np.asarray(t_s, dtype=float), unit="s"),
+    )
+    window = pd.Timedelta(seconds=window_s)
+    r = x.rolling(window, min_periods=min_periods)
+    median = r.median()
+    out = pd.DataFrame({
+        "mean": r.mean(),
+        "std": r.std(),
+        "min": r.min(),
+        "max": r.max(),
+        "median": median,
+        "mad": window_mad(t_s, x.to_numpy(), window_s, min_periods),
+    })
+    for q in quantiles:
+        out[f"q{round(q * 100):02d}"] = r.quantile(q)
+    return out.reset_index(drop=True)
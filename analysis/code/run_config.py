@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from outlier_filter import FilterParams
+
+
+# Impostazioni dei parser scelte da riga di comando (--raw-ref, --utc, --outlier-filter, cadenza
+# ptp4l), in un unico oggetto immutabile. I moduli le leggono con run_config(); i pool di
+# shm_frames passano l'oggetto del parent ai worker come initargs e install_run_config() lo
+# rimette in ogni worker: vale con qualunque metodo di avvio (fork, spawn, forkserver, default di
+# Linux da Python 3.14), senza contare sulla memoria ereditata dal parent.
+
+
+@dataclass(frozen=True)
+class RunConfig:
+    # --raw-ref (frame_schema)
+    raw_ref: bool = False
+    # --utc / --utc-anchor (time_base)
+    utc: bool = False
+    utc_anchor: str = "log_mtime"
+    # --outlier-filter / --outlier-params (outlier_filter); override per run: (scenario, run_id)
+    # e (scenario, "") per tutto lo scenario
+    outlier_filter: Optional[FilterParams] = None
+    outlier_overrides: Dict[Tuple[str, str], FilterParams] = field(default_factory=dict)
+    # --ptp-config-dir / --reindex-cadence (sample_gaps): intervallo atteso (s) per ruolo,
+    # letto dai config nel parent
+    cadence: Dict[str, float] = field(default_factory=dict)
+    reindex_cadence: bool = False
+
+
+_CURRENT = RunConfig()
+
+
+def run_config() -> RunConfig:
+    return _CURRENT
+
+
+def install_run_config(config: RunConfig) -> None:
+    """Sostituisce la configurazione del processo (initializer dei worker)."""
+    global _CURRENT
+    _CURRENT = config
+
+
+def update_run_config(**changes) -> RunConfig:
+    install_run_config(replace(_CURRENT, **changes))
+    return _CURRENT
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+
+# Catalogo delle serie per-run dei tre protocolli, rilette dai CSV parsed scritti dai driver
+# *_analysis_v3.py (una riga per campione, run concatenate con scenario e run_id). Lo usano le
+# analisi trasversali (confronto tra protocolli, stabilita', spettri) invece di riparsare i log.
+
+SCENARIOS = ["low", "medium", "high"]
+
+KEY = ["scenario", "run_id"]
+
+
+@dataclass(frozen=True)
+class SeriesSpec:
+    protocol: str
+    campaign: str
+    role: str  # sottocartella di _aggregated/ in cui il driver scrive le curve del ruolo
+    samples_file: str
+    events_file: Optional[str]
+    time_col: str
+    offset_col: str
+    offset_is_rms: bool
+    delay_col: Optional[str]
+    delay_one_way: float  # fattore per passare al ritardo a una via
+    lock: str  # "slave" | "selected" | "none"
+
+
+SERIES = [
+    SeriesSpec("ptp/boundary", "ptp", "boundary", "parsed_boundary_samples.csv", "parsed_boundary_events.csv",
+               "t", "offset_ns", False, "path_delay_ns", 1.0, "slave"),
+    SeriesSpec("ptp/client", "ptp", "client", "parsed_client_samples.csv", "parsed_client_events.csv",
+               "t", "rms_ns", True, "path_delay_ns", 1.0, "slave"),
+    SeriesSpec("ntpsec/boundary", "ntpsec", "boundary", "parsed_boundary_samples.csv", None,
+               "t_s", "offset_ns", False, "delay_ns", 0.5, "selected"),
+    SeriesSpec("ntpsec/client", "ntpsec", "client", "parsed_client_samples.csv", None,
+               "t_s", "offset_ns", False, "delay_ns", 0.5, "selected"),
+    SeriesSpec("chrony/servergm", "chrony_servergm", "tracking", "parsed_tracking.csv", None,
+               "t_s", "system_time_ns", False, None, 1.0, "none"),
+    SeriesSpec("chrony/clientchrony", "chrony_clientchrony", "tracking", "parsed_tracking.csv", None,
+               "t_s", "system_time_ns", False, None, 1.0, "none"),
+]
+
+
+def read_runs(campaign_root: Path, file_name: str, columns: List[str], inputs: List[Path]) -> pd.DataFrame:
+    """CSV per-run di tutti gli scenari, solo le colonne richieste; i file letti finiscono in `inputs`."""
+    frames = []
+    for scenario in SCENARIOS:
+        for csv_path in sorted((campaign_root / scenario).glob(f"run*/{file_name}")):
+            df = pd.read_csv(csv_path, usecols=lambda c: c in columns)
+            if df.empty:
+                continue
+            df["scenario"] = scenario
+            df["run_id"] = csv_path.parent.name
+            frames.append(df)
+            inputs.append(csv_path)
+    if not frames:
+        return pd.DataFrame(columns=[*columns, *KEY])
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_series(root: Path, spec: SeriesSpec, inputs: List[Path]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    campaign_root = root / spec.campaign
+    value_cols = [spec.offset_col, *([spec.delay_col] if spec.delay_col else [])]
+    # sample_idx del parser: le curve derivate si allineano a quelle <metric>_aggregated.csv del driver
+    sample_cols = [spec.time_col, "sample_idx", *value_cols, *(["selected"] if spec.lock == "selected" else [])]
+    samples = read_runs(campaign_root, spec.samples_file, sample_cols, inputs)
+    events = (
+        read_runs(campaign_root, spec.events_file, [spec.time_col, "type", "to"], inputs)
+        if spec.events_file else pd.DataFrame(columns=[spec.time_col, "type", "to", *KEY])
+    )
+    for col in value_cols:
+        samples[col] = pd.to_numeric(samples[col], errors="coerce").astype(float)
+    if spec.lock == "selected":
+        samples["selected"] = samples["selected"].astype(str).str.lower() == "true"
+    return samples, events
+
+
+def value_rows(spec: SeriesSpec, samples: pd.DataFrame) -> pd.DataFrame:
+    # ntpq: i valori del peer scelto contano solo se selezionato (prima sono .INIT. a zero)
+    return samples[samples["selected"]] if spec.lock == "selected" else samples
+
+
+def run_times(spec: SeriesSpec, samples: pd.DataFrame, events: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per run (indice scenario, run_id): t0 = primo evento o campione del log, t_lock = aggancio
+    (PTP: prima transizione a SLAVE, NTPsec: primo peer selezionato, chrony: t0). NaN se mai.
+    """
+    t = spec.time_col
+    times = pd.concat([samples[[*KEY, t]], events[[*KEY, t]]], ignore_index=True)
+    t0 = times.groupby(KEY, observed=True)[t].min().rename("t0")
+
+    if spec.lock == "slave":
+        lock_rows = events[(events["type"] == "state") & (events["to"] == "SLAVE")]
+        t_lock = lock_rows.groupby(KEY, observed=True)[t].min().rename("t_lock")
+    elif spec.lock == "selected":
+        t_lock = samples[samples["selected"]].groupby(KEY, observed=True)[t].min().rename("t_lock")
+    else:
+        t_lock = t0.rename("t_lock")
+    return pd.concat([t0, t_lock], axis=1)
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from run_config import run_config, update_run_config
+
+
+# Campioni mancanti rispetto alla cadenza attesa di ptp4l, letta dai file di configurazione
+# (configs/ptp). Intervalli in log2 secondi come in linuxptp:
+# - boundary: una riga `master offset` per Sync ricevuto, cadenza = 2^logSyncInterval del master
+#   a monte (server_ptp.conf)
+# - client: una riga `rms` ogni 2^summary_interval s (client_ptp.conf: summary_interval 1 -> 2 s)
+# Le chiavi assenti valgono i default di linuxptp. logAnnounceInterval non produce righe nel
+# log e non entra nel conteggio.
+# Gap = passo tra campioni consecutivi di almeno 1.5 intervalli; campioni mancanti del passo =
+# round(dt / intervallo) - 1. Sullo stesso conteggio si basa il reindex sulla cadenza attesa
+# (--reindex-cadence): ogni campione va nello slot precedente + round(dt / intervallo), gli slot
+# vuoti diventano righe a NaN (filled=True) col tempo nominale, quindi sample_idx conta i
+# messaggi attesi e non quelli arrivati. Slot relativi al campione precedente: la deriva del
+# clock tra le run non sposta i campioni di slot.
+
+DEFAULT_CONFIG_DIR = Path(__file__).resolve().parents[2] / "configs" / "ptp"
+
+# default di linuxptp (ptp4l(8)) per le chiavi che fissano la cadenza
+LINUXPTP_DEFAULTS = {"logSyncInterval": "0", "summary_interval": "0", "logAnnounceInterval": "1"}
+
+# ruolo -> (file di configurazione, chiave log2 dell'intervallo tra campioni)
+PTP_CADENCE = {
+    "boundary": ("server_ptp.conf", "logSyncInterval"),
+    "client": ("client_ptp.conf", "summary_interval"),
+}
+
+GAP_COLUMNS = ["sample_idx", "t_start", "t_end", "length_s", "missing"]
+
+FILLED_COLUMN = "filled"
+
+
+def read_ptp4l_config(path: Path) -> Dict[str, str]:
+    """Opzioni della sezione [global] di un file ptp4l (chiave valore), commenti esclusi."""
+    out: Dict[str, str] = {}
+    section = None
+    for line in path.read_text(encoding="utf-8", errors="replace").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1].strip()
+            continue
+        if section == "global":
+            key, _, value = line.partition(" ")
+            out[key] = value.strip()
+    return out
+
+
+def expected_intervals(config_dir: Path) -> Dict[str, float]:
+    """Intervallo atteso tra campioni (s) per ruolo; file mancanti -> default di linuxptp."""
+    out = {}
+    for role, (name, key) in PTP_CADENCE.items():
+        path = config_dir / name
+        config = {**LINUXPTP_DEFAULTS, **(read_ptp4l_config(path) if path.exists() else {})}
+        out[role] = float(2.0 ** int(config[key]))
+    return out
+
+
+def set_cadence(config_dir: Optional[Path], reindex: bool = False) -> None:
+    """Cadenza attesa dai config ptp4l (None: nessun controllo)."""
+    intervals = expected_intervals(config_dir) if config_dir is not None else {}
+    update_run_config(cadence=intervals, reindex_cadence=reindex and bool(intervals))
+
+
+def expected_interval(role: str) -> Optional[float]:
+    return run_config().cadence.get(role)
+
+
+def reindex_enabled() -> bool:
+    return run_config().reindex_cadence
+
+
+def add_cadence_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument(
+        "--ptp-config-dir",
+        type=Path,
+        default=DEFAULT_CONFIG_DIR,
+        help="Directory with the ptp4l configs (server_ptp.conf, client_ptp.conf) that set the "
+        f"expected sample cadence for the gap detector (default: {DEFAULT_CONFIG_DIR})",
+    )
+    ap.add_argument(
+        "--reindex-cadence",
+        action="store_true",
+        help="Reindex each run onto the expected cadence: missing messages become NaN rows "
+        "(filled=True), so sample_idx counts expected messages across runs",
+    )
+
+
+def configure_cadence(args: argparse.Namespace) -> None:
+    set_cadence(args.ptp_config_dir, args.reindex_cadence)
+
+
+# ----------------------------
+# Gaps
+# ----------------------------
+
+def _steps(t: np.ndarray, interval: float) -> np.ndarray:
+    """Slot attesi tra campioni consecutivi (almeno 1)."""
+    return np.maximum(np.rint(np.diff(t) / interval), 1).astype(np.int64)
+
+
+def find_gaps(t, interval: float) -> pd.DataFrame:
+    """Un gap per passo con campioni mancanti: indice e tempo del campione prima, durata, mancanti."""
+    t = np.asarray(t, dtype=float)
+    if len(t) < 2:
+        return pd.DataFrame(columns=GAP_COLUMNS)
+    missing = _steps(t, interval) - 1
+    idx = np.flatnonzero(missing > 0)
+    return pd.DataFrame({
+        "sample_idx": idx,
+        "t_start": t[idx],
+        "t_end": t[idx + 1],
+        "length_s": t[idx + 1] - t[idx],
+        "missing": missing[idx],
+    })
+
+
+def gap_summary(t, interval: Optional[float], gaps: pd.DataFrame) -> Dict[str, object]:
+    """Campioni mancanti, gap e frequenza effettiva contro quella attesa per una run."""
+    t = np.asarray(t, dtype=float)
+    out: Dict[str, object] = {
+        "expected_interval_s": interval,
+        "gap_count": None,
+        "missing_samples": None,
+        "max_gap_s": None,
+        "effective_rate_hz": None,
+        "expected_rate_hz": 1.0 / interval if interval else None,
+        "sample_completeness": None,
+    }
+    if interval is None or len(t) < 2:
+        return out
+    missing = int(gaps["missing"].sum()) if not gaps.empty else 0
+    out["gap_count"] = int(len(gaps))
+    out["missing_samples"] = missing
+    out["max_gap_s"] = float(gaps["length_s"].max()) if not gaps.empty else None
+    span = float(t[-1] - t[0])
+    out["effective_rate_hz"] = (len(t) - 1) / span if span > 0 else None
+    out["sample_completeness"] = len(t) / (len(t) + missing)
+    return out
+
+
+def reindex_to_cadence(samples: pd.DataFrame, interval: float, t_col: str = "t") -> pd.DataFrame:
+    """Campioni di una run (in ordine di tempo) su slot equispaziati; slot vuoti a NaN, filled=True."""
+    if len(samples) < 2:
+        return samples.assign(**{FILLED_COLUMN: False})
+    t = samples[t_col].to_numpy(dtype=float)
+    slot = np.r_[0, np.cumsum(_steps(t, interval))]
+    n = int(slot[-1]) + 1
+
+    out = samples.set_axis(slot).reindex(np.arange(n))
+    filled = np.ones(n, dtype=bool)
+    filled[slot] = False
+
+    # tempo nominale degli slot vuoti: ultimo campione presente + k intervalli
+    pos = np.arange(n)
+    last = np.maximum.accumulate(np.where(filled, 0, pos))
+    t_full = out[t_col].to_numpy(dtype=float, copy=True)
+    t_full[filled] = t_full[last[filled]] + (pos - last)[filled] * interval
+    out[t_col] = t_full
+
+    for col in ("scenario", "run_id", "role"):
+        if col in samples.columns:
+            out[col] = samples[col].iloc[0]
+    if "t_rel_s" in out.columns:
+        out["t_rel_s"] = t_full - t[0]
+    if "t_bin_s" in out.columns:
+        out["t_bin_s"] = out["t_rel_s"].round().astype(int)
+    if "sample_idx" in out.columns:
+        out["sample_idx"] = pos
+    out[FILLED_COLUMN] = filled
+    return out.reset_index(drop=True)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from cross_run import mean_ci
+
+
+# Run-length dello stato del servo di ptp4l (s0 unlocked, s1 clock step, s2 locked) sui campioni
+# `master offset` del boundary. Un tratto va dal primo campione nello stato al primo campione
+# dello stato successivo (l'ultimo tratto finisce all'ultimo campione): le durate sommano alla
+# durata della run. RLE vettoriale: inizi dove lo stato cambia, nessun ciclo sui campioni.
+# Uscita da s2 = tratto s2 seguito da un altro tratto; rientro = ogni tratto s2 dopo il primo,
+# con l'offset del suo primo campione (quanto e' lontano il clock quando il servo si riaggancia).
+
+SERVO_STATES = (0, 1, 2)
+
+LOCKED_SERVO = 2
+
+RUN_COLUMNS = ["servo_state", "t_start", "t_end", "duration_s", "n_samples", "first_idx"]
+
+# quantita' del summary per run aggregate tra le run (servo_summary)
+SERVO_QUANTITIES = [
+    "time_to_first_s2_s",
+    "s2_exit_count",
+    *(f"s{k}_{q}" for k in SERVO_STATES for q in ("time_frac", "run_count", "duration_mean_s", "duration_p50_s", "duration_max_s")),
+    "s2_reentry_offset_absmean_ns",
+    "s2_reentry_offset_maxabs_ns",
+]
+
+
+def _servo_samples(samples: pd.DataFrame) -> pd.DataFrame:
+    # righe senza stato (slot vuoti di --reindex-cadence) fuori dai tratti
+    if samples.empty or "servo_state" not in samples.columns:
+        return samples.iloc[0:0]
+    return samples[samples["servo_state"].notna()]
+
+
+def servo_runs(samples: pd.DataFrame, t_col: str = "t") -> pd.DataFrame:
+    """Tratti (servo_state, t_start, t_end, duration_s, n_samples, first_idx) in ordine di tempo."""
+    samples = _servo_samples(samples)
+    if samples.empty:
+        return pd.DataFrame(columns=RUN_COLUMNS)
+    state = samples["servo_state"].to_numpy(dtype=np.int64)
+    t = samples[t_col].to_numpy(dtype=float)
+
+    starts = np.flatnonzero(np.r_[True, state[1:] != state[:-1]])
+    t_start = t[starts]
+    t_end = np.r_[t[starts[1:]], t[-1]]
+    return pd.DataFrame({
+        "servo_state": state[starts],
+        "t_start": t_start,
+        "t_end": t_end,
+        "duration_s": t_end - t_start,
+        "n_samples": np.diff(np.r_[starts, len(state)]),
+        "first_idx": starts,
+    })
+
+
+def servo_summary(runs: pd.DataFrame, samples: pd.DataFrame, t_col: str = "t") -> Dict[str, object]:
+    """Tempo al primo s2, uscite da s2, durate per stato e offset ai rientri in s2 di una run."""
+    out: Dict[str, object] = dict.fromkeys(SERVO_QUANTITIES)
+    if runs.empty:
+        return out
+    samples = _servo_samples(samples)
+
+    state = runs["servo_state"].to_numpy()
+    duration = runs["duration_s"].to_numpy(dtype=float)
+    total = float(duration.sum())
+    locked = state == LOCKED_SERVO
+
+    if locked.any():
+        out["time_to_first_s2_s"] = float(runs["t_start"].iloc[int(np.argmax(locked))] - samples[t_col].min())
+    out["s2_exit_count"] = int(locked[:-1].sum())
+
+    for k in SERVO_STATES:
+        d = duration[state == k]
+        out[f"s{k}_time_frac"] = float(d.sum()) / total if total > 0 else None
+        out[f"s{k}_run_count"] = int(len(d))
+        if len(d):
+            out[f"s{k}_duration_mean_s"] = float(d.mean())
+            out[f"s{k}_duration_p50_s"] = float(np.median(d))
+            out[f"s{k}_duration_max_s"] = float(d.max())
+
+    reentry = runs["first_idx"].to_numpy()[locked][1:]
+    if len(reentry) and "offset_ns" in samples.columns:
+        offsets = np.abs(samples["offset_ns"].to_numpy(dtype=float, na_value=np.nan)[reentry])
+        out["s2_reentry_offset_absmean_ns"] = float(np.nanmean(offsets))
+        out["s2_reentry_offset_maxabs_ns"] = float(np.nanmax(offsets))
+    return out
+
+
+def aggregate_servo(summaries: pd.DataFrame) -> pd.DataFrame:
+    """Media tra le run con CI95 per (scenario, quantity) delle quantita' di servo_summary."""
+    cols = [c for c in SERVO_QUANTITIES if c in summaries.columns]
+    if summaries.empty or not cols:
+        return pd.DataFrame()
+    long = summaries.melt(id_vars=["scenario"], value_vars=cols, var_name="quantity")
+    out = mean_ci(long, ["scenario", "quantity"], "value")
+    out["_ord"] = out["quantity"].map({q: i for i, q in enumerate(SERVO_QUANTITIES)})
+    return out.sort_values(["scenario", "_ord"]).drop(columns=["_ord"]).reset_index(drop=True)
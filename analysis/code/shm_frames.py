@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import dataclasses
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from run_config import install_run_config, run_config
+
+
+# I worker scrivono le colonne numeriche in un blocco multiprocessing.shared_memory
+# e restituiscono solo un descrittore; il parent crea viste NumPy sul blocco senza copiarle.
+
+_ALIGN = 8
+
+# blocchi attaccati nel parent: devono restare vivi finche' esistono le viste
+_ATTACHED: List[shared_memory.SharedMemory] = []
+
+# array pandas con maschera NA separata (colonne nullable)
+_MASKED_ARRAYS = (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+
+
+# ----------------------------
+# Descriptors
+# ----------------------------
+
+@dataclass
+class ColumnSpec:
+    name: str
+    kind: str  # "array" | "masked" | "category" | "strings" | "const" | "pickle"
+    dtype: str = ""
+    offset: int = 0
+    nbytes: int = 0
+    value: object = None
+
+
+@dataclass
+class FrameDescriptor:
+    shm_name: Optional[str]
+    n_rows: int
+    columns: List[ColumnSpec]
+
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _is_all_str(values: np.ndarray) -> bool:
+    return all(v is None or isinstance(v, str) or (isinstance(v, float) and np.isnan(v)) for v in values)
+
+
+def _encode_strings(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, bytes]:
+    # stringhe -> (offsets int64 n+1, maschera null, blob utf-8)
+    null = np.array([not isinstance(v, str) for v in values], dtype=bool)
+    encoded = [b"" if is_null else v.encode("utf-8") for v, is_null in zip(values, null)]
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets, null, b"".join(encoded)
+
+
+# ----------------------------
+# Worker side
+# ----------------------------
+
+def export_frame(df: pd.DataFrame, drop_columns: Sequence[str] = ()) -> FrameDescriptor:
+    n = len(df)
+    specs: List[ColumnSpec] = []
+    payloads: List[Tuple[ColumnSpec, bytes]] = []
+
+    for col in df.columns:
+        if col in drop_columns:
+            continue
+        s = df[col]
+
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            # codici nel blocco condiviso, categorie nel descrittore
+            codes = np.ascontiguousarray(s.cat.codes.to_numpy())
+            spec = ColumnSpec(
+                name=col, kind="category", dtype=codes.dtype.str, nbytes=codes.nbytes,
+                value=s.cat.categories.tolist(),
+            )
+            specs.append(spec)
+            payloads.append((spec, codes.tobytes()))
+            continue
+
+        if s.dtype == object and not _is_all_str(s.to_numpy()):
+            # oggetti non stringa (es. array per riga degli eventi compattati): non hashabili
+            specs.append(ColumnSpec(name=col, kind="pickle", value=s.tolist()))
+            continue
+
+        if n > 0 and s.nunique(dropna=False) == 1 and not (
+            pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s)
+        ):
+            # etichette costanti per run (scenario, run_id, role): nessun buffer
+            specs.append(ColumnSpec(name=col, kind="const", value=s.iloc[0]))
+            continue
+
+        if isinstance(s.array, _MASKED_ARRAYS):
+            # Int64/Int32/boolean nullable: valori (NA -> 0) e maschera nel blocco, dtype pandas nel
+            # descrittore; con NA to_numpy() darebbe object e la colonna tornerebbe float/int64
+            numpy_dtype = s.dtype.numpy_dtype
+            arr = np.ascontiguousarray(s.to_numpy(dtype=numpy_dtype, na_value=numpy_dtype.type(0)))
+            mask = np.ascontiguousarray(s.isna().to_numpy())
+            spec = ColumnSpec(name=col, kind="masked", dtype=arr.dtype.str, nbytes=arr.nbytes, value=str(s.dtype))
+            specs.append(spec)
+            payloads.append((spec, arr.tobytes() + mask.tobytes()))
+            continue
+
+        if pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+            arr = np.ascontiguousarray(s.to_numpy())
+            if arr.dtype == object:
+                specs.append(ColumnSpec(name=col, kind="pickle", value=s.tolist()))
+                continue
+            spec = ColumnSpec(name=col, kind="array", dtype=arr.dtype.str, nbytes=arr.nbytes)
+            specs.append(spec)
+            payloads.append((spec, arr.tobytes()))
+            continue
+
+        values = s.to_numpy(dtype=object)
+        if s.dtype != object and not _is_all_str(values):
+            specs.append(ColumnSpec(name=col, kind="pickle", value=s.tolist()))
+            continue
+
+        offsets, null, blob = _encode_strings(values)
+        packed = offsets.tobytes() + null.tobytes()
+        spec = ColumnSpec(name=col, kind="strings", nbytes=len(blob), value=len(packed))
+        specs.append(spec)
+        payloads.append((spec, packed + blob))
+
+    total = sum(_aligned(len(p)) for _, p in payloads)
+    if total == 0:
+        return FrameDescriptor(shm_name=None, n_rows=n, columns=specs)
+
+    shm = shared_memory.SharedMemory(create=True, size=total)
+    # il parent fa unlink dopo l'attach: il tracker del worker non deve cancellare il blocco all'uscita
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+    pos = 0
+    for spec, payload in payloads:
+        spec.offset = pos
+        shm.buf[pos:pos + len(payload)] = payload
+        pos += _aligned(len(payload))
+
+    name = shm.name
+    shm.close()
+    return FrameDescriptor(shm_name=name, n_rows=n, columns=specs)
+
+
+# ----------------------------
+# Parent side
+# ----------------------------
+
+def import_frame(desc: FrameDescriptor) -> pd.DataFrame:
+    n = desc.n_rows
+    shm = None
+    if desc.shm_name is not None:
+        shm = shared_memory.SharedMemory(name=desc.shm_name)
+        shm.unlink()
+        _ATTACHED.append(shm)
+
+    data = {}
+    for spec in desc.columns:
+        if spec.kind == "const":
+            data[spec.name] = np.full(n, spec.value, dtype=object)
+        elif spec.kind == "pickle":
+            data[spec.name] = spec.value
+        elif spec.kind == "array":
+            dtype = np.dtype(spec.dtype)
+            # vista diretta sul blocco condiviso (nessun blocco per frame senza righe)
+            data[spec.name] = np.frombuffer(shm.buf, dtype=dtype, count=n, offset=spec.offset) if shm else np.empty(0, dtype)
+        elif spec.kind == "masked":
+            dtype = np.dtype(spec.dtype)
+            if shm:
+                values = np.frombuffer(shm.buf, dtype=dtype, count=n, offset=spec.offset)
+                mask = np.frombuffer(shm.buf, dtype=bool, count=n, offset=spec.offset + spec.nbytes)
+            else:
+                values, mask = np.empty(0, dtype), np.empty(0, dtype=bool)
+            # IntegerArray / FloatingArray / BooleanArray secondo il dtype pandas della colonna
+            data[spec.name] = pd.api.types.pandas_dtype(spec.value).construct_array_type()(values, mask)
+        elif spec.kind == "category":
+            dtype = np.dtype(spec.dtype)
+            codes = np.frombuffer(shm.buf, dtype=dtype, count=n, offset=spec.offset) if shm else np.empty(0, dtype)
+            data[spec.name] = pd.Categorical.from_codes(codes, categories=spec.value)
+        elif spec.kind == "strings":
+            offsets = np.frombuffer(shm.buf, dtype=np.int64, count=n + 1, offset=spec.offset)
+            null = np.frombuffer(shm.buf, dtype=bool, count=n, offset=spec.offset + (n + 1) * 8)
+            blob_start = spec.offset + spec.value
+            blob = bytes(shm.buf[blob_start:blob_start + spec.nbytes])
+            out = np.empty(n, dtype=object)
+            for i in range(n):
+                out[i] = None if null[i] else blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+            data[spec.name] = out
+        else:
+            raise ValueError(f"Unknown column kind: {spec.kind}")
+
+    if not data:
+        return pd.DataFrame(index=range(n)) if n else pd.DataFrame()
+    return pd.DataFrame(data, copy=False)
+
+
+def share_result(obj, drop_columns: Sequence[str] = ()):
+    if isinstance(obj, pd.DataFrame):
+        return export_frame(obj, drop_columns)
+    if isinstance(obj, tuple):
+        return tuple(share_result(o, drop_columns) for o in obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        changes = {
+            f.name: export_frame(getattr(obj, f.name), drop_columns)
+            for f in dataclasses.fields(obj)
+            if isinstance(getattr(obj, f.name), pd.DataFrame)
+        }
+        return dataclasses.replace(obj, **changes)
+    return obj
+
+
+def restore_result(obj):
+    if isinstance(obj, FrameDescriptor):
+        return import_frame(obj)
+    if isinstance(obj, tuple):
+        return tuple(restore_result(o) for o in obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        changes = {
+            f.name: import_frame(getattr(obj, f.name))
+            for f in dataclasses.fields(obj)
+            if isinstance(getattr(obj, f.name), FrameDescriptor)
+        }
+        return dataclasses.replace(obj, **changes)
+    return obj
+
+
+def release_unused() -> int:
+    """Chiude i blocchi le cui viste non sono piu' referenziate; ritorna quanti ne restano aperti."""
+    kept = []
+    for shm in _ATTACHED:
+        try:
+            shm.close()
+        except BufferError:
+            kept.append(shm)
+    _ATTACHED[:] = kept
+    return len(kept)
+
+
+def _pool(jobs: int) -> ProcessPoolExecutor:
+    # configurazione dei parser passata esplicitamente: i worker avviati con spawn/forkserver
+    # non ereditano lo stato del parent
+    return ProcessPoolExecutor(max_workers=jobs, initializer=install_run_config, initargs=(run_config(),))
+
+
+def _call_shared(fn: Callable, args: tuple, drop_columns: Sequence[str]):
+    return share_result(fn(*args), drop_columns)
+
+
+def map_shared(
+    fn: Callable,
+    tasks: List[tuple],
+    jobs: int,
+    drop_columns: Sequence[str] = ("raw",),
+) -> List:
+    """Esegue fn(*task) in un process pool; i DataFrame tornano via shared memory, nell'ordine dei task."""
+    if jobs <= 1:
+        return [fn(*task) for task in tasks]
+
+    with _pool(jobs) as ex:
+        futures = [ex.submit(_call_shared, fn, task, tuple(drop_columns)) for task in tasks]
+        return [restore_result(f.result()) for f in futures]
+
+
+def iter_shared(
+    fn: Callable,
+    tasks: List[tuple],
+    jobs: int,
+    drop_columns: Sequence[str] = ("raw",),
+) -> Iterator:
+    """
+    Come map_shared ma un risultato alla volta, nell'ordine dei task, con al piu' 2*jobs task
+    in volo: se il chiamante scarta i risultati gia' consumati la memoria resta limitata.
+    """
+    if jobs <= 1:
+        for task in tasks:
+            yield fn(*task)
+        return
+
+    with _pool(jobs) as ex:
+        pending = deque()
+        remaining = iter(tasks)
+        for task in remaining:
+            pending.append(ex.submit(_call_shared, fn, task, tuple(drop_columns)))
+            if len(pending) >= 2 * jobs:
+                break
+        while pending:
+            result = restore_result(pending.popleft().result())
+            task = next(remaining, None)
+            if task is not None:
+                pending.append(ex.submit(_call_shared, fn, task, tuple(drop_columns)))
+            yield result
+            del result
+            release_unused()
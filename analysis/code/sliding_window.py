@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+# Minimo/massimo su finestre scorrevoli di w campioni in O(n) indipendente da w (van Herk /
+# Gil-Werman): il vettore viene diviso in blocchi di w, con massimi cumulati in avanti e
+# all'indietro dentro ogni blocco; ogni finestra copre la coda di un blocco e la testa del
+# successivo. Stesso costo del deque monotono, ma tutto in NumPy e su piu' run concatenate:
+# le finestre a cavallo di due run si scartano con segment_windows().
+
+
+def _sliding_reduce(a: np.ndarray, w: int, op: np.ufunc, fill: float) -> np.ndarray:
+    a = np.asarray(a, dtype=float)
+    n = len(a)
+    if w < 1:
+        raise ValueError("window must be >= 1")
+    if n < w:
+        return np.empty(0)
+    if w == 1:
+        return a.copy()
+
+    n_blocks = -(-n // w)
+    padded = np.full(n_blocks * w, fill)
+    padded[:n] = a
+    blocks = padded.reshape(n_blocks, w)
+    forward = op.accumulate(blocks, axis=1).ravel()
+    backward = op.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+
+    # finestra [i, i+w): coda del blocco di i (backward[i]) + testa del blocco di i+w-1
+    return op(backward[: n - w + 1], forward[w - 1: n])
+
+
+def sliding_max(a: np.ndarray, w: int) -> np.ndarray:
+    """out[i] = max(a[i:i+w]) per i in [0, n-w]; NaN si propaga alla finestra."""
+    return _sliding_reduce(a, w, np.maximum, -np.inf)
+
+
+def sliding_min(a: np.ndarray, w: int) -> np.ndarray:
+    """out[i] = min(a[i:i+w]) per i in [0, n-w]; NaN si propaga alla finestra."""
+    return _sliding_reduce(a, w, np.minimum, np.inf)
+
+
+def segment_windows(segments: np.ndarray, w: int) -> np.ndarray:
+    """
+    Maschera delle finestre [i, i+w) interamente dentro un segmento, per array concatenati
+    con `segments` (codice della run) contiguo e ordinato.
+    """
+    segments = np.asarray(segments)
+    if len(segments) < w:
+        return np.zeros(0, dtype=bool)
+    return segments[: len(segments) - w + 1] == segments[w - 1:]
+
+
+def sliding_argmin(a: np.ndarray, w: int) -> np.ndarray:
+    """
+    out[i] = indice (in `a`) del minimo di a[i:i+w], il primo a parita'; stesso schema a
+    blocchi di sliding_min, con gli indici dei minimi cumulati. `a` senza NaN.
+    """
+    a = np.asarray(a, dtype=float)
+    n = len(a)
+    if w < 1:
+        raise ValueError("window must be >= 1")
+    if n < w:
+        return np.empty(0, dtype=np.int64)
+    if w == 1:
+        return np.arange(n, dtype=np.int64)
+
+    n_blocks = -(-n // w)
+    padded = np.full(n_blocks * w, np.inf)
+    padded[:n] = a
+    blocks = padded.reshape(n_blocks, w)
+    col = np.arange(w)
+    start = (np.arange(n_blocks) * w)[:, None]
+
+    # avanti: nuovo minimo solo se strettamente minore (a parita' resta il primo)
+    forward = np.minimum.accumulate(blocks, axis=1)
+    new_fwd = np.ones_like(blocks, dtype=bool)
+    new_fwd[:, 1:] = blocks[:, 1:] < forward[:, :-1]
+    fwd_arg = (start + np.maximum.accumulate(np.where(new_fwd, col, 0), axis=1)).ravel()
+
+    # all'indietro: a parita' vince l'indice piu' basso, cioe' l'ultimo visto
+    rev = blocks[:, ::-1]
+    backward = np.minimum.accumulate(rev, axis=1)
+    new_bwd = np.ones_like(rev, dtype=bool)
+    new_bwd[:, 1:] = rev[:, 1:] <= backward[:, :-1]
+    bwd_arg = (start + (w - 1 - np.maximum.accumulate(np.where(new_bwd, col, 0), axis=1))[:, ::-1]).ravel()
+    backward = backward[:, ::-1].ravel()
+    forward = forward.ravel()
+
+    b = bwd_arg[: n - w + 1]
+    f = fwd_arg[w - 1: n]
+    return np.where(backward[: n - w + 1] <= forward[w - 1: n], b, f)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Densita' spettrale di potenza (Welch) di piu' run in un'unica chiamata FFT:
+# - ogni run viene ricampionata per interpolazione lineare su una griglia uniforme di passo dt
+#   (ptp4l salta o ritarda righe attorno ai cambi di stato); le run sono concatenate con
+#   tempi traslati, cosi' un solo np.interp copre tutte le run senza interpolare tra due run
+# - segmenti di nperseg campioni con sovrapposizione del 50%, media tolta, finestra di Hann
+#   periodica; i segmenti di tutte le run formano una matrice (segmenti x nperseg) e passano
+#   da un solo np.fft.rfft
+# - il periodogramma di ogni run e' la media dei suoi segmenti (one-sided, unita'^2/Hz)
+
+DEFAULT_NPERSEG = 64
+
+
+def resample_uniform(
+    t: np.ndarray, x: np.ndarray, runs: np.ndarray, dt: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (valori, codice run) sulla griglia t_start + k*dt di ogni run; `runs` contiguo, t crescente
+    dentro ogni run. Le run con un solo campione restano di un punto.
+    """
+    t = np.asarray(t, dtype=float)
+    x = np.asarray(x, dtype=float)
+    runs = np.asarray(runs, dtype=np.int64)
+    if len(t) == 0:
+        return np.empty(0), np.empty(0, dtype=np.int64)
+
+    n_runs = int(runs.max()) + 1
+    starts = np.full(n_runs, np.inf)
+    ends = np.full(n_runs, -np.inf)
+    np.minimum.at(starts, runs, t)
+    np.maximum.at(ends, runs, t)
+    present = np.isfinite(starts)
+    span = np.where(present, ends - starts, 0.0)
+    n_grid = np.where(present, np.floor(span / dt + 1e-9).astype(np.int64) + 1, 0)
+
+    # ogni run occupa [base, base + span] su un asse comune, con un passo vuoto tra una e l'altra
+    base = np.concatenate([[0.0], np.cumsum(span + 2 * dt)[:-1]])
+    t_shift = t - starts[runs] + base[runs]
+
+    grid_runs = np.repeat(np.arange(n_runs), n_grid)
+    first = np.concatenate([[0], np.cumsum(n_grid)[:-1]])
+    k = np.arange(len(grid_runs)) - first[grid_runs]
+    grid_t = base[grid_runs] + k * dt
+    return np.interp(grid_t, t_shift, x), grid_runs
+
+
+def batched_welch(
+    y: np.ndarray, runs: np.ndarray, fs: float, nperseg: int = DEFAULT_NPERSEG
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (frequenze, psd per run [R x F], segmenti per run). Run piu' corte di nperseg: riga NaN.
+    """
+    y = np.asarray(y, dtype=float)
+    runs = np.asarray(runs, dtype=np.int64)
+    freqs = np.fft.rfftfreq(nperseg, d=1.0 / fs)
+    n_runs = int(runs.max()) + 1 if len(runs) else 0
+    if len(y) < nperseg:
+        return freqs, np.full((n_runs, len(freqs)), np.nan), np.zeros(n_runs, dtype=np.int64)
+
+    step = max(1, nperseg // 2)
+    i = np.arange(len(y) - nperseg + 1)
+    run_start = np.searchsorted(runs, np.arange(n_runs))
+    inside = runs[i] == runs[i + nperseg - 1]
+    aligned = (i - run_start[runs[i]]) % step == 0
+    starts = i[inside & aligned]
+
+    segs = y[starts[:, None] + np.arange(nperseg)]
+    segs = segs - segs.mean(axis=1, keepdims=True)
+    window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(nperseg) / nperseg)
+    spec = np.abs(np.fft.rfft(segs * window, axis=1)) ** 2 / (fs * np.sum(window ** 2))
+    # one-sided: raddoppio tranne DC e (per nperseg pari) Nyquist
+    spec[:, 1: len(freqs) - (1 if nperseg % 2 == 0 else 0)] *= 2
+
+    seg_runs = runs[starts]
+    counts = np.bincount(seg_runs, minlength=n_runs)
+    acc = np.zeros((n_runs, len(freqs)))
+    np.add.at(acc, seg_runs, spec)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        psd = acc / counts[:, None]
+    psd[counts == 0] = np.nan
+    return freqs, psd, counts
+
+
+def psd_long(freqs: np.ndarray, psd: np.ndarray, keys: pd.DataFrame) -> pd.DataFrame:
+    """Matrice run x frequenza -> frame long (chiavi della run, freq_hz, psd)."""
+    n_runs, n_freqs = psd.shape
+    out = keys.iloc[np.repeat(np.arange(n_runs), n_freqs)].reset_index(drop=True)
+    out["freq_hz"] = np.tile(freqs, n_runs)
+    out["psd"] = psd.ravel()
+    return out.dropna(subset=["psd"])
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from sliding_window import segment_windows, sliding_max, sliding_min
+
+
+# Stabilita' nel tempo di una serie di errore di fase x (offset in ns) campionata ogni tau0:
+# - ADEV sovrapposta: sigma_y^2(tau) = sum (x[i+2m] - 2x[i+m] + x[i])^2 / (2 tau^2 (N-2m))
+# - MDEV: le m seconde differenze consecutive si sommano con le somme cumulate di x,
+#   S_j = C[j+3m] - 3C[j+2m] + 3C[j+m] - C[j], mod sigma_y^2 = sum S_j^2 / (2 m^2 tau^2 (N-3m+1))
+# - TDEV = tau / sqrt(3) * MDEV (in ns)
+# - MTIE: massimo su tutte le finestre di m+1 campioni di (max - min), min/max scorrevoli O(n)
+# con tau = m * tau0. Ogni termine e' O(N) per valore di m, senza cicli sulle finestre; le run di
+# uno scenario sono concatenate e i termini a cavallo di due run vengono scartati, poi sommati
+# per run con bincount. ADEV/MDEV sono adimensionali (x in ns, tau in s -> ns/s * 1e-9).
+
+STATS = ["adev", "mdev", "tdev", "mtie"]
+
+# valori di m per decade nella griglia log di tau
+TAU_POINTS_PER_DECADE = 10
+
+NS_PER_S = 1e9
+
+
+def tau_grid(n_max: int, points_per_decade: int = TAU_POINTS_PER_DECADE) -> np.ndarray:
+    """m = 1 .. n_max // 3 (limite della MDEV), spaziati in log e senza ripetizioni."""
+    m_max = n_max // 3
+    if m_max < 1:
+        return np.zeros(0, dtype=np.int64)
+    n_points = max(1, int(np.ceil(np.log10(m_max) * points_per_decade)) + 1)
+    return np.unique(np.round(np.logspace(0, np.log10(m_max), n_points)).astype(np.int64))
+
+
+def batched_stability(
+    x: np.ndarray,
+    runs: np.ndarray,
+    tau0: float,
+    ms: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """
+    ADEV, MDEV, TDEV, MTIE per ogni run e ogni m. `x` e' la concatenazione delle serie, `runs`
+    il codice 0..R-1 della run per campione (blocchi contigui). Righe (run, m, tau_s, stat...).
+    """
+    x = np.asarray(x, dtype=float)
+    runs = np.asarray(runs, dtype=np.int64)
+    n = len(x)
+    if n == 0:
+        return pd.DataFrame(columns=["run", "m", "tau_s", *STATS])
+
+    n_runs = int(runs.max()) + 1
+    if ms is None:
+        ms = tau_grid(int(np.bincount(runs).max()))
+    csum = np.concatenate([[0.0], np.cumsum(x)])
+
+    def per_run(valid: np.ndarray, terms: np.ndarray, idx: np.ndarray):
+        sums = np.bincount(runs[idx][valid], weights=terms[valid], minlength=n_runs)
+        counts = np.bincount(runs[idx][valid], minlength=n_runs)
+        return sums, counts
+
+    rows = []
+    for m in ms:
+        m = int(m)
+        tau = m * tau0
+
+        i = np.arange(max(0, n - 2 * m))
+        d2 = x[i + 2 * m] - 2.0 * x[i + m] + x[i]
+        adev_sum, adev_n = per_run(segment_windows(runs, 2 * m + 1), d2 ** 2, i)
+
+        j = np.arange(max(0, n - 3 * m + 1))
+        s = csum[j + 3 * m] - 3.0 * csum[j + 2 * m] + 3.0 * csum[j + m] - csum[j]
+        mdev_sum, mdev_n = per_run(segment_windows(runs, 3 * m), s ** 2, j)
+
+        k = np.arange(max(0, n - m))
+        tie = sliding_max(x, m + 1) - sliding_min(x, m + 1)
+        valid = segment_windows(runs, m + 1)
+        mtie = np.full(n_runs, -np.inf)
+        np.maximum.at(mtie, runs[k][valid], tie[valid])
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            adev = np.sqrt(adev_sum / (2.0 * tau ** 2 * adev_n)) / NS_PER_S
+            mvar = mdev_sum / (2.0 * m ** 2 * tau ** 2 * mdev_n)
+            mdev = np.sqrt(mvar) / NS_PER_S
+            tdev = tau / np.sqrt(3.0) * np.sqrt(mvar)
+
+        rows.append(pd.DataFrame({
+            "run": np.arange(n_runs),
+            "m": m,
+            "tau_s": round(tau, 6),
+            "adev": np.where(adev_n > 0, adev, np.nan),
+            "mdev": np.where(mdev_n > 0, mdev, np.nan),
+            "tdev": np.where(mdev_n > 0, tdev, np.nan),
+            "mtie": np.where(np.isfinite(mtie), mtie, np.nan),
+        }))
+    return pd.concat(rows, ignore_index=True)
+
+
+def sampling_interval(t: pd.Series, runs: pd.Series) -> float:
+    """tau0 nominale: mediana degli intervalli tra campioni consecutivi della stessa run."""
+    dt = t.groupby(runs, sort=False, observed=True).diff().dropna()
+    dt = dt[dt > 0]
+    # risoluzione dei timestamp di ptp4l (ms): tau = m * tau0 resta leggibile nei CSV
+    return round(float(dt.median()), 3) if not dt.empty else float("nan")
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Aggregazione per sample_idx senza tenere in memoria le run: ogni run aggiorna contatori
+# (n, media e M2 di Welford, min, max) e un reservoir di al piu' SKETCH_SIZE valori per indice
+# da cui si leggono i quantili. Fino a SKETCH_SIZE run per indice il reservoir contiene tutti
+# i valori e i quantili sono esatti; oltre, sono quelli di un campione uniforme delle run.
+
+SKETCH_SIZE = 64
+QUANTILES = (0.10, 0.25, 0.50, 0.75, 0.90)
+
+
+class MetricAccumulator:
+    def __init__(self, sketch_size: int = SKETCH_SIZE, rng: Optional[np.random.Generator] = None) -> None:
+        self.sketch_size = sketch_size
+        self.rng = rng if rng is not None else np.random.default_rng(0)
+        self.n = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+        self.reservoir = np.zeros((0, sketch_size))
+
+    def _grow(self, size: int) -> None:
+        old = len(self.n)
+        if size <= old:
+            return
+        size = max(size, 2 * old)
+        pad = size - old
+        self.n = np.concatenate([self.n, np.zeros(pad, dtype=np.int64)])
+        self.mean = np.concatenate([self.mean, np.zeros(pad)])
+        self.m2 = np.concatenate([self.m2, np.zeros(pad)])
+        self.min = np.concatenate([self.min, np.full(pad, np.inf)])
+        self.max = np.concatenate([self.max, np.full(pad, -np.inf)])
+        self.reservoir = np.vstack([self.reservoir, np.full((pad, self.sketch_size), np.nan)])
+
+    def add(self, sample_idx: np.ndarray, values: np.ndarray) -> None:
+        idx = np.asarray(sample_idx, dtype=np.int64)
+        vals = np.asarray(values, dtype=float)
+        keep = ~np.isnan(vals)
+        idx, vals = idx[keep], vals[keep]
+        if len(idx) == 0:
+            return
+        if idx.min() < 0:
+            raise ValueError("sample_idx must be non-negative")
+        self._grow(int(idx.max()) + 1)
+
+        # ogni indice deve comparire una volta per aggiornamento: i duplicati vanno in passate successive
+        while len(idx):
+            _, first = np.unique(idx, return_index=True)
+            self._update(idx[first], vals[first])
+            rest = np.ones(len(idx), dtype=bool)
+            rest[first] = False
+            idx, vals = idx[rest], vals[rest]
+
+    def _update(self, idx: np.ndarray, x: np.ndarray) -> None:
+        n = self.n[idx] + 1
+        delta = x - self.mean[idx]
+        mean = self.mean[idx] + delta / n
+        self.m2[idx] += delta * (x - mean)
+        self.mean[idx] = mean
+        self.n[idx] = n
+        self.min[idx] = np.minimum(self.min[idx], x)
+        self.max[idx] = np.maximum(self.max[idx], x)
+
+        # reservoir sampling (algoritmo R) vettorizzato sugli indici
+        k = self.sketch_size
+        fill = n <= k
+        self.reservoir[idx[fill], n[fill] - 1] = x[fill]
+        if not fill.all():
+            over = ~fill
+            slot = (self.rng.random(int(over.sum())) * n[over]).astype(np.int64)
+            hit = slot < k
+            self.reservoir[idx[over][hit], slot[hit]] = x[over][hit]
+
+    def approximate_count(self) -> int:
+        return int((self.n > self.sketch_size).sum())
+
+    def result(self, t_critical: Callable[[int], float]) -> pd.DataFrame:
+        """Stesse colonne di aggregate_metric() dei driver."""
+        idx = np.nonzero(self.n > 0)[0]
+        if len(idx) == 0:
+            return pd.DataFrame()
+
+        n = self.n[idx]
+        mean = self.mean[idx]
+        std = np.where(n > 1, np.sqrt(self.m2[idx] / np.maximum(n - 1, 1)), 0.0)
+        tcrit = np.array([t_critical(int(v)) for v in n])
+        ci_half = np.where(n > 1, tcrit * std / np.sqrt(n), 0.0)
+        q = np.nanquantile(self.reservoir[idx], QUANTILES, axis=1)
+
+        return pd.DataFrame({
+            "sample_idx": idx,
+            "n_runs": n.astype(float),
+            "mean": mean,
+            "std": std,
+            "ci95_low": mean - ci_half,
+            "ci95_high": mean + ci_half,
+            "q10": q[0],
+            "q25": q[1],
+            "q50": q[2],
+            "q75": q[3],
+            "q90": q[4],
+            "min": self.min[idx],
+            "max": self.max[idx],
+        })
+
+
+class StreamingAggregator:
+    """Accumulatori per chiave (es. (role, scenario, metric)); le run vengono lette una volta e scartate."""
+
+    def __init__(self, t_critical: Callable[[int], float], sketch_size: int = SKETCH_SIZE, seed: int = 0) -> None:
+        self.t_critical = t_critical
+        self.sketch_size = sketch_size
+        self._rng = np.random.default_rng(seed)
+        self._acc: Dict[Hashable, MetricAccumulator] = {}
+
+    def add_frame(self, key: Hashable, df: pd.DataFrame, metric: str) -> None:
+        if df.empty or metric not in df.columns:
+            return
+        values = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        acc = self._acc.get(key)
+        if acc is None:
+            acc = self._acc[key] = MetricAccumulator(self.sketch_size, self._rng)
+        acc.add(df["sample_idx"].to_numpy(), values)
+
+    def keys(self) -> List[Hashable]:
+        return list(self._acc)
+
+    def result(self, key: Hashable) -> pd.DataFrame:
+        acc = self._acc.get(key)
+        return acc.result(self.t_critical) if acc is not None else pd.DataFrame()
+
+    def approximate_keys(self) -> List[Hashable]:
+        return [k for k, acc in self._acc.items() if acc.approximate_count()]
+
+    def nbytes(self) -> int:
+        return sum(
+            a.n.nbytes + a.mean.nbytes + a.m2.nbytes + a.min.nbytes + a.max.nbytes + a.reservoir.nbytes
+            for a in self._acc.values()
+        )
+
+    def note(self) -> Optional[str]:
+        return sketch_note(self)
+
+    def close(self) -> None:
+        pass
+
+
+def sketch_note(aggregator: StreamingAggregator) -> Optional[str]:
+    approx = aggregator.approximate_keys()
+    if not approx:
+        return None
+    return (
+        f"quantili approssimati (reservoir di {aggregator.sketch_size} run) per {len(approx)} curve, "
+        f"es. {approx[0]}; media, std, CI, min e max restano esatti"
+    )
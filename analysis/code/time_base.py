@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import argparse
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from run_config import run_config, update_run_config
+
+
+# Base dei tempi comune: ogni sorgente viene riportata su UTC assoluto (colonna t_utc_ns, ns
+# interi dall'epoch) con una relazione affine a pendenza 1, t_utc = origine + t_sorgente.
+# - chrony: stamp ISO di `SAMPLE @` scritti dall'host -> gia' UTC, esatto
+# - ptp4l: `ptp4l[5196.246]` e' il CLOCK_MONOTONIC del kernel (condiviso dai container di una
+#   run); l'ultimo stamp del log viene allineato al mtime del log, cioe' all'ultima scrittura
+# - ntpq: `--- HH:MM:SS ---` (date +%T nel container, rollover gia' sommato in t_s) non ha la
+#   data: l'ancora fissa la mezzanotte locale, arrotondata al quarto d'ora (fuso qualsiasi)
+# Ancora alternativa: mtime di netem_state.txt = applicazione di netem, con i ritardi di avvio
+# fissati da scripts/netem/bootstrapT3_V2.sh. Gli mtime valgono solo sui log originali (una
+# copia senza `cp -p` li sposta): l'ancora usata e' riportata in TimeBase.anchor.
+
+UTC_COLUMN = "t_utc_ns"
+
+ANCHORS = ("log_mtime", "netem")
+
+NETEM_STATE_FILE = "netem_state.txt"
+
+# secondi tra la scrittura di netem_state.txt e la prima riga del log (sleep dello script)
+NETEM_START_DELAY_S = {
+    ("ptp", "server"): 1.0,
+    ("ptp", "boundary"): 4.0,
+    ("ptp", "client"): 7.0,
+    ("ntpsec", "boundary"): 15.0,
+    ("ntpsec", "client"): 15.0,
+}
+
+# griglia dei fusi orari: la mezzanotte locale in UTC cade su un multiplo di 15 minuti
+TZ_GRID_S = 900
+
+# byte finali del log ptp4l letti per trovare l'ultimo stamp
+PTP_TAIL_BYTES = 8192
+
+RE_PTP4L_STAMP = re.compile(rb"ptp4l\[(?P<t>\d+\.\d+)\]")
+
+NS = 1_000_000_000
+
+
+def set_time_base(enabled: bool, anchor: str = "log_mtime") -> None:
+    """Con --utc i parser aggiungono t_utc_ns ai frame."""
+    if anchor not in ANCHORS:
+        raise ValueError(f"unknown time anchor: {anchor}")
+    update_run_config(utc=enabled, utc_anchor=anchor)
+
+
+def time_base_enabled() -> bool:
+    return run_config().utc
+
+
+def add_time_base_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument(
+        "--utc",
+        action="store_true",
+        help="Add an absolute UTC timestamp column (t_utc_ns, integer ns since the epoch) to parsed "
+        "frames and per-run CSVs, so series of different protocols can be joined on time",
+    )
+    ap.add_argument(
+        "--utc-anchor",
+        choices=ANCHORS,
+        default="log_mtime",
+        help="Anchor for clocks without a date: the log file mtime (last line written) or the "
+        "netem_state.txt mtime plus the bootstrap script start delays (default: log_mtime)",
+    )
+
+
+# ----------------------------
+# Anchors
+# ----------------------------
+
+@dataclass(frozen=True)
+class TimeBase:
+    origin_ns: int  # UTC (ns dall'epoch) dello zero del clock della sorgente
+    anchor: str  # "iso" | "log_mtime" | "netem"
+
+
+# chrony: t_s sono gia' i secondi dall'epoch degli stamp ISO
+ISO_TIME_BASE = TimeBase(origin_ns=0, anchor="iso")
+
+@dataclass(frozen=True)
+class RunAnchors:
+    run_dir: Path
+    netem_applied_ns: Optional[int]
+
+    def log_mtime_ns(self, path: Path) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+
+def run_anchors(run_dir: Path) -> RunAnchors:
+    try:
+        netem_ns: Optional[int] = os.stat(Path(run_dir) / NETEM_STATE_FILE).st_mtime_ns
+    except OSError:
+        netem_ns = None
+    return RunAnchors(run_dir=Path(run_dir), netem_applied_ns=netem_ns)
+
+
+def seconds_to_ns(values) -> np.ndarray:
+    return np.round(np.asarray(values, dtype=float) * NS).astype(np.int64)
+
+
+def _ptp4l_stamps(path: Path) -> Tuple[Optional[float], Optional[float]]:
+    """Primo e ultimo stamp ptp4l[...] del log, leggendo solo l'inizio e la coda del file."""
+    try:
+        with open(path, "rb") as fh:
+            head = fh.read(PTP_TAIL_BYTES)
+            size = fh.seek(0, os.SEEK_END)
+            fh.seek(max(0, size - PTP_TAIL_BYTES))
+            tail = fh.read()
+    except OSError:
+        return None, None
+    first = RE_PTP4L_STAMP.search(head)
+    last = None
+    for last in RE_PTP4L_STAMP.finditer(tail):
+        pass
+    return (
+        float(first.group("t")) if first else None,
+        float(last.group("t")) if last else None,
+    )
+
+
+def ptp_time_base(log_path: Path, role: str, anchor: str = "log_mtime") -> Optional[TimeBase]:
+    anchors = run_anchors(Path(log_path).parent)
+    first, last = _ptp4l_stamps(log_path)
+    if first is None or last is None:
+        return None
+
+    mtime_ns = anchors.log_mtime_ns(log_path)
+    if anchor == "log_mtime" and mtime_ns is not None:
+        origin = mtime_ns - int(round(last * NS))
+        # un mtime precedente all'applicazione di netem e' di una copia: meglio l'altra ancora
+        if anchors.netem_applied_ns is None or origin + int(round(first * NS)) >= anchors.netem_applied_ns:
+            return TimeBase(origin_ns=origin, anchor="log_mtime")
+
+    if anchors.netem_applied_ns is None:
+        return None
+    start_ns = anchors.netem_applied_ns + int(NETEM_START_DELAY_S.get(("ptp", role), 0.0) * NS)
+    return TimeBase(origin_ns=start_ns - int(round(first * NS)), anchor="netem")
+
+
+def ntpq_time_base(
+    log_path: Path, role: str, t_first_s: float, t_last_s: float, anchor: str = "log_mtime"
+) -> Optional[TimeBase]:
+    """t_s di ntpq = secondi dalla mezzanotte locale del primo giorno (+86400 per rollover)."""
+    anchors = run_anchors(Path(log_path).parent)
+    mtime_ns = anchors.log_mtime_ns(log_path)
+
+    if anchor == "log_mtime" and mtime_ns is not None:
+        ref_ns, ref_t, used = mtime_ns, t_last_s, "log_mtime"
+    elif anchors.netem_applied_ns is not None:
+        delay = NETEM_START_DELAY_S.get(("ntpsec", role), 0.0)
+        ref_ns, ref_t, used = anchors.netem_applied_ns + int(delay * NS), t_first_s, "netem"
+    else:
+        return None
+
+    grid = TZ_GRID_S * NS
+    midnight = ref_ns - int(round(ref_t * NS))
+    return TimeBase(origin_ns=(midnight + grid // 2) // grid * grid, anchor=used)
+
+
+# ----------------------------
+# Columns
+# ----------------------------
+
+def attach_utc(df: pd.DataFrame, base: Optional[TimeBase], t_col: str) -> pd.DataFrame:
+    """Aggiunge t_utc_ns = origine + t_col; senza base (ancore mancanti) il frame resta invariato."""
+    if df.empty or base is None or t_col not in df.columns:
+        return df
+    out = df.copy()
+    out[UTC_COLUMN] = base.origin_ns + seconds_to_ns(out[t_col])
+    return out
+
+
+def utc_datetime(df: pd.DataFrame) -> pd.Series:
+    """t_utc_ns -> datetime64[ns, UTC], per grafici e per leggere i join."""
+    return pd.to_datetime(df[UTC_COLUMN], unit="ns", utc=True)
+
+
+def with_utc(
+    kind: str,
+    role: str,
+    source_file: Path,
+    samples: pd.DataFrame,
+    events: Optional[pd.DataFrame] = None,
+    anchor: Optional[str] = None,
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """Frame di una run (qualsiasi protocollo) con la colonna t_utc_ns."""
+    anchor = anchor or run_config().utc_anchor
+    if kind == "chrony":
+        return attach_utc(samples, ISO_TIME_BASE, "t_s"), events
+
+    t_col = "t" if kind == "ptp" else "t_s"
+    frames = [f for f in (samples, events) if f is not None and not f.empty and t_col in f.columns]
+    if not frames:
+        return samples, events
+
+    if kind == "ptp":
+        base = ptp_time_base(source_file, role, anchor)
+    elif kind == "ntpsec":
+        t_first = min(float(f[t_col].min()) for f in frames)
+        t_last = max(float(f[t_col].max()) for f in frames)
+        base = ntpq_time_base(source_file, role, t_first, t_last, anchor)
+    else:
+        raise ValueError(f"Unknown kind: {kind}")
+
+    return (
+        attach_utc(samples, base, t_col),
+        attach_utc(events, base, t_col) if events is not None else None,
+    )
+
+
+# ----------------------------
+# As-of joins
+# ----------------------------
+
+def _sorted_on_time(df: pd.DataFrame, by: Sequence[str] = ()) -> pd.DataFrame:
+    if UTC_COLUMN not in df.columns:
+        raise ValueError(f"frame without {UTC_COLUMN}: parse with --utc or call with_utc()")
+    out = df[df[UTC_COLUMN].notna()]
+    # category con categorie diverse tra i due lati non sono confrontabili nel `by`
+    out = out.astype({UTC_COLUMN: np.int64, **{c: str for c in by}})
+    return out.sort_values(UTC_COLUMN, kind="mergesort")
+
+
+def align_asof(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    tolerance_s: float,
+    by: Optional[Sequence[str]] = None,
+    direction: str = "nearest",
+    suffixes: Tuple[str, str] = ("", "_right"),
+) -> pd.DataFrame:
+    """
+    Per ogni riga di `left`, la riga di `right` piu' vicina nel tempo entro la tolleranza
+    (merge_asof su t_utc_ns, vettoriale); `by` limita il join, es. a ["scenario", "run_id"].
+    """
+    return pd.merge_asof(
+        _sorted_on_time(left, by or ()),
+        _sorted_on_time(right, by or ()),
+        on=UTC_COLUMN,
+        by=list(by) if by else None,
+        tolerance=int(round(tolerance_s * NS)),
+        direction=direction,
+        suffixes=suffixes,
+        allow_exact_matches=True,
+    )
+
+
+def align_sources(
+    frames: Mapping[str, pd.DataFrame],
+    columns: Mapping[str, Sequence[str]],
+    tolerance_s: float,
+    by: Optional[Sequence[str]] = None,
+    direction: str = "nearest",
+) -> pd.DataFrame:
+    """
+    Serie di piu' sorgenti sulla timeline della prima: una colonna `<sorgente>_<colonna>` per
+    ogni colonna richiesta, NaN dove la sorgente non ha campioni entro la tolleranza.
+    """
+    labels = list(frames)
+    if not labels:
+        return pd.DataFrame()
+    keys = [UTC_COLUMN, *(by or [])]
+
+    def pick(label: str) -> pd.DataFrame:
+        cols = [c for c in columns.get(label, []) if c in frames[label].columns]
+        sub = frames[label][[*keys, *cols]]
+        return sub.rename(columns={c: f"{label}_{c}" for c in cols})
+
+    out = _sorted_on_time(pick(labels[0]), by or ())
+    for label in labels[1:]:
+        out = align_asof(out, pick(label), tolerance_s, by=by, direction=direction)
+    return out.reset_index(drop=True)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import re
+from typing import Iterable, Tuple
+
+import pandas as pd
+
+
+# Rappresentazione canonica: offset, delay, jitter e stddev di tutti i protocolli sono interi
+# in nanosecondi (colonne <grandezza>_ns), letti dal testo del log senza passare da float.
+# ptp4l scrive gia' ns interi, ntpq ms con 3-4 decimali e chrony s/us/ns al piu' al ns, quindi
+# la conversione e' esatta; cifre sotto il ns (non prodotte dalle versioni usate) vengono
+# arrotondate al ns pari. Le unita' di presentazione (_us, _ms) si ricavano solo in uscita:
+# curve aggregate, summary, grafici e script di statistica.
+
+UNIT_NS = {"ns": 1, "us": 1_000, "ms": 1_000_000, "s": 1_000_000_000}
+
+# colonne di aggregate_metric() espresse nell'unita' della metrica (n_runs e sample_idx no)
+AGGREGATE_VALUE_COLUMNS = ("mean", "std", "ci95_low", "ci95_high", "q10", "q25", "q50", "q75", "q90", "min", "max")
+
+RE_DECIMAL = re.compile(r"(?P<sign>[+-]?)(?P<int>\d*)(?:\.(?P<frac>\d*))?")
+RE_METRIC_UNIT = re.compile(r"^(?P<quantity>.+)_(?P<unit>ns|us|ms|s)$")
+
+
+def parse_ns(text: str, unit: str) -> int:
+    """'-0.000034129' s -> -34129, '39' us -> 39000, '2.4297' ms -> 2429700 (aritmetica intera)."""
+    m = RE_DECIMAL.fullmatch(text.strip())
+    if not m or not (m.group("int") or m.group("frac")):
+        raise ValueError(f"Cannot parse decimal: {text!r}")
+    scale = UNIT_NS[unit]
+    digits = len(str(scale)) - 1
+    frac = m.group("frac") or ""
+
+    whole = int(m.group("int") or 0) * scale + int((frac[:digits] or "0").ljust(digits, "0"))
+    rest = frac[digits:].rstrip("0")
+    if rest:
+        # sotto il ns: half-even sulla prima cifra scartata e sul resto
+        first, tail = int(rest[0]), rest[1:]
+        if first > 5 or (first == 5 and tail) or (first == 5 and not tail and whole % 2 == 1):
+            whole += 1
+    return -whole if m.group("sign") == "-" else whole
+
+
+def storage_column(metric: str) -> Tuple[str, str]:
+    """'offset_ms' -> ('offset_ns', 'ms'): colonna canonica e unita' di presentazione."""
+    m = RE_METRIC_UNIT.match(metric)
+    if not m:
+        raise ValueError(f"Metric without a time unit suffix: {metric}")
+    return f"{m.group('quantity')}_ns", m.group("unit")
+
+
+def as_float(value) -> float:
+    """Scalare (anche pd.NA delle colonne Int nullable) -> float, NA -> nan."""
+    return float("nan") if pd.isna(value) else float(value)
+
+
+def ns_to(values, unit: str):
+    """ns -> unita' di presentazione; scalari, Series o array. In ns il valore resta invariato."""
+    if unit == "ns":
+        return values
+    if values is None:
+        return None
+    return values / UNIT_NS[unit]
+
+
+# ----------------------------
+# Presentation
+# ----------------------------
+
+def present_aggregate(df: pd.DataFrame, unit: str) -> pd.DataFrame:
+    """Curva aggregata calcolata sui ns -> stesse colonne nell'unita' della metrica."""
+    if df.empty or unit == "ns":
+        return df
+    out = df.copy()
+    for col in AGGREGATE_VALUE_COLUMNS:
+        if col in out.columns:
+            out[col] = pd.to_numeric(out[col], errors="coerce").astype(float) / UNIT_NS[unit]
+    return out
+
+
+def present_columns(df: pd.DataFrame, metrics: Iterable[str]) -> pd.DataFrame:
+    """Aggiunge le colonne di presentazione (es. offset_us) dalle colonne canoniche in ns."""
+    out = df
+    for metric in metrics:
+        column, unit = storage_column(metric)
+        if metric in out.columns or column not in out.columns:
+            continue
+        if out is df:
+            out = df.copy()
+        out[metric] = ns_to(pd.to_numeric(out[column], errors="coerce").astype(float), unit)
+    return out
+
+
+def canonical_ns(df: pd.DataFrame) -> pd.DataFrame:
+    """Colonne *_ns diventate float per i campi mancanti (None) -> Int64 nullable, senza NaN float."""
+    out = df
+    for col in df.columns:
+        if not col.endswith("_ns") or not pd.api.types.is_float_dtype(df[col]):
+            continue
+        vals = df[col].dropna()
+        if not (vals == vals.round()).all():
+            continue
+        if out is df:
+            out = df.copy()
+        out[col] = out[col].astype("Int64")
+    return out
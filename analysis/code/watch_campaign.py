@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+import chrony_analysis_v3 as chrony_v3
+import ntpsec_analysis_v3 as ntpsec_v3
+import ptp_analysis_v3 as ptp_v3
+from analysis_cache import (
+    KIND_LAYOUT,
+    SCENARIOS,
+    CachedRun,
+    CampaignCache,
+    campaign_kind,
+    list_run_dirs,
+)
+from async_io import write_csv
+from atomic_output import campaign_outputs, output_inputs
+from event_runs import write_run_events
+from frame_schema import disk_frame
+from sample_gaps import add_cadence_args, configure_cadence
+from servo_states import aggregate_servo, servo_runs
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "code_statistics"))
+
+import chrony_stats_aggregated  # noqa: E402
+import ntpsec_stats_aggregated  # noqa: E402
+import ptp_stats_aggregated  # noqa: E402
+
+
+# secondi senza crescita dei log prima di considerare chiusa una run:
+# ptp4l scrive ogni secondo, ntpq ogni 15 s, chronyc ogni 60 s (bootstrapT3_V2.sh)
+DEFAULT_SETTLE_S = {
+    "ptp": 20.0,
+    "ntpsec": 45.0,
+    "chrony": 90.0,
+}
+
+RE_CHRONY_SAMPLE_HDR = re.compile(r"SAMPLE\s+(?P<i>\d+)/(?P<n>\d+)\s+@")
+
+
+# ----------------------------
+# Run completion detection
+# ----------------------------
+
+@dataclass
+class RunState:
+    signature: Tuple
+    stable_since: float
+    done: bool = False
+
+
+def _logs_signature(run_dir: Path, log_names: List[str]) -> Optional[Tuple]:
+    # basta un log presente: nelle campagne reali alcuni ruoli possono mancare
+    sig = []
+    for name in log_names:
+        path = run_dir / name
+        if path.exists():
+            st = path.stat()
+            sig.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(sig) if sig else None
+
+
+def _chrony_series_complete(run_dir: Path) -> bool:
+    # l'ultimo header "SAMPLE i/N" con i == N indica che il ciclo di raccolta e' finito
+    path = run_dir / "chrony_tracking_series.txt"
+    last = None
+    for m in RE_CHRONY_SAMPLE_HDR.finditer(path.read_text(encoding="utf-8", errors="replace")):
+        last = m
+    return last is not None and last.group("i") == last.group("n")
+
+
+class CampaignWatcher:
+    def __init__(self, root: Path, campaigns: List[str], settle_s: Optional[float]) -> None:
+        self.root = root
+        self.campaigns = campaigns
+        self.settle_s = settle_s
+        self.states: Dict[Path, RunState] = {}
+
+    def _settle_for(self, kind: str) -> float:
+        return self.settle_s if self.settle_s is not None else DEFAULT_SETTLE_S[kind]
+
+    def poll(self, now: float) -> List[Tuple[str, str, Path]]:
+        """Restituisce le run appena completate come (campaign, scenario, run_dir)."""
+        completed = []
+
+        for campaign in self.campaigns:
+            kind = campaign_kind(campaign)
+            log_names = [log for log, _ in KIND_LAYOUT[kind].values()]
+            campaign_root = self.root / campaign
+
+            for scenario in SCENARIOS:
+                run_dirs = list_run_dirs(campaign_root, scenario)
+                for i, run_dir in enumerate(run_dirs):
+                    state = self.states.get(run_dir)
+                    if state is not None and state.done:
+                        continue
+
+                    sig = _logs_signature(run_dir, log_names)
+                    if sig is None:
+                        continue
+
+                    if state is None or state.signature != sig:
+                        self.states[run_dir] = RunState(signature=sig, stable_since=now)
+                        state = self.states[run_dir]
+
+                    # una run successiva gia' avviata implica che questa sia chiusa (kathara lclean)
+                    newer_exists = i + 1 < len(run_dirs)
+                    settled = now - state.stable_since >= self._settle_for(kind)
+                    if kind == "chrony" and not newer_exists:
+                        settled = settled or (
+                            _chrony_series_complete(run_dir) and now - state.stable_since >= 5.0
+                        )
+
+                    if newer_exists or settled:
+                        state.done = True
+                        completed.append((campaign, scenario, run_dir))
+
+        return completed
+
+
+# ----------------------------
+# Per-run outputs (come i driver v3)
+# ----------------------------
+
+def _as_parsed_run(module, run: CachedRun):
+    # i campi solo PTP passano come nel driver, cosi' i summary coincidono
+    extra = {"states": run.states, "gaps": run.gaps} if module is ptp_v3 else {}
+    return module.ParsedRun(
+        role=run.role,
+        scenario=run.scenario,
+        run_id=run.run_id,
+        source_file=run.source_file,
+        samples=run.samples,
+        events=run.events,
+        **extra,
+    )
+
+
+def write_run_outputs(kind: str, run: CachedRun, run_dir: Path) -> Optional[pd.DataFrame]:
+    if kind == "chrony":
+        fname = KIND_LAYOUT[kind][run.role][1]
+        if not run.samples.empty:
+            write_csv(disk_frame(run.samples), run_dir / fname, inputs=[run.source_file])
+        if run.role == "tracking":
+            return chrony_v3.summarize_tracking_run(run.samples, run.scenario, run.run_id, run_dir)
+        return chrony_v3.summarize_sourcestats_run(run.samples, run.scenario, run.run_id, run_dir)
+
+    if not run.samples.empty:
+        write_csv(disk_frame(run.samples), run_dir / f"parsed_{run.role}_samples.csv", inputs=[run.source_file])
+    if not run.events.empty:
+        t_col = "t" if kind == "ptp" else "t_s"
+        write_run_events(run.events, run_dir / f"parsed_{run.role}_events.csv", t_col, inputs=[run.source_file])
+
+    if kind == "ptp":
+        if not run.states.empty:
+            write_csv(disk_frame(run.states), run_dir / f"parsed_{run.role}_states.csv", inputs=[run.source_file])
+        if not run.gaps.empty:
+            write_csv(disk_frame(run.gaps), run_dir / f"parsed_{run.role}_gaps.csv", inputs=[run.source_file])
+        if run.role == "boundary" and not run.samples.empty:
+            write_csv(servo_runs(run.samples), run_dir / f"parsed_{run.role}_servo_runs.csv", inputs=[run.source_file])
+        parsed = _as_parsed_run(ptp_v3, run)
+        return ptp_v3.summarize_boundary(parsed) if run.role == "boundary" else ptp_v3.summarize_client(parsed)
+    return ntpsec_v3.summarize_run(_as_parsed_run(ntpsec_v3, run))
+
+
+def _summary_path(kind: str, agg_root: Path, role: str) -> Path:
+    if kind == "ptp":
+        return agg_root / role / f"{role}_summary_all_runs.csv"
+    if kind == "ntpsec":
+        return agg_root / "summary_all_runs.csv"
+    return agg_root / f"{role}_summary_all_runs.csv"
+
+
+# ----------------------------
+# Incremental refresh
+# ----------------------------
+
+class IncrementalAnalysis:
+    def __init__(self, root: Path, max_mb: float) -> None:
+        self.root = root
+        self.cache = CampaignCache(root, max_bytes=int(max_mb * 1024 * 1024))
+        # (campaign, role, scenario, run_id) -> riga di summary
+        self.summaries: Dict[Tuple[str, str, str, str], pd.DataFrame] = {}
+
+    def ingest_run(self, campaign: str, scenario: str, run_dir: Path) -> None:
+        kind = campaign_kind(campaign)
+        for role, (log_name, _) in KIND_LAYOUT[kind].items():
+            path = run_dir / log_name
+            if not path.exists():
+                continue
+            run = self.cache.get_run(campaign, role, scenario, run_dir.name, path)
+            summary = write_run_outputs(kind, run, run_dir)
+            if summary is not None:
+                self.summaries[(campaign, role, scenario, run_dir.name)] = summary
+
+    def _scenario_logs(self, campaign: str, scenario: str) -> List[Path]:
+        kind = campaign_kind(campaign)
+        return [
+            run_dir / log_name
+            for run_dir in list_run_dirs(self.root / campaign, scenario)
+            for log_name, _ in KIND_LAYOUT[kind].values()
+            if (run_dir / log_name).exists()
+        ]
+
+    def _campaign_logs(self, campaign: str) -> List[Path]:
+        return [p for scenario in SCENARIOS for p in self._scenario_logs(campaign, scenario)]
+
+    def _write_summaries(self, campaign: str) -> None:
+        kind = campaign_kind(campaign)
+        agg_root = self.root / campaign / "_aggregated"
+        roles = list(KIND_LAYOUT[kind])
+        # solo le righe di questa campagna: i ruoli delle altre non sono nel layout di `kind`
+        own = [(key, df) for key, df in self.summaries.items() if key[0] == campaign]
+        by_path: Dict[Path, List[pd.DataFrame]] = {}
+        for (_, role, scenario, run_id), df in sorted(
+            own, key=lambda kv: (SCENARIOS.index(kv[0][2]), kv[0][3], roles.index(kv[0][1])),
+        ):
+            by_path.setdefault(_summary_path(kind, agg_root, role), []).append(df)
+
+        for path, frames in by_path.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_csv(pd.concat(frames, ignore_index=True), path, inputs=self._campaign_logs(campaign))
+
+    def _metric_tables(
+        self, campaign: str, role: str, metrics: Dict, sources: List[Optional[str]]
+    ) -> Dict[Tuple[str, str, Optional[str]], pd.DataFrame]:
+        out = {}
+        for scenario in SCENARIOS:
+            for metric in metrics:
+                for source in sources:
+                    out[(scenario, metric, source)] = self.cache.get_aggregate(
+                        campaign, role, metric, scenario, source=source
+                    )
+        return out
+
+    def refresh_scenario(self, campaign: str, scenario: str) -> None:
+        with output_inputs(self._scenario_logs(campaign, scenario)):
+            self._refresh_scenario(campaign, scenario)
+
+    def _refresh_scenario(self, campaign: str, scenario: str) -> None:
+        kind = campaign_kind(campaign)
+        campaign_root = self.root / campaign
+        agg_root = campaign_root / "_aggregated"
+
+        self._write_summaries(campaign)
+
+        if kind == "chrony":
+            self._refresh_chrony(campaign, scenario, agg_root)
+            chrony_stats_aggregated.write_scenario_stats(
+                campaign_root, scenario, chrony_stats_aggregated.ensure_stats_dirs(campaign_root)[scenario]
+            )
+            return
+
+        if kind == "ptp":
+            role_metrics = {"boundary": ptp_v3.BOUNDARY_METRICS, "client": ptp_v3.CLIENT_METRICS}
+            module = ptp_v3
+        else:
+            role_metrics = {"client": ntpsec_v3.METRIC_SPECS, "boundary": ntpsec_v3.METRIC_SPECS}
+            module = ntpsec_v3
+
+        for role, metrics in role_metrics.items():
+            # le curve degli altri scenari restano in cache: servono solo per la ylim globale
+            tables = self._metric_tables(campaign, role, metrics, [None])
+            out_dir = agg_root / role / scenario
+            out_dir.mkdir(parents=True, exist_ok=True)
+
+            for metric, (ylabel, sym) in metrics.items():
+                df = tables[(scenario, metric, None)]
+                if df.empty:
+                    continue
+                all_tbls = [tables[(s, metric, None)] for s in SCENARIOS if not tables[(s, metric, None)].empty]
+
+                write_csv(df, out_dir / f"{metric}_aggregated.csv")
+                module.plot_mean_ci(
+                    df=df,
+                    scenario=scenario,
+                    role=role,
+                    metric=metric,
+                    ylabel=ylabel,
+                    outpath=out_dir / f"{metric}_mean_ci95.png",
+                    ylim=module._compute_global_ylim(all_tbls, "ci95_low", "ci95_high", symmetric=sym),
+                )
+                module.plot_mean_iqr_p10p90(
+                    df=df,
+                    scenario=scenario,
+                    role=role,
+                    metric=metric,
+                    ylabel=ylabel,
+                    outpath=out_dir / f"{metric}_mean_iqr_p10_p90.png",
+                    ylim=module._compute_global_ylim(all_tbls, "q10", "q90", symmetric=sym),
+                )
+
+        if kind == "ptp":
+            self._write_servo(campaign, scenario, agg_root)
+            ptp_stats_aggregated.write_scenario_stats(campaign_root, scenario)
+        else:
+            ntpsec_stats_aggregated.write_scenario_stats(
+                campaign_root, scenario, ntpsec_stats_aggregated.ensure_stats_dirs(campaign_root)[scenario]
+            )
+
+    def _write_servo(self, campaign: str, scenario: str, agg_root: Path) -> None:
+        # run-length del servo del boundary: media tra le run + CI95, come nel driver
+        frames = [
+            df for (c, role, sc, _), df in self.summaries.items()
+            if c == campaign and role == "boundary" and sc == scenario
+        ]
+        servo = aggregate_servo(pd.concat(frames, ignore_index=True)) if frames else pd.DataFrame()
+        if servo.empty:
+            return
+        out_dir = agg_root / "boundary" / scenario
+        out_dir.mkdir(parents=True, exist_ok=True)
+        write_csv(servo.drop(columns=["scenario"]), out_dir / "servo_states_aggregated.csv")
+
+    def _refresh_chrony(self, campaign: str, scenario: str, agg_root: Path) -> None:
+        tables = self._metric_tables(campaign, "tracking", chrony_v3.TRACKING_METRICS, [None])
+        out_dir = agg_root / "tracking" / scenario
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        for metric, (ylabel, sym) in chrony_v3.TRACKING_METRICS.items():
+            df = tables[(scenario, metric, None)]
+            if df.empty:
+                continue
+            all_tbls = [tables[(s, metric, None)] for s in SCENARIOS if not tables[(s, metric, None)].empty]
+            write_csv(df, out_dir / f"{metric}_aggregated.csv")
+            chrony_v3.plot_mean_ci(
+                df=df,
+                title=f"tracking - {scenario} - {metric} - mean + 95% CI",
+                ylabel=ylabel,
+                outpath=out_dir / f"{metric}_mean_ci95.png",
+                ylim=chrony_v3._compute_global_ylim(all_tbls, "ci95_low", "ci95_high", symmetric=sym),
+            )
+            chrony_v3.plot_mean_iqr_p10p90(
+                df=df,
+                title=f"tracking - {scenario} - {metric} - mean + IQR + p10/p90",
+                ylabel=ylabel,
+                outpath=out_dir / f"{metric}_mean_iqr_p10_p90.png",
+                ylim=chrony_v3._compute_global_ylim(all_tbls, "q10", "q90", symmetric=sym),
+            )
+
+        sources: Set[str] = set()
+        for scenario_ in SCENARIOS:
+            for run in self.cache.get_runs(campaign, "sourcestats", scenario_):
+                if not run.samples.empty and "source" in run.samples.columns:
+                    sources.update(run.samples["source"].dropna().unique().tolist())
+
+        tables = self._metric_tables(campaign, "sourcestats", chrony_v3.SOURCESTATS_METRICS, sorted(sources))
+        for metric, (ylabel, sym) in chrony_v3.SOURCESTATS_METRICS.items():
+            for source in sorted(sources):
+                df = tables[(scenario, metric, source)]
+                if df.empty:
+                    continue
+                all_tbls = [tables[(s, metric, source)] for s in SCENARIOS if not tables[(s, metric, source)].empty]
+
+                safe_source = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(source))
+                source_dir = agg_root / "sourcestats" / scenario / safe_source
+                source_dir.mkdir(parents=True, exist_ok=True)
+
+                write_csv(df, source_dir / f"{metric}_aggregated.csv")
+                chrony_v3.plot_mean_ci(
+                    df=df,
+                    title=f"sourcestats - {scenario} - {safe_source} - {metric} - mean + 95% CI",
+                    ylabel=ylabel,
+                    outpath=source_dir / f"{metric}_mean_ci95.png",
+                    ylim=chrony_v3._compute_global_ylim(all_tbls, "ci95_low", "ci95_high", symmetric=sym),
+                )
+                chrony_v3.plot_mean_iqr_p10p90(
+                    df=df,
+                    title=f"sourcestats - {scenario} - {safe_source} - {metric} - mean + IQR + p10/p90",
+                    ylabel=ylabel,
+                    outpath=source_dir / f"{metric}_mean_iqr_p10_p90.png",
+                    ylim=chrony_v3._compute_global_ylim(all_tbls, "q10", "q90", symmetric=sym),
+                )
+
+
+# ----------------------------
+# Main
+# ----------------------------
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Watch a multi-run campaign and re-analyse runs as they complete.")
+    ap.add_argument(
+        "--root",
+        type=Path,
+        required=True,
+        help="Campaign root written by bootstrapT3_V2.sh, e.g. .../analysis/raw_logs/T3_multiplerun",
+    )
+    ap.add_argument(
+        "--campaigns",
+        nargs="+",
+        default=["ptp", "ntpsec", "chrony_servergm", "chrony_clientchrony"],
+        help="Campaign subdirectories to watch",
+    )
+    ap.add_argument("--interval", type=float, default=2.0, help="Polling interval in seconds")
+    ap.add_argument(
+        "--settle",
+        type=float,
+        default=None,
+        help="Seconds without log growth before a run counts as complete (default: per protocol)",
+    )
+    ap.add_argument("--max-mb", type=float, default=1024.0, help="Memory budget of the parsed-run cache in MB")
+    ap.add_argument("--once", action="store_true", help="Process the runs that are complete now and exit")
+    add_cadence_args(ap)
+    args = ap.parse_args()
+    configure_cadence(args)
+
+    root = args.root.resolve()
+    if not root.is_dir():
+        raise FileNotFoundError(f"Root directory not found: {root}")
+
+    watcher = CampaignWatcher(root, args.campaigns, 0.0 if args.once else args.settle)
+    analysis = IncrementalAnalysis(root, args.max_mb)
+
+    print(f"[OK] Watch su {root} ({', '.join(args.campaigns)})")
+    try:
+        while True:
+            t0 = time.perf_counter()
+            completed = watcher.poll(time.time())
+
+            by_campaign: Dict[str, List[Tuple[str, Path]]] = {}
+            for campaign, scenario, run_dir in completed:
+                by_campaign.setdefault(campaign, []).append((scenario, run_dir))
+
+            # lock solo durante l'aggiornamento: tra un poll e l'altro i driver possono girare
+            for campaign, items in by_campaign.items():
+                with campaign_outputs(root / campaign, producer="watch_campaign"):
+                    affected: List[str] = []
+                    for scenario, run_dir in items:
+                        analysis.ingest_run(campaign, scenario, run_dir)
+                        if scenario not in affected:
+                            affected.append(scenario)
+
+                    for scenario in affected:
+                        analysis.refresh_scenario(campaign, scenario)
+
+            if completed:
+                names = ", ".join(f"{c}/{s}/{d.name}" for c, s, d in completed)
+                print(f"[OK] {len(completed)} run analizzate in {time.perf_counter() - t0:.1f}s: {names}")
+
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()